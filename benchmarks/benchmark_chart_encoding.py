@@ -0,0 +1,103 @@
+"""
+This python module benchmarks the serialization of a chart series (the response of /api/chart_data) in the 'json'
+format, one formatted date string and one float per point, compared to the 'columnar' format of
+infrastructure/columnar_encoding.py. It reports the serialization time, the size of the payload and its gzip
+compressed size (as sent by website/response_cache.py), and checks that the columnar payload decodes to the same
+series.
+
+Usage:
+    python benchmarks/benchmark_chart_encoding.py --points 10000 100000
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config.config
+from infrastructure.columnar_encoding import encode_series, decode_array, decode_timestamps
+
+
+def encode_json(timestamps: np.ndarray, prices: np.ndarray) -> str:
+    """
+    Serializes a series like the 'json' format of /api/chart_data.
+
+    Parameters:
+    - timestamps (np.ndarray): The timestamps of the bars.
+    - prices (np.ndarray): The close prices of the bars.
+
+    Returns:
+    - str: The payload.
+    """
+    return json.dumps({'symbol': 'BTCUSD', 'dates': pd.DatetimeIndex(timestamps).strftime('%d.%m.%Y %H:%M:%S').tolist(), 'price_data': prices.tolist()})
+
+
+def encode_columnar(timestamps: np.ndarray, prices: np.ndarray) -> str:
+    """
+    Serializes a series like the 'columnar' format of /api/chart_data.
+
+    Parameters:
+    - timestamps (np.ndarray): The timestamps of the bars.
+    - prices (np.ndarray): The close prices of the bars.
+
+    Returns:
+    - str: The payload.
+    """
+    return json.dumps({'symbol': 'BTCUSD', **encode_series(timestamps, {'price_data': prices})})
+
+
+def time_function(function, repetitions: int) -> float:
+    """
+    Returns the median runtime of a function in milliseconds.
+
+    Parameters:
+    - function (callable): The function which is timed.
+    - repetitions (int): How often the function is executed.
+
+    Returns:
+    - float: The median runtime in milliseconds.
+    """
+    timings = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return float(np.median(timings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the json vs. the columnar encoding of chart series.')
+    parser.add_argument('--points', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--gzip-level', type=int, default=5)
+    parser.add_argument('--gaps', action='store_true', help='Remove random bars, so the timestamps are not evenly spaced')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f'{"points":>8} {"format":>9} {"encode [ms]":>12} {"gzip [ms]":>10} {"size [kB]":>10} {"gzip size [kB]":>15}')
+    for number_of_points in args.points:
+        timestamps = np.datetime64('2024-01-01T00:00:00', 'ns') + np.arange(number_of_points) * np.timedelta64(60, 's')
+        prices = np.round(30_000 + np.cumsum(rng.normal(scale=5.0, size=number_of_points)), 2)
+        if args.gaps:
+            kept = rng.random(number_of_points) > 0.01
+            timestamps, prices = timestamps[kept], prices[kept]
+
+        decoded = json.loads(encode_columnar(timestamps, prices))
+        if not (np.array_equal(decode_timestamps(decoded['time']), timestamps.astype('datetime64[s]'))
+                and np.array_equal(decode_array(decoded['columns']['price_data']), prices)):
+            raise AssertionError('The columnar payload does not decode to the encoded series')
+
+        for name, encode in (('json', encode_json), ('columnar', encode_columnar)):
+            payload = encode(timestamps, prices).encode()
+            compressed = gzip.compress(payload, compresslevel=args.gzip_level)
+            encode_time = time_function(lambda: encode(timestamps, prices), args.repetitions)
+            gzip_time = time_function(lambda: gzip.compress(payload, compresslevel=args.gzip_level), args.repetitions)
+            print(f'{len(prices):>8} {name:>9} {encode_time:>12.2f} {gzip_time:>10.2f} {len(payload) / 1024:>10.1f} {len(compressed) / 1024:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+This python module benchmarks the latency of a live prediction per bot with XGBClassifier.predict compared to
+the compiled NumPy scorer (models/compiled_scorer.py), once called per bot and once for all bots in one pass.
+It also checks that the probabilities of the compiled scorer match XGBClassifier.predict_proba.
+
+Usage:
+    python benchmarks/benchmark_compiled_scorer.py --trees 500 --bots 1 100 1000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.compiled_scorer import CompiledScorer, CompiledScorerGroup
+
+
+def train_benchmark_models(number_of_models: int, number_of_trees: int, number_of_rows: int = 5_000, number_of_features: int = 12) -> list:
+    """
+    Trains xgboost classifiers with the default parameters of the application on random data.
+
+    Parameters:
+    - number_of_models (int): The number of different models.
+    - number_of_trees (int): The number of trees of each model.
+    - number_of_rows (int): The number of rows of the random training data.
+    - number_of_features (int): The number of features of the random training data.
+
+    Returns:
+    - list: A list of tuples containing the trained model and a DataFrame with its training features.
+    """
+    rng = np.random.default_rng(42)
+    models = []
+    for _ in range(number_of_models):
+        features = pd.DataFrame(rng.normal(size=(number_of_rows, number_of_features)).astype(np.float32),
+                                columns=[f'feature_{i}' for i in range(number_of_features)])
+        target = (features['feature_0'] + rng.normal(scale=2.0, size=number_of_rows) > 0).astype(int)
+        model = xgb.XGBClassifier(n_estimators=number_of_trees, max_depth=5, learning_rate=0.05, gamma=2, colsample_bytree=0.8, objective='binary:logistic')
+        model.fit(features, target)
+        models.append((model, features))
+    return models
+
+
+def time_function(function, repetitions: int) -> float:
+    """
+    Returns the median runtime of a function in milliseconds.
+
+    Parameters:
+    - function (callable): The function which is timed.
+    - repetitions (int): How often the function is executed.
+
+    Returns:
+    - float: The median runtime in milliseconds.
+    """
+    timings = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return float(np.median(timings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark XGBClassifier.predict vs. the compiled NumPy scorer.')
+    parser.add_argument('--trees', type=int, default=500)
+    parser.add_argument('--bots', type=int, nargs='+', default=[1, 100, 1000])
+    parser.add_argument('--models', type=int, default=10, help='Number of distinct models, the bots use them round robin.')
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'Training {args.models} models with {args.trees} trees...')
+    models = train_benchmark_models(args.models, args.trees)
+    scorers = [CompiledScorer(model.get_booster()) for model, _ in models]
+
+    max_difference = max(float(np.abs(scorer.predict_proba(features) - model.predict_proba(features)).max())
+                         for scorer, (model, features) in zip(scorers, models))
+    print(f'Maximum difference to predict_proba: {max_difference:.2e}')
+
+    print(f'{"bots":>6}{"predict [ms/bot]":>20}{"compiled [ms/bot]":>20}{"group [ms/bot]":>18}')
+    for number_of_bots in args.bots:
+        bots = [(models[i % args.models][0], scorers[i % args.models], models[i % args.models][1].iloc[[i % 1000]]) for i in range(number_of_bots)]
+        group = CompiledScorerGroup([scorer for _, scorer, _ in bots])
+        rows = [row for _, _, row in bots]
+
+        def predict_xgboost():
+            return [model.predict(row) for model, _, row in bots]
+
+        def predict_compiled():
+            return [scorer.predict(row) for _, scorer, row in bots]
+
+        def predict_group():
+            return group.predict_group(rows)
+
+        results = [time_function(function, args.repetitions) / number_of_bots for function in [predict_xgboost, predict_compiled, predict_group]]
+        print(f'{number_of_bots:>6}{results[0]:>20.4f}{results[1]:>20.4f}{results[2]:>18.4f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+This python module benchmarks the calculation of all configured technical indicators with one call of every
+TechnicalIndicators.calc_ function (the former path of BybitData.get_historic_data) compared to the fused single
+pass TechnicalIndicators.calc_fused, and checks that both return the same values.
+
+Usage:
+    python benchmarks/benchmark_fused_indicators.py --rows 100 100000 10000000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config.config
+from infrastructure.technical_indicators import TechnicalIndicators
+
+
+def calc_per_function(ti: TechnicalIndicators, data: pd.Series, indicators: list[tuple[str, list]]) -> np.ndarray:
+    """
+    Calculates the indicators with one call of the calc_ function of each indicator.
+
+    Parameters:
+    - ti (TechnicalIndicators): The instance which calculates the indicators.
+    - data (pd.Series): The open prices.
+    - indicators (list[tuple[str, list]]): The name and the parameters of every indicator.
+
+    Returns:
+    - np.ndarray: The indicators in the column order of TechnicalIndicators.calc_fused.
+    """
+    columns: list[np.ndarray] = []
+    for name, parameters in indicators:
+        values = getattr(ti, f'calc_{name}')(data, *parameters)
+        for output in (values if isinstance(values, tuple) else (values,)):
+            columns.append(output.to_numpy())
+    return np.column_stack(columns)
+
+
+def time_function(function, repetitions: int) -> float:
+    """
+    Returns the median runtime of a function in milliseconds.
+
+    Parameters:
+    - function (callable): The function which is timed.
+    - repetitions (int): How often the function is executed.
+
+    Returns:
+    - float: The median runtime in milliseconds.
+    """
+    timings = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return float(np.median(timings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the per-function indicator calculation vs. the fused single pass.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 100_000, 10_000_000])
+    parser.add_argument('--repetitions', type=int, default=3)
+    args = parser.parse_args()
+
+    ti = TechnicalIndicators()
+    indicators: list[tuple[str, list]] = ti.get_configured_indicators()
+    columns: list[str] = ti.get_output_columns(indicators)
+    rng = np.random.default_rng(42)
+
+    print(f'Indicators: {", ".join(columns)}')
+    print(f'{"rows":>12} {"per function [ms]":>18} {"fused [ms]":>12} {"speedup":>8} {"max rel. difference":>20}')
+    for number_of_rows in args.rows:
+        data = pd.Series(30_000 + np.cumsum(rng.normal(scale=5.0, size=number_of_rows)))
+        expected = calc_per_function(ti, data, indicators)
+        fused = ti.calc_fused(data, indicators)
+        if not np.array_equal(np.isnan(expected), np.isnan(fused)):
+            raise AssertionError('The fused calculation returns NaN for other rows than the per-function calculation')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            difference = float(np.nanmax(np.abs(expected - fused) / np.maximum(np.abs(expected), 1.0))) if number_of_rows > 30 else 0.0
+
+        per_function_time = time_function(lambda: calc_per_function(ti, data, indicators), args.repetitions)
+        fused_time = time_function(lambda: ti.calc_fused(data, indicators), args.repetitions)
+        print(f'{number_of_rows:>12} {per_function_time:>18.2f} {fused_time:>12.2f} {per_function_time / fused_time:>7.2f}x {difference:>20.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+This python module benchmarks the loading time and file size of xgboost models which are stored with pickle
+compared to the native xgboost binary format (UBJSON) which is used by ModelBase.save_model.
+
+Usage:
+    python benchmarks/benchmark_model_loading.py --trees 1500 --repetitions 20
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import numpy as np
+import xgboost as xgb
+
+
+def train_benchmark_model(number_of_trees: int, number_of_rows: int = 20_000, number_of_features: int = 12) -> xgb.XGBClassifier:
+    """
+    Trains a xgboost classifier with the default parameters of the application on random data.
+
+    Parameters:
+    - number_of_trees (int): The number of trees of the model.
+    - number_of_rows (int): The number of rows of the random training data.
+    - number_of_features (int): The number of features of the random training data.
+
+    Returns:
+    - xgb.XGBClassifier: The trained model.
+    """
+    rng = np.random.default_rng(42)
+    features = rng.normal(size=(number_of_rows, number_of_features)).astype(np.float32)
+    target = (features[:, 0] + rng.normal(scale=2.0, size=number_of_rows) > 0).astype(int)
+    model = xgb.XGBClassifier(n_estimators=number_of_trees, max_depth=5, learning_rate=0.05, gamma=2, colsample_bytree=0.8, objective='binary:logistic')
+    model.fit(features, target)
+    return model
+
+
+def time_function(function, repetitions: int) -> float:
+    """
+    Returns the median runtime of a function in milliseconds.
+
+    Parameters:
+    - function (callable): The function which is timed.
+    - repetitions (int): How often the function is executed.
+
+    Returns:
+    - float: The median runtime in milliseconds.
+    """
+    timings = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return float(np.median(timings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark pickle vs. native xgboost model loading.')
+    parser.add_argument('--trees', type=int, default=1500)
+    parser.add_argument('--repetitions', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'Training model with {args.trees} trees...')
+    model = train_benchmark_model(args.trees)
+
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, 'model.pkl')
+        native_path = os.path.join(directory, 'model.ubj')
+        with open(pickle_path, 'wb') as file:
+            pickle.dump(model, file)
+        model.save_model(native_path)
+
+        def load_pickle():
+            with open(pickle_path, 'rb') as file:
+                return pickle.load(file)
+
+        def load_native():
+            native_model = xgb.XGBClassifier()
+            native_model.load_model(native_path)
+            return native_model
+
+        # Cached load as done by ModelBase.load_model: only a stat call if the file did not change
+        signature = (os.stat(native_path).st_mtime_ns, os.stat(native_path).st_size)
+        cache = {native_path: (signature, load_native())}
+
+        def load_cached():
+            stat = os.stat(native_path)
+            cached = cache.get(native_path)
+            if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+                return cached[1]
+            return load_native()
+
+        results = [
+            ('pickle', os.path.getsize(pickle_path), time_function(load_pickle, args.repetitions)),
+            ('native (ubj)', os.path.getsize(native_path), time_function(load_native, args.repetitions)),
+            ('native (cached)', os.path.getsize(native_path), time_function(load_cached, args.repetitions)),
+        ]
+
+    print(f'{"format":<18}{"size [KB]":>12}{"load [ms]":>12}')
+    for name, size, load_time in results:
+        print(f'{name:<18}{size / 1024:>12.1f}{load_time:>12.3f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
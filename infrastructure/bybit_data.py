@@ -17,9 +17,13 @@ import requests
 import json 
 import time
 import datetime 
+import numpy as np
 import pandas as pd
 from infrastructure.technical_indicators import TechnicalIndicators
-from infrastructure.database import Database
+from infrastructure.database import Database, BARS_READY_CHANNEL, PRICES_READY_CHANNEL
+from infrastructure.feature_snapshot import FeatureSnapshot
+from infrastructure.feature_store import FeatureStore
+from infrastructure.timeframe_aggregator import TimeframeAggregator
 from config.config import load_config
 from infrastructure.logger import create_logger
 
@@ -38,7 +42,7 @@ class BybitData:
         - config (dict): The configuration settings loaded from the config file.
         - ti (TechnicalIndicators): The instance of the TechnicalIndicators class for calculating technical indicators.
         - db (Database): The instance of the Database class for interacting with the database.
-        - technical_indicators_function_mapping (dict): A dictionary mapping the names of technical indicators to their corresponding functions in the TechnicalIndicators class.
+        - aggregator (TimeframeAggregator): Aggregates the bars of the higher timeframes from the 1-minute bars.
         """
         self.current_price_url = "https://api.bybit.com/v5/market/tickers"
         self.hist_prices_url = "https://api.bybit.com/v5/market/mark-price-kline"
@@ -46,18 +50,12 @@ class BybitData:
         self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
         self.ti = TechnicalIndicators()
         self.db = Database()
-        
-        self.technical_indicators_function_mapping = {
-            "moving_average": self.ti.calc_moving_average,
-            "exponential_moving_average": self.ti.calc_exponential_moving_average,
-            "moving_std": self.ti.calc_moving_std,
-            "periodic_highs": self.ti.calc_periodic_highs,
-            "periodic_lows": self.ti.calc_periodic_lows,
-            "bollinger_bands": self.ti.calc_bollinger_bands,
-            "macd": self.ti.calc_macd,
-            "rsi": self.ti.calc_rsi,
-            "momentum": self.ti.calc_momentum
-        }
+        # Shared memory snapshots of the latest bars, only created by the process which runs the data thread
+        self.snapshots: dict = {}
+        self.feature_store = FeatureStore()
+        self.aggregator = TimeframeAggregator(self.db)
+        # Time of the last iteration of get_data_thread, reported by the health server of the ingestion role
+        self.last_progress: float = time.time()
         
     def get_data_thread(self):
         """
@@ -72,14 +70,22 @@ class BybitData:
         """
         last_update_timestamp = -1
         self.logger.info(f'Starting data thread: {datetime.datetime.now()}')
+        if self.config.feature_snapshot.enabled:
+            for symbol in self.config.tradeable_symbols:
+                self.create_snapshot(symbol)
         # TODO Check what the last timestamp in the database is and automatically update the data if necessary
         while True:
+            self.last_progress = time.time()
             try:
                 # Update data as soon as bar closed
                 if datetime.datetime.now().second == 0:
                     for symbol in self.config.tradeable_symbols:
                         hist_data = self.get_historic_data(symbol=symbol, limit=100)
                         self.insert_historical_data(symbol=symbol, data=hist_data)
+                        # Bars of the higher timeframes are aggregated as soon as they closed
+                        self.aggregator.update(symbol, newest=hist_data['Timestamp'].max())
+                        self.db.notify(BARS_READY_CHANNEL, symbol.lower())
+                        self.db.commit()
                         
                 # Update current price each second
                 if last_update_timestamp + self.config.price_update_interval < time.time():
@@ -185,15 +191,14 @@ class BybitData:
         data.reset_index(inplace=True, drop=True)
         
         if calc_technical_indicators:
-            for indicator in self.config.technical_indicators.indicators:
-                try:
-                    function = self.technical_indicators_function_mapping.get(indicator)
-                    if indicator == "bollinger_bands":
-                        data['lower_bollinger_band'], data['upper_bollinger_band'] = function(data['Open'])
-                    else:
-                        data[indicator] = function(data['Open'])
-                except Exception as e:
-                    self.logger.error(f"Error calculating technical indicator {indicator} for {symbol}. \n{e}")
+            # All indicators are calculated in one pass which shares the rolling windows between them
+            try:
+                indicators: list[tuple[str, list]] = self.ti.get_configured_indicators()
+                values: np.ndarray = self.ti.calc_fused(data['Open'], indicators)
+                for index, column in enumerate(self.ti.get_output_columns(indicators)):
+                    data[column] = values[:, index]
+            except Exception as e:
+                self.logger.error(f"Error calculating technical indicators for {symbol}. \n{e}")
             data.dropna(inplace=True)
             data.reset_index(inplace=True, drop=True)
 
@@ -240,6 +245,48 @@ class BybitData:
             if not rows_affected:
                 break
         self.db.commit()
+        self.publish_snapshot(symbol, data)
+        if self.config.feature_store.enabled:
+            self.feature_store.append_frame(symbol, data)
+
+    def create_snapshot(self, symbol: str) -> None:
+        """
+        Creates the shared memory snapshot of a symbol and fills it with the newest bars from the database.
+
+        Parameters:
+        - symbol (str): The symbol of the asset.
+
+        Returns:
+        - None
+        """
+        snapshot: FeatureSnapshot = FeatureSnapshot(symbol, create=True)
+        self.snapshots[symbol.lower()] = snapshot
+        columns: str = ','.join(['"timestamp"'] + [f'"{column}"' for column in snapshot.columns])
+        query: str = f'SELECT {columns} FROM {symbol.lower()} ORDER BY timestamp DESC LIMIT {snapshot.capacity}'
+        data: pd.DataFrame = self.db.execute_read_query(query, return_type='pd.DataFrame')
+        if data is not None:
+            self.publish_snapshot(symbol, data)
+
+    def publish_snapshot(self, symbol: str, data: pd.DataFrame) -> None:
+        """
+        Publishes bars which were written to the database into the shared memory snapshot of the symbol.
+
+        Parameters:
+        - symbol (str): The symbol of the asset.
+        - data (pd.DataFrame): The bars as inserted by insert_historical_data.
+
+        Returns:
+        - None
+        """
+        snapshot: FeatureSnapshot | None = self.snapshots.get(symbol.lower())
+        if snapshot is None or data.empty:
+            return
+        data = data.rename(columns=str.lower)
+        if any(column not in data.columns for column in snapshot.columns):
+            self.logger.error(f'publish_snapshot: The data of {symbol} does not contain all columns of the snapshot')
+            return
+        data = data.sort_values('timestamp')
+        snapshot.publish(data['timestamp'].to_numpy(dtype='datetime64[ns]'), data[snapshot.columns].to_numpy(dtype=np.float64))
         
     def insert_latest_data(self, data: tuple) -> None:
         """
@@ -276,5 +323,11 @@ class BybitData:
         
         row = tuple(data) + tuple(data)
         self.db.execute_write_query(query, row)
+
+        snapshot: FeatureSnapshot | None = self.snapshots.get(str(data[0]).lower())
+        if snapshot is not None:
+            snapshot.publish_tick(data[1], tuple(data[2:]))
+        # Readers are notified after the snapshot was updated, so they never read the previous price again
+        self.db.notify(PRICES_READY_CHANNEL, str(data[0]).lower())
         self.db.commit()              
         
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+This python module contains the compact columnar encoding of the time series which are sent to the charts.
+
+Instead of one formatted date string and one float per point, a series is encoded as:
+- the timestamps as epoch seconds, either as a start plus a fixed step if the points are evenly spaced (e.g. the bars
+  of one timeframe) or as a start plus the distance of every point to its predecessor as unsigned 32-bit integers,
+  which are mostly equal and compress well,
+- every column as the base64 encoded little-endian bytes of a typed array (e.g. float64), which the browser reads
+  into a Float64Array without parsing a number per point (see decode_columnar in website/static/js/chart.js).
+The arrays are encoded directly from their NumPy buffers, no Python object is created per point.
+"""
+import base64
+import numpy as np
+
+ENCODING: str = 'columnar'
+# The dtypes which have a typed array in the browser
+DTYPES: dict[str, str] = {'float64': '<f8', 'float32': '<f4', 'int32': '<i4', 'uint32': '<u4'}
+
+def encode_array(values: np.ndarray, dtype: str = 'float64') -> dict:
+    """
+    Encodes an array as the base64 string of its little-endian bytes.
+
+    Parameters:
+    - values (np.ndarray): The values.
+    - dtype (str, optional): One of DTYPES. Defaults to 'float64'.
+
+    Returns:
+    - dict: The keys 'dtype' and 'data'.
+    """
+    data: np.ndarray = np.ascontiguousarray(values, dtype=DTYPES[dtype])
+    return {'dtype': dtype, 'data': base64.b64encode(data.tobytes()).decode('ascii')}
+
+def decode_array(encoded: dict) -> np.ndarray:
+    """
+    Decodes an array returned by encode_array.
+
+    Parameters:
+    - encoded (dict): The encoded array.
+
+    Returns:
+    - np.ndarray: The values.
+    """
+    return np.frombuffer(base64.b64decode(encoded['data']), dtype=DTYPES[encoded['dtype']])
+
+def encode_timestamps(timestamps: np.ndarray) -> dict:
+    """
+    Encodes timestamps as epoch seconds, as a start plus a fixed step if they are evenly spaced and as a start plus
+    the distance of every timestamp to its predecessor (0 for the first one) otherwise.
+
+    Parameters:
+    - timestamps (np.ndarray): The timestamps, sorted ascending.
+
+    Returns:
+    - dict: The keys 'start', 'count' and either 'step' or 'deltas' (see encode_array).
+    """
+    seconds: np.ndarray = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+    if not len(seconds):
+        return {'start': 0, 'count': 0, 'step': 0}
+    start: int = int(seconds[0])
+    steps: np.ndarray = np.diff(seconds)
+    if len(steps) == 0 or (steps == steps[0]).all():
+        return {'start': start, 'count': len(seconds), 'step': int(steps[0]) if len(steps) else 0}
+    return {'start': start, 'count': len(seconds), 'deltas': encode_array(np.concatenate([[0], steps]), 'uint32')}
+
+def decode_timestamps(encoded: dict) -> np.ndarray:
+    """
+    Decodes timestamps returned by encode_timestamps.
+
+    Parameters:
+    - encoded (dict): The encoded timestamps.
+
+    Returns:
+    - np.ndarray: The timestamps as datetime64[s].
+    """
+    if 'deltas' in encoded:
+        seconds: np.ndarray = encoded['start'] + np.cumsum(decode_array(encoded['deltas']).astype(np.int64))
+    else:
+        seconds = encoded['start'] + encoded['step'] * np.arange(encoded['count'], dtype=np.int64)
+    return seconds.astype('datetime64[s]')
+
+def encode_series(timestamps: np.ndarray, columns: dict[str, np.ndarray], dtypes: dict[str, str] = None) -> dict:
+    """
+    Encodes a time series with its columns.
+
+    Parameters:
+    - timestamps (np.ndarray): The timestamps, sorted ascending.
+    - columns (dict[str, np.ndarray]): The values of every column, one per timestamp.
+    - dtypes (dict[str, str], optional): The dtype of a column (see DTYPES). Defaults to 'float64' for every column.
+
+    Returns:
+    - dict: The keys 'encoding', 'time' (see encode_timestamps) and 'columns' (see encode_array).
+    """
+    dtypes = dtypes or {}
+    return {
+        'encoding': ENCODING,
+        'time': encode_timestamps(timestamps),
+        'columns': {name: encode_array(values, dtypes.get(name, 'float64')) for name, values in columns.items()},
+    }
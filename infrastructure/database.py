@@ -11,6 +11,7 @@ for part in basedir_split:
         path_to_config += f'/config'
         break
 
+import numpy as np
 import pandas as pd
 import datetime
 import psycopg2
@@ -20,8 +21,29 @@ import json
 from config.config import load_config
 from infrastructure.logger import create_logger
 
+# Channels of the events which are published with Database.notify and received by the event bus of every web worker
+# (see website/event_bus.py), e.g. to invalidate the response cache and to push updates to the browsers. The payload
+# is the symbol, '<user>:<bot_id>' or a JSON object with the keys 'user' and 'bot_id'.
+BARS_READY_CHANNEL: str = 'bars_ready'
+PRICES_READY_CHANNEL: str = 'prices_ready'
+TRADE_INSERTED_CHANNEL: str = 'trade_inserted'
+PREDICTION_MADE_CHANNEL: str = 'prediction_made'
+TRAINING_PROGRESS_CHANNEL: str = 'training_progress'
+
+# Columns of the 'bot_stats' table, the performance aggregates of every bot which are updated with each trade
+BOT_STATS_COLUMNS: list[str] = ['"user"', 'bot_id', 'trades', 'wins', 'cumulative_return', 'mean_return', 'm2', 'peak_equity', 'last_equity', 'max_drawdown', 'last_trade']
+# Condition on a row b of 'bots' which is true while a training worker holds the training lease of the bot
+TRAINING_LEASE_CONDITION: str = 'COALESCE(b.training, False) AND b.training_until > NOW()'
+# Condition on a row b of 'bots' which is true while a training job of the bot is queued or running
+PENDING_JOB_CONDITION: str = 'EXISTS (SELECT 1 FROM training_jobs j WHERE j."user" = b."user" AND j.bot_id = b.id AND j.finished IS NULL AND j.attempts < %(max_attempts)s)'
+# Columns returned by Database.get_bots_state, the state of a bot with its aggregates and its live model version
+BOTS_STATE_COLUMNS: list[str] = ['id', 'name', 'symbol', 'timeframe', 'model_type', 'created', 'last_trained', 'training', 'training_progress',
+                                 'training_error_metrics', 'running', 'prediction', 'position', 'entry_price', 'money', 'stop_loss',
+                                 'stop_loss_trailing', 'take_profit', 'retrain_interval', 'live_version',
+                                 'trades', 'win_rate', 'cumulative_return', 'max_drawdown', 'sharpe_ratio', 'last_trade']
+
 class Database:
-    def __init__(self) -> None:
+    def __init__(self, statement_timeout_seconds: float = None) -> None:
         """
         Initialize a Database object.
 
@@ -29,11 +51,13 @@ class Database:
         establishing a connection to the PostgreSQL database, creating an engine and a cursor.
 
         Parameters:
-        - None
+        - statement_timeout_seconds (float, optional): If set, every query of the connection and the engine is
+          cancelled by the server after this time (statement_timeout). Defaults to None.
 
         Returns:
         - None
         """
+        self.statement_timeout_seconds: float | None = statement_timeout_seconds
         self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
         self.logger = create_logger('database.log')
         self.engine = self.create_engine()
@@ -56,13 +80,28 @@ class Database:
                                         user=self.config.postgres.username,
                                         password=self.config.postgres.password,
                                         host=self.config.postgres.host,
-                                        port=self.config.postgres.port)
+                                        port=self.config.postgres.port,
+                                        options=self.get_connection_options())
             self.logger.debug('create_connection: Created connection!')
             return connection
         except Exception as e:
             self.logger.error(f'create_connection: Could not create a connection: {str(e)}')
             return None
         
+    def get_connection_options(self) -> str:
+        """
+        Returns the options which are passed to the server when a connection is created.
+
+        Parameters:
+        - self (Database): The instance of the Database class.
+
+        Returns:
+        - str: The options, e.g. '-c statement_timeout=20000', or an empty string.
+        """
+        if self.statement_timeout_seconds is None:
+            return ''
+        return f'-c statement_timeout={int(self.statement_timeout_seconds * 1000)}'
+
     def create_cursor(self) -> psycopg2.extensions.cursor:
         """
         This function creates a cursor for executing SQL commands in the PostgreSQL database.
@@ -99,7 +138,8 @@ class Database:
                                     f'{self.config.postgres.password}@'
                                     f'{self.config.postgres.host}:'
                                     f'{self.config.postgres.port}/'
-                                    f'{self.config.postgres.database}')
+                                    f'{self.config.postgres.database}',
+                                    connect_args={'options': self.get_connection_options()})
             self.logger.debug('create_engine: Created engine!')
             return engine
         except Exception as e:
@@ -149,6 +189,20 @@ class Database:
             self.logger.error(f'execute_write_query: Error executing the query: {str(e)}')
             self.logger.error(f'execute_write_query: Query: {query}')
             
+    def notify(self, channel: str, payload: str) -> None:
+        """
+        Publishes an event to all connections which listen on a channel (PostgreSQL NOTIFY). The event is delivered
+        when the current transaction is committed.
+
+        Parameters:
+        - channel (str): The channel, e.g. BARS_READY_CHANNEL.
+        - payload (str): The payload of the event, e.g. the symbol.
+
+        Returns:
+        - None
+        """
+        self.execute_write_query('SELECT pg_notify(%s, %s)', (channel, payload))
+
     def execute_read_query(self, query: str, params: tuple = (), first_only: bool = False, return_column_names: bool = False, return_type: str = 'list') -> list | tuple | pd.DataFrame | None:
         """
         Executes a read query on the PostgreSQL database and returns the result based on the specified parameters.
@@ -231,11 +285,15 @@ class Database:
                 
             query += ');'
             
-            self.execute_write_query(query)
+            if self.execute_write_query(query) is None:
+                self.connection.rollback()
+                return False
 
             if create_index_column:
                 query = f'CREATE INDEX IF NOT EXISTS idx_{table_name}_{create_index_column} ON {table_name} ({create_index_column})'
-                self.execute_write_query(query)
+                if self.execute_write_query(query) is None:
+                    self.connection.rollback()
+                    return False
 
             self.commit()
             return True
@@ -281,7 +339,7 @@ class Database:
             self.logger.error(f'truncate_table: Error truncating the table: {str(e)}')
             return False
         
-    def add_column(self, table_name: str, column_name: str, column_type: str) -> None:
+    def add_column(self, table_name: str, column_name: str, column_type: str) -> bool:
         """
         Adds a new column to an existing table in the PostgreSQL database.
 
@@ -291,11 +349,17 @@ class Database:
         - column_type (str): The data type of the new column to be added.
 
         Returns:
-        - None
+        - bool: Returns True if the column exists afterwards, False otherwise.
         """
         query: str = f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column_name} {column_type}'
-        self.execute_write_query(query)
+        if self.execute_write_query(query) is None:
+            try:
+                self.connection.rollback()
+            except Exception as e:
+                self.logger.error(f'add_column: Error rolling back changes: {str(e)}')
+            return False
         self.commit()
+        return True
         
     def count_columns_of_table(self, table_name: str) -> int | None:
         """
@@ -479,6 +543,9 @@ class Database:
 
         query: str = f"""DELETE FROM trades WHERE "user" = {user} AND bot_id = {bot_id}"""
         self.execute_write_query(query)
+
+        query: str = f"""DELETE FROM bot_stats WHERE "user" = {user} AND bot_id = {bot_id}"""
+        self.execute_write_query(query)
         self.commit()
     
     def insert_training_error_metrics(self, user: int, model_id: int, metrics: dict) -> None:
@@ -517,6 +584,105 @@ class Database:
         data = self.execute_read_query(query)
         return data[0][0]
     
+    def set_training_progress(self, user: int, model_id: int, progress: dict) -> None:
+        """
+        Stores the progress of a running training for a specific bot in the 'bots' table in the PostgreSQL database.
+
+        Parameters:
+        - user (int): The unique identifier of the user who created the bot.
+        - model_id (int): The unique identifier of the bot which is trained.
+        - progress (dict): A dictionary describing the progress, e.g. the stage and the number of processed rows.
+
+        Returns:
+        - None: The function does not return any value. It updates the training progress of the bot in the database.
+        """
+        self.execute_write_query(f'UPDATE bots SET training_progress=%s WHERE "user"={user} AND "id"={model_id}', (json.dumps(progress),))
+        self.notify(TRAINING_PROGRESS_CHANNEL, json.dumps({'user': int(user), 'bot_id': int(model_id), 'training': True, 'progress': progress}))
+        self.commit()
+
+    def set_training(self, user: int, model_id: int, value: bool) -> None:
+        """
+        Updates the 'training' status of a specific bot in the 'bots' table in the PostgreSQL database and publishes it
+        on the TRAINING_PROGRESS_CHANNEL. While the bot is trained, the process holds the training lease of the bot
+        for training_jobs.lease_seconds, which has to be extended with renew_training.
+
+        Parameters:
+        - user (int): The unique identifier of the user who created the bot.
+        - model_id (int): The unique identifier of the bot.
+        - value (bool): True while the bot is trained, False afterwards.
+
+        Returns:
+        - None: The function does not return any value. It updates the 'training' status of the bot in the database.
+        """
+        query: str = f"UPDATE bots SET training=%s, training_until=CASE WHEN %s THEN NOW() + %s * INTERVAL '1 second' END WHERE \"user\"={user} AND \"id\"={model_id}"
+        self.execute_write_query(query, (value, value, self.config.training_jobs.lease_seconds))
+        self.notify(TRAINING_PROGRESS_CHANNEL, json.dumps({'user': int(user), 'bot_id': int(model_id), 'training': bool(value)}))
+        self.commit()
+
+    def renew_training(self, bots: list[tuple[int, int]]) -> int:
+        """
+        Extends the training lease of bots which are trained by this process by training_jobs.lease_seconds. A bot
+        whose lease expired, e.g. because its training process died, is trained again by the training workers.
+
+        Parameters:
+        - bots (list[tuple[int, int]]): The (user, bot_id) pairs.
+
+        Returns:
+        - int: The number of renewed leases.
+        """
+        if not bots:
+            return 0
+        query: str = "UPDATE bots SET training_until = NOW() + %s * INTERVAL '1 second' WHERE training AND (\"user\", id) IN %s"
+        renewed: int | None = self.execute_write_query(query, (self.config.training_jobs.lease_seconds, tuple(bots)))
+        self.commit()
+        return renewed or 0
+
+    def enqueue_training_job(self, user: int, bot_id: int, mode: str, parameters: dict = None) -> bool:
+        """
+        Queues the training of a bot for the training workers (see models/retrain_scheduler.py) and marks the bot as
+        training, so the web workers never train a model themselves.
+
+        Parameters:
+        - user (int): The unique identifier of the user who created the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - mode (str): 'full' or 'incremental'.
+        - parameters (dict, optional): The parameters of a full training, 'start_time', 'end_time' and 'data_percentage'.
+
+        Returns:
+        - bool: True if the job was queued, False if a training job of the bot is already queued or running.
+        """
+        query: str = 'INSERT INTO training_jobs ("user", bot_id, mode, parameters, created, attempts)'
+        query += ' SELECT %(user)s, %(bot_id)s, %(mode)s, %(parameters)s, NOW(), 0 FROM bots b WHERE b."user" = %(user)s AND b.id = %(bot_id)s'
+        query += f' AND NOT {PENDING_JOB_CONDITION}'
+        inserted: int | None = self.execute_write_query(query, {'user': user, 'bot_id': bot_id, 'mode': mode, 'parameters': json.dumps(parameters or {}, default=str),
+                                                                'max_attempts': self.config.training_jobs.max_attempts})
+        if not inserted:
+            self.commit()
+            return False
+        # The lease is only taken by the training worker which runs the job
+        self.execute_write_query(f'UPDATE bots SET training=True WHERE "user"={user} AND "id"={bot_id}')
+        self.execute_write_query(f'UPDATE bots SET training_progress=%s WHERE "user"={user} AND "id"={bot_id}', (json.dumps({'stage': 'queued'}),))
+        self.notify(TRAINING_PROGRESS_CHANNEL, json.dumps({'user': int(user), 'bot_id': int(bot_id), 'training': True, 'progress': {'stage': 'queued'}}))
+        self.commit()
+        return True
+
+    def set_prediction(self, user: int, model_id: int, value: int) -> None:
+        """
+        Stores the newest prediction of a specific bot in the 'bots' table in the PostgreSQL database and publishes it
+        on the PREDICTION_MADE_CHANNEL.
+
+        Parameters:
+        - user (int): The unique identifier of the user who created the bot.
+        - model_id (int): The unique identifier of the bot.
+        - value (int): The prediction, 1 for rising and 0 for falling prices.
+
+        Returns:
+        - None: The function does not return any value. It updates the prediction of the bot in the database.
+        """
+        self.execute_write_query(f'UPDATE bots SET prediction=%s WHERE "user"={user} AND "id"={model_id}', (int(value),))
+        self.notify(PREDICTION_MADE_CHANNEL, json.dumps({'user': int(user), 'bot_id': int(model_id), 'prediction': int(value)}))
+        self.commit()
+
     def set_running(self, user: int, model_id: str, value: bool) -> None:
         """
         Updates the 'running' status of a specific bot in the 'bots' table in the PostgreSQL database.
@@ -543,14 +709,62 @@ class Database:
 
         Returns:
         pd.DataFrame: A pandas DataFrame containing the details of all running models.
-        The DataFrame has the following columns: 'user', 'id', 'model_type', 'symbol',
-        'technical_indicators', 'position', 'entry_price', 'prediction'.
+        The DataFrame has the following columns: 'user', 'id', 'model_type', 'symbol', 'timeframe',
+        'technical_indicators', 'position', 'entry_price', 'prediction', 'money', 'live_version'.
+        'live_version' is the live version of the model registry and NaN if the model was never registered.
         """
-        query: str = 'SELECT "user", "id", model_type, symbol, technical_indicators, position, entry_price, prediction, money FROM bots WHERE running=True'
+        query: str = 'SELECT b."user", b."id", b.model_type, b.symbol, b.timeframe, b.technical_indicators, b.position, b.entry_price, b.prediction, b.money, v.version AS live_version'
+        query += ' FROM bots b LEFT JOIN model_versions v ON v."user" = b."user" AND v.bot_id = b.id AND v.live WHERE b.running=True'
         data = self.execute_read_query(query, return_type='pd.DataFrame')
         return data
     
-    def insert_trade(self, user: int, bot_id: int, timestamp: datetime.datetime, symbol: str, side: str, entry_price: float, close_price: float, money: float, profit_abs: float, profit_rel: float, trading_fee: float, tp_trigger: bool, sl_trigger: bool) -> None:
+    def get_bots_state(self, user: int, after: int = None, limit: int | None = 50, bot_id: int = None) -> pd.DataFrame:
+        """
+        Retrieves the state of the bots of a user together with their performance aggregates and live model version
+        with one query. The bots are ordered by id and paginated with a keyset (the id of the last bot of the previous
+        page), so every page is read from the index instead of skipping the bots of the former pages.
+
+        Parameters:
+        - user (int): The unique identifier of the user.
+        - after (int, optional): The id of the last bot of the previous page. Defaults to None (first page).
+        - limit (int | None, optional): The maximum number of bots, None for all bots. Defaults to 50.
+        - bot_id (int, optional): Only the state of this bot, e.g. for the page of a bot. Defaults to all bots.
+
+        Returns:
+        - pd.DataFrame: The columns of BOTS_STATE_COLUMNS, one row per bot.
+        """
+        query: str = f"""SELECT b.id, b.name, b.symbol, b.timeframe, b.model_type, b.created, b.last_trained, b.training, b.training_progress,
+                                b.training_error_metrics, b.running, b.prediction, b."position", b.entry_price, b.money, b.stop_loss,
+                                b.stop_loss_trailing, b.take_profit, b.retrain_interval, v.version,
+                                s.trades, s.wins::FLOAT / NULLIF(s.trades, 0), s.cumulative_return, s.max_drawdown,
+                                s.mean_return / NULLIF(SQRT(s.m2 / NULLIF(s.trades - 1, 0)), 0), s.last_trade
+                         FROM bots b
+                         LEFT JOIN model_versions v ON v."user" = b."user" AND v.bot_id = b.id AND v.live
+                         LEFT JOIN bot_stats s ON s."user" = b."user" AND s.bot_id = b.id
+                         WHERE b."user"=%s{' AND b.id > %s' if after is not None else ''}{' AND b.id = %s' if bot_id is not None else ''}
+                         ORDER BY b.id{' LIMIT %s' if limit is not None else ''}"""
+        params: tuple = (user,) + ((after,) if after is not None else ()) + ((bot_id,) if bot_id is not None else ()) + ((limit,) if limit is not None else ())
+        rows: list | None = self.execute_read_query(query, params)
+        data: pd.DataFrame = pd.DataFrame(rows or [], columns=BOTS_STATE_COLUMNS)
+        return data.astype(object).where(data.notna(), None)
+
+    def get_latest_prices(self, symbols: list[str]) -> pd.DataFrame:
+        """
+        Retrieves the latest ticker prices of several symbols from the 'prices' table with one query.
+
+        Parameters:
+        - symbols (list[str]): The symbols.
+
+        Returns:
+        - pd.DataFrame: The columns 'symbol', 'timestamp', 'last_price', 'bid_price', 'ask_price', 'bid_size', 'ask_size'
+          and 'price_change_last_24h', one row per symbol with a price.
+        """
+        columns: list[str] = ['symbol', 'timestamp', 'last_price', 'bid_price', 'ask_price', 'bid_size', 'ask_size', 'price_change_last_24h']
+        query: str = 'SELECT symbol, "timestamp", last_price, bid_price, ask_price, bid_size, ask_size, price_change_last_24h FROM prices WHERE UPPER(symbol) = ANY(%s)'
+        rows: list | None = self.execute_read_query(query, ([symbol.upper() for symbol in symbols],))
+        return pd.DataFrame(rows or [], columns=columns)
+
+    def insert_trade(self, user: int, bot_id: int, timestamp: datetime.datetime, symbol: str, side: str, entry_price: float, close_price: float, money: float, profit_abs: float, profit_rel: float, trading_fee: float, tp_trigger: bool, sl_trigger: bool) -> bool:
         """
         Inserts a new trade into the 'trades' table in the PostgreSQL database.
 
@@ -569,14 +783,109 @@ class Database:
         - sl_trigger (bool): A boolean indicating whether the trade was triggered by a stop-loss order.
 
         Returns:
-        - None: The function does not return any value. It inserts a new trade into the database.
+        - bool: True if the trade and the performance aggregates were stored. If one of them failed, nothing is stored
+          and no event is published.
         """
         trade_id: int = self.provide_unique_id('trades', id_column_name='trade_id')
         
         query: str = 'INSERT INTO trades (trade_id, "user", bot_id, timestamp, symbol, side, entry_price, close_price, money, profit_abs, profit_rel, trading_fee, tp_trigger, sl_trigger) VALUES ('
         query += ' %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
-        self.execute_write_query(query, (trade_id, user, bot_id, timestamp, symbol, side, entry_price, close_price, money, profit_abs, profit_rel, trading_fee, tp_trigger, sl_trigger))
+        inserted_rows: int | None = self.execute_write_query(query, (trade_id, user, bot_id, timestamp, symbol, side, entry_price, close_price, money, profit_abs, profit_rel, trading_fee, tp_trigger, sl_trigger))
+        # The aggregates are updated in the same transaction, so they always match the trades. If the trade was not
+        # stored (execute_write_query may have rolled back already), the aggregates are not updated either
+        if inserted_rows != 1 or not self.update_bot_stats(user, bot_id, timestamp, money, profit_rel):
+            self.logger.error(f'insert_trade: The trade of bot {user}_{bot_id} at {timestamp} was not stored')
+            try:
+                self.connection.rollback()
+            except Exception as e:
+                self.logger.error(f'insert_trade: Error rolling back changes: {str(e)}')
+            return False
+        self.notify(TRADE_INSERTED_CHANNEL, f'{user}:{bot_id}')
+        self.commit()
+        return True
+
+    def update_bot_stats(self, user: int, bot_id: int, timestamp: datetime.datetime, money: float, profit_rel: float) -> bool:
+        """
+        Adds a trade to the performance aggregates of a bot in the 'bot_stats' table without reading its former trades.
+        The mean and the sum of the squared deviations of the returns are updated with Welford's algorithm, the
+        cumulative return is compounded and the maximum drawdown is measured from the highest money after a trade.
+        The changes are not committed, the caller commits them together with the trade.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - timestamp (datetime.datetime): The timestamp of the trade.
+        - money (float): The money of the bot after the trade.
+        - profit_rel (float): The relative profit or loss of the trade.
+
+        Returns:
+        - bool: True if the aggregates were updated, False otherwise.
+        """
+        # Values of the first trade of a bot, the money before it is the start of its equity curve
+        start_money: float = money / (1 + profit_rel) if 1 + profit_rel > 0 else money
+        peak: float = max(start_money, money)
+        drawdown: float = 1 - money / peak if peak > 0 else 0.0
+        query: str = f"""INSERT INTO bot_stats ({', '.join(BOT_STATS_COLUMNS)}) VALUES (%s, %s, 1, %s, %s, %s, 0, %s, %s, %s, %s)
+                         ON CONFLICT ("user", bot_id) DO UPDATE SET
+                             trades = bot_stats.trades + 1,
+                             wins = bot_stats.wins + EXCLUDED.wins,
+                             cumulative_return = (1 + bot_stats.cumulative_return) * (1 + EXCLUDED.mean_return) - 1,
+                             mean_return = bot_stats.mean_return + (EXCLUDED.mean_return - bot_stats.mean_return) / (bot_stats.trades + 1),
+                             m2 = bot_stats.m2 + (EXCLUDED.mean_return - bot_stats.mean_return) * (EXCLUDED.mean_return - bot_stats.mean_return) * bot_stats.trades / (bot_stats.trades + 1),
+                             peak_equity = GREATEST(bot_stats.peak_equity, EXCLUDED.last_equity),
+                             last_equity = EXCLUDED.last_equity,
+                             max_drawdown = GREATEST(bot_stats.max_drawdown, 1 - EXCLUDED.last_equity / NULLIF(GREATEST(bot_stats.peak_equity, EXCLUDED.last_equity), 0)),
+                             last_trade = EXCLUDED.last_trade"""
+        return self.execute_write_query(query, (user, bot_id, int(profit_rel > 0), profit_rel, profit_rel, peak, money, drawdown, timestamp)) == 1
+
+    def rebuild_bot_stats(self, user: int, bot_id: int) -> None:
+        """
+        Calculates the performance aggregates of a bot from all of its trades, e.g. for the trades which were inserted
+        before the 'bot_stats' table existed.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - None
+        """
+        trades: list | None = self.execute_read_query('SELECT "timestamp", money, profit_rel FROM trades WHERE "user"=%s AND bot_id=%s ORDER BY "timestamp", trade_id', (user, bot_id))
+        self.execute_write_query('DELETE FROM bot_stats WHERE "user"=%s AND bot_id=%s', (user, bot_id))
+        if trades:
+            returns: np.ndarray = np.array([trade[2] for trade in trades], dtype=np.float64)
+            money: np.ndarray = np.array([trade[1] for trade in trades], dtype=np.float64)
+            start_money: float = money[0] / (1 + returns[0]) if 1 + returns[0] > 0 else money[0]
+            peaks: np.ndarray = np.maximum.accumulate(np.concatenate([[start_money], money]))[1:]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                drawdowns: np.ndarray = np.where(peaks > 0, 1 - money / peaks, 0.0)
+            query: str = f'INSERT INTO bot_stats ({", ".join(BOT_STATS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+            self.execute_write_query(query, (user, bot_id, len(returns), int((returns > 0).sum()), float(np.prod(1 + returns) - 1), float(returns.mean()),
+                                             float(((returns - returns.mean()) ** 2).sum()), float(peaks[-1]), float(money[-1]), float(drawdowns.max()), trades[-1][0]))
         self.commit()
+
+    def get_bot_stats(self, user: int, bot_id: int = None) -> pd.DataFrame:
+        """
+        Retrieves the performance aggregates of the bots of a user from the 'bot_stats' table.
+
+        Parameters:
+        - user (int): The unique identifier of the user.
+        - bot_id (int, optional): Only the aggregates of this bot. Defaults to all bots of the user.
+
+        Returns:
+        - pd.DataFrame: The columns 'bot_id', 'trades', 'win_rate', 'cumulative_return', 'max_drawdown', 'sharpe_ratio'
+          (mean return per trade divided by its standard deviation, None below 2 trades), 'last_equity' and 'last_trade'.
+        """
+        query: str = """SELECT bot_id, trades, wins::FLOAT / NULLIF(trades, 0) AS win_rate, cumulative_return, max_drawdown,
+                                 mean_return / NULLIF(SQRT(m2 / NULLIF(trades - 1, 0)), 0) AS sharpe_ratio, last_equity, last_trade
+                          FROM bot_stats WHERE "user"=%s"""
+        params: tuple = (user,)
+        if bot_id is not None:
+            query += ' AND bot_id=%s'
+            params += (bot_id,)
+        rows: list | None = self.execute_read_query(query, params)
+        data: pd.DataFrame = pd.DataFrame(rows or [], columns=['bot_id', 'trades', 'win_rate', 'cumulative_return', 'max_drawdown', 'sharpe_ratio', 'last_equity', 'last_trade'])
+        return data.astype(object).where(data.notna(), None)
         
     def get_trades(self, user: int, bot_id: int, n: int, columns: list[str] = ['"timestamp"', 'side', 'entry_price', 'close_price', 'profit_rel', 'tp_trigger', 'sl_trigger'], return_type='list') -> list | pd.DataFrame:
         """
@@ -595,24 +904,164 @@ class Database:
         data = self.execute_read_query(query, return_type=return_type)
         return data
     
-    def get_trades_for_plotting(self, user: int, bot_id: int, min_date: datetime.datetime, columns: list[str] = ['"timestamp"', 'side', 'entry_price', 'close_price', 'profit_rel', 'tp_trigger', 'sl_trigger'], return_type: str = 'pd.DataFrame') -> list | pd.DataFrame:
+    def get_time_conditions(self, start: datetime.datetime = None, end: datetime.datetime = None, after: datetime.datetime = None, column: str = '"timestamp"',
+                            since: datetime.datetime = None) -> tuple[list[str], tuple]:
+        """
+        Builds the conditions of a query which restrict a timestamp column to a time range.
+
+        Parameters:
+        - start (datetime.datetime, optional): The first timestamp (inclusive). Defaults to None.
+        - end (datetime.datetime, optional): The last timestamp (inclusive). Defaults to None.
+        - after (datetime.datetime, optional): Only timestamps after this one (exclusive), e.g. the cursor of a client. Defaults to None.
+        - column (str, optional): The timestamp column. Defaults to '"timestamp"'.
+        - since (datetime.datetime, optional): Only timestamps from this one on (inclusive), e.g. the bar cursor of a
+          client. The newest bar of the client is returned again because it can still be rewritten. Defaults to None.
+
+        Returns:
+        - tuple[list[str], tuple]: The conditions with placeholders and their parameters.
+        """
+        conditions: list[str] = []
+        params: tuple = ()
+        for operator, value in (('>=', start), ('<=', end), ('>', after), ('>=', since)):
+            if value is not None:
+                conditions.append(f'{column} {operator} %s')
+                params += (pd.Timestamp(value).to_pydatetime(),)
+        return conditions, params
+
+    def get_trades_for_plotting(self, user: int, bot_id: int, min_date: datetime.datetime = None, columns: list[str] = ['"timestamp"', 'side', 'entry_price', 'close_price', 'profit_rel', 'tp_trigger', 'sl_trigger'], return_type: str = 'pd.DataFrame',
+                                max_date: datetime.datetime = None, after: datetime.datetime = None) -> list | pd.DataFrame:
         """
         Retrieves trades made by a specific bot for a specific user from the 'trades' table in the PostgreSQL database,
-        filtered by a minimum date. The retrieved data is returned as a list or a pandas DataFrame.
+        filtered by a time range. The retrieved data is returned as a list or a pandas DataFrame.
 
         Parameters:
         - user (int): The unique identifier of the user who initiated the trades.
         - bot_id (int): The unique identifier of the bot that made the trades.
-        - min_date (datetime.datetime): The minimum date for filtering the trades.
+        - min_date (datetime.datetime, optional): The minimum date for filtering the trades (inclusive). Defaults to None.
         - columns (list[str], optional): A list of column names to retrieve from the 'trades' table. Defaults to ['"timestamp"', 'side', 'entry_price', 'close_price', 'profit_rel', 'tp_trigger', 'sl_trigger'].
+        - max_date (datetime.datetime, optional): The maximum date for filtering the trades (inclusive). Defaults to None.
+        - after (datetime.datetime, optional): Only trades after this date (exclusive), e.g. the cursor of a client. Defaults to None.
 
         Returns:
         - list | pd.DataFrame: A list containing the details of the retrieved trades, or a pandas DataFrame if the 'return_type' parameter is set to 'pd.DataFrame'.
         """
-        min_date: datetime.datetime = datetime.datetime.strptime(min_date, '%d.%m.%Y %H:%M:%S')
-        min_date: str = datetime.datetime.strftime(min_date, '%Y-%m-%d %H:%M:%S')
-        query: str = f"""SELECT {",".join(columns)} FROM trades WHERE "user"={user} AND "bot_id"={bot_id} AND "timestamp" >= '{min_date}' ORDER BY "timestamp" DESC"""
-        data: list = self.execute_read_query(query, (min_date,), return_type=return_type)
+        conditions, params = self.get_time_conditions(min_date, max_date, after)
+        query: str = f"""SELECT {",".join(columns)} FROM trades WHERE {' AND '.join(['"user"=%s', '"bot_id"=%s'] + conditions)} ORDER BY "timestamp" DESC"""
+        data: list = self.execute_read_query(query, (user, bot_id) + params, return_type=return_type)
         return data
 
+    def get_trade_return_histogram(self, user: int, bot_id: int, number_of_bins: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Counts the returns of the trades of a bot in bins of equal width with width_bucket, so only one row per bin is
+        read instead of every trade. The width is the range of the returns divided by number_of_bins - 1 and the bin
+        edges are multiples of it, so 0 is always an edge and no bin contains losses and profits.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - number_of_bins (int): The number of bins which span the range of the returns, the zero-centred edges add at
+          most one bin.
+
+        Returns:
+        - tuple[np.ndarray, np.ndarray]: The bin edges in percent (one more than bins) and the number of trades per bin,
+          both empty if the bot has no trades. A bin contains the returns from its lower edge (inclusive) to its upper
+          edge (exclusive).
+        """
+        query: str = """WITH returns AS (
+                             SELECT profit_rel * 100 AS profit FROM trades WHERE "user"=%s AND "bot_id"=%s AND profit_rel IS NOT NULL
+                         ), widths AS (
+                             SELECT MIN(profit) AS low, MAX(profit) AS high,
+                                    CASE WHEN MAX(profit) > MIN(profit) THEN (MAX(profit) - MIN(profit)) / %s ELSE 1 END AS width
+                             FROM returns
+                         ), bounds AS (
+                             SELECT width, FLOOR(low / width) AS first_bin, FLOOR(high / width) - FLOOR(low / width) + 1 AS bins FROM widths
+                         )
+                         SELECT b.width, b.first_bin, b.bins, width_bucket(r.profit, b.first_bin * b.width, (b.first_bin + b.bins) * b.width, b.bins::int) AS bucket, COUNT(*)
+                         FROM returns r CROSS JOIN bounds b
+                         GROUP BY b.width, b.first_bin, b.bins, bucket ORDER BY bucket"""
+        rows: list | None = self.execute_read_query(query, (user, bot_id, max(int(number_of_bins) - 1, 1)))
+        if not rows:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        width, first_bin, bins = float(rows[0][0]), int(rows[0][1]), int(rows[0][2])
+        edges: np.ndarray = (first_bin + np.arange(bins + 1)) * width
+        counts: np.ndarray = np.zeros(bins, dtype=np.int64)
+        for row in rows:
+            # width_bucket returns 1 to bins, values outside the range cannot occur as the range covers all returns
+            counts[min(max(int(row[3]), 1), bins) - 1] += int(row[4])
+        return edges, counts
+
+    def get_rollup_prices_for_plotting(self, rollup_table: str, entries: int, rollup_timeframe: int, table: str, start: datetime.datetime = None,
+                                       end: datetime.datetime = None, after: datetime.datetime = None) -> pd.DataFrame | None:
+        """
+        Retrieves the newest bars of an aggregated timeframe table within a time range, followed by the bars of a finer
+        table which are newer than the newest closed bar of the aggregated timeframe, with one query.
+
+        Parameters:
+        - rollup_table (str): The aggregated timeframe table, e.g. 'btcusd_60m'.
+        - entries (int): The maximum number of bars of the aggregated timeframe table.
+        - rollup_timeframe (int): The timeframe of the aggregated timeframe table in minutes.
+        - table (str): The finer table, e.g. 'btcusd'.
+        - start (datetime.datetime, optional): The first bar (inclusive). Defaults to None.
+        - end (datetime.datetime, optional): The last bar (inclusive). Defaults to None.
+        - after (datetime.datetime, optional): Only bars after this one (exclusive). Defaults to None.
+
+        Returns:
+        - pd.DataFrame | None: The bars with the columns 'timestamp' and 'close', sorted by timestamp, or None in case of an error.
+        """
+        conditions, params = self.get_time_conditions(start, end, after)
+        tail_conditions, tail_params = self.get_time_conditions(end=end, after=after)
+        # The finer bars start after the newest closed bar of the aggregated timeframe
+        tail_conditions.insert(0, f'"timestamp" >= (SELECT MAX("timestamp") FROM rollup) + INTERVAL \'{int(rollup_timeframe)} minutes\'')
+        where: str = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        query: str = f"""WITH rollup AS (SELECT "timestamp", close FROM {rollup_table}{where} ORDER BY "timestamp" DESC LIMIT {int(entries)})
+                           SELECT "timestamp", close FROM rollup
+                           UNION ALL
+                           SELECT "timestamp", close FROM {table}
+                           WHERE {' AND '.join(tail_conditions)}
+                           ORDER BY "timestamp" ASC"""
+        rows: list | None = self.execute_read_query(query, params + tail_params)
+        if rows is None:
+            return None
+        return pd.DataFrame(rows, columns=['timestamp', 'close'])
+
+    def get_prices_and_trades_for_plotting(self, table: str, entries: int, user: int, bot_id: int, start: datetime.datetime = None, end: datetime.datetime = None,
+                                           since: datetime.datetime = None, trades_after: datetime.datetime = None) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+        """
+        Retrieves the newest bars of a price table within a time range and the trades of a bot since the oldest of
+        these bars with one query. Both parts are read through the index on "timestamp" of their table.
+
+        Parameters:
+        - table (str): The price table, e.g. 'btcusd' or 'btcusd_60m'.
+        - entries (int): The maximum number of bars.
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - start (datetime.datetime, optional): The first bar (inclusive). Defaults to None.
+        - end (datetime.datetime, optional): The last bar and trade (inclusive). Defaults to None.
+        - since (datetime.datetime, optional): Only bars from this one on (inclusive), see get_time_conditions. Defaults to None.
+        - trades_after (datetime.datetime, optional): Only trades after this date (exclusive). Defaults to the trades
+          since the oldest bar.
+
+        Returns:
+        - tuple[pd.DataFrame, pd.DataFrame] | None: The bars with the columns 'timestamp' and 'close' and the trades
+          with the columns 'timestamp', 'side' and 'entry_price', both sorted by timestamp, or None in case of an error.
+        """
+        conditions, params = self.get_time_conditions(start, end, since=since)
+        trade_conditions, trade_params = self.get_time_conditions(end=end, after=trades_after)
+        if trades_after is None:
+            trade_conditions.append('"timestamp" >= (SELECT MIN("timestamp") FROM prices)')
+        where: str = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        query: str = f"""WITH prices AS (SELECT "timestamp", close FROM {table}{where} ORDER BY "timestamp" DESC LIMIT {int(entries)})
+                           SELECT 0 AS kind, "timestamp", close AS price, NULL AS side FROM prices
+                           UNION ALL
+                           SELECT 1 AS kind, "timestamp", entry_price AS price, side FROM trades
+                           WHERE {' AND '.join(['"user"=%s', 'bot_id=%s'] + trade_conditions)}
+                           ORDER BY kind, "timestamp" ASC"""
+        rows: list | None = self.execute_read_query(query, params + (user, bot_id) + trade_params)
+        if rows is None:
+            return None
+        data: pd.DataFrame = pd.DataFrame(rows, columns=['kind', 'timestamp', 'price', 'side'])
+        prices: pd.DataFrame = data.loc[data['kind'] == 0, ['timestamp', 'price']].rename(columns={'price': 'close'})
+        trades: pd.DataFrame = data.loc[data['kind'] == 1, ['timestamp', 'side', 'price']].rename(columns={'price': 'entry_price'})
+        return prices.reset_index(drop=True), trades.reset_index(drop=True)
+
         
\ No newline at end of file
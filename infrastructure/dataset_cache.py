@@ -0,0 +1,326 @@
+"""
+This python module contains the dataset cache which stores the prepared training arrays of
+PrepareTrainingData.build_training_arrays on disk.
+
+Bots of different users on the same symbol with the same technical indicators are trained on the same features and
+targets. An entry is identified by the symbol, the set of feature columns, the remove_zeros flag and the version of
+the preparation pipeline, and covers a date range. A request for a date range which lies within the range of an
+entry is served by slicing the memory-mapped arrays of the entry, so it neither queries the database nor derives the
+return and the direction again.
+
+Bars of the last dataset_cache.settle_minutes minutes are still rewritten by the ingestion, so an entry only covers
+its range up to that point in time. Ranges which are rewritten by the GapFiller are invalidated with invalidate, and
+the least recently used entries are removed if the cache grows beyond dataset_cache.max_bytes.
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+path_to_config += f'{os.sep}config'
+
+import json
+import uuid
+import shutil
+import hashlib
+import datetime
+import numpy as np
+import pandas as pd
+
+from config.config import load_config
+from infrastructure.logger import create_logger
+
+ARRAYS: list[str] = ['features', 'target', 'timestamps']
+
+class DatasetCache:
+    def __init__(self, path: str = None) -> None:
+        """
+        Initialize the DatasetCache class.
+
+        Parameters:
+        - path (str, optional): The directory of the cache. Defaults to dataset_cache.path of the config.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.logger = create_logger('dataset_cache.log')
+        self.path: str = path or self.config.dataset_cache.path.replace(f'{os.sep}config', '')
+        self.enabled: bool = self.config.dataset_cache.enabled
+
+    def get_family_dir(self, symbol: str, feature_names: list[str], remove_zeros: bool, pipeline_version: int) -> str:
+        """
+        Returns the directory which contains all entries of a symbol with the same feature columns, remove_zeros flag
+        and pipeline version, calculated with the same configured indicator parameters (technical_indicators in the
+        config, e.g. the period of the moving average). The order of the feature columns does not matter.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - feature_names (list[str]): The names of the feature columns.
+        - remove_zeros (bool): Whether rows with a return of zero were removed.
+        - pipeline_version (int): The version of the preparation pipeline.
+
+        Returns:
+        - str: The directory.
+        """
+        key: str = json.dumps([symbol.lower(), sorted(feature_names), bool(remove_zeros), pipeline_version,
+                               self.config.technical_indicators.toDict()], sort_keys=True)
+        return os.path.join(self.path, symbol.lower(), hashlib.sha1(key.encode('UTF-8')).hexdigest()[:16])
+
+    def to_minute(self, value) -> np.datetime64 | None:
+        """
+        Rounds a date down to the minute like the date conditions of PrepareTrainingData.
+
+        Parameters:
+        - value: The date (str, datetime or None).
+
+        Returns:
+        - np.datetime64 | None: The minute or None if no date was passed.
+        """
+        if value is None:
+            return None
+        return np.datetime64(pd.Timestamp(value).floor('min'), 'm')
+
+    def load_entries(self, family_dir: str) -> list[dict]:
+        """
+        Loads the metadata of all entries within a directory.
+
+        Parameters:
+        - family_dir (str): The directory returned by get_family_dir.
+
+        Returns:
+        - list[dict]: The metadata of the entries, including their directory under 'path'.
+        """
+        entries: list[dict] = []
+        if not os.path.isdir(family_dir):
+            return entries
+        for name in os.listdir(family_dir):
+            meta_path: str = os.path.join(family_dir, name, 'meta.json')
+            try:
+                with open(meta_path, 'r', encoding='UTF-8') as file:
+                    meta: dict = json.load(file)
+            except (OSError, ValueError):
+                continue
+            meta['path'] = os.path.join(family_dir, name)
+            entries.append(meta)
+        return entries
+
+    def covers(self, meta: dict, start: np.datetime64 | None, end: np.datetime64 | None) -> bool:
+        """
+        Checks if an entry contains all rows of a date range.
+
+        Parameters:
+        - meta (dict): The metadata of the entry.
+        - start (np.datetime64 | None): The first minute of the range or None for the first bar of the symbol.
+        - end (np.datetime64 | None): The last minute of the range or None for the newest bar of the symbol.
+
+        Returns:
+        - bool: True if the range can be sliced from the entry.
+        """
+        if meta['start'] is not None and (start is None or start < np.datetime64(meta['start'], 'm')):
+            return False
+        return end is not None and end <= np.datetime64(meta['covered_end'], 'm')
+
+    def get(self, symbol: str, feature_names: list[str], min_date=None, max_date=None, remove_zeros: bool = True,
+            pipeline_version: int = 1) -> dict | None:
+        """
+        Returns the prepared arrays of a date range if an entry covers it. The arrays are read-only memory-mapped
+        views of the entry and the feature columns are returned in the requested order.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - feature_names (list[str]): The names of the feature columns in the expected order.
+        - min_date (optional): The first date of the range (inclusive). Defaults to None.
+        - max_date (optional): The last date of the range (inclusive). Defaults to None.
+        - remove_zeros (bool, optional): Whether rows with a return of zero are removed. Defaults to True.
+        - pipeline_version (int, optional): The version of the preparation pipeline. Defaults to 1.
+
+        Returns:
+        - dict | None: A dictionary with 'features', 'target', 'timestamps' and 'feature_names' or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        start, end = self.to_minute(min_date), self.to_minute(max_date)
+        family_dir: str = self.get_family_dir(symbol, feature_names, remove_zeros, pipeline_version)
+        candidates: list[dict] = [meta for meta in self.load_entries(family_dir) if self.covers(meta, start, end)]
+        if not candidates:
+            return None
+        # The smallest entry which covers the range needs the fewest pages
+        meta: dict = min(candidates, key=lambda entry: entry['size'])
+        try:
+            arrays: dict = {name: np.load(os.path.join(meta['path'], f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        except FileNotFoundError:
+            # The entry was evicted by another process meanwhile
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'get: Entry {meta["path"]} could not be read, removing it: {str(e)}')
+            shutil.rmtree(meta['path'], ignore_errors=True)
+            return None
+        try:
+            os.utime(os.path.join(meta['path'], 'meta.json'))
+        except FileNotFoundError:
+            # The entry was evicted by another process meanwhile
+            return None
+
+        timestamps: np.ndarray = arrays['timestamps']
+        first: int = 0 if start is None else int(np.searchsorted(timestamps, start.astype('datetime64[ns]'), side='left'))
+        last: int = int(np.searchsorted(timestamps, (end + np.timedelta64(1, 'm')).astype('datetime64[ns]'), side='left'))
+        features: np.ndarray = arrays['features'][first:last]
+        if meta['feature_names'] != feature_names:
+            features = features[:, [meta['feature_names'].index(name) for name in feature_names]]
+        self.logger.info(f'get: {last - first} rows of {symbol} from {meta["path"]}')
+        return {
+            'features': features,
+            'target': arrays['target'][first:last],
+            'timestamps': timestamps[first:last],
+            'feature_names': list(feature_names),
+        }
+
+    def put(self, symbol: str, feature_names: list[str], min_date, max_date, remove_zeros: bool, pipeline_version: int,
+            features: np.ndarray, target: np.ndarray, timestamps: np.ndarray) -> str | None:
+        """
+        Stores the prepared arrays of a date range. The entry is written into a temporary directory and renamed when
+        it is complete, so concurrent readers never see a partial entry. Ranges which are not settled yet are stored,
+        but only requests up to the settled part are served from the entry.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - feature_names (list[str]): The names of the feature columns in the order of the columns of 'features'.
+        - min_date: The first date of the range (inclusive) or None.
+        - max_date: The last date of the range (inclusive) or None.
+        - remove_zeros (bool): Whether rows with a return of zero were removed.
+        - pipeline_version (int): The version of the preparation pipeline.
+        - features (np.ndarray): The features.
+        - target (np.ndarray): The targets.
+        - timestamps (np.ndarray): The timestamps of the rows in ascending order.
+
+        Returns:
+        - str | None: The directory of the entry or None if nothing was stored.
+        """
+        if not self.enabled:
+            return None
+        size: int = features.nbytes + target.nbytes + timestamps.nbytes
+        if size > self.config.dataset_cache.max_bytes:
+            return None
+
+        # The bars are stored with UTC timestamps
+        now: datetime.datetime = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        settled: np.datetime64 = self.to_minute(now - datetime.timedelta(minutes=self.config.dataset_cache.settle_minutes))
+        end: np.datetime64 | None = self.to_minute(max_date)
+        covered_end: np.datetime64 = settled if end is None else min(end, settled)
+        start: np.datetime64 | None = self.to_minute(min_date)
+        if start is not None and covered_end < start:
+            return None
+
+        family_dir: str = self.get_family_dir(symbol, feature_names, remove_zeros, pipeline_version)
+        entry_dir: str = os.path.join(family_dir, uuid.uuid4().hex)
+        build_dir: str = os.path.join(family_dir, f'.build_{uuid.uuid4().hex}')
+        os.makedirs(build_dir)
+        try:
+            np.save(os.path.join(build_dir, 'features.npy'), np.ascontiguousarray(features))
+            np.save(os.path.join(build_dir, 'target.npy'), np.ascontiguousarray(target))
+            np.save(os.path.join(build_dir, 'timestamps.npy'), np.asarray(timestamps, dtype='datetime64[ns]'))
+            meta: dict = {
+                'symbol': symbol.lower(),
+                'feature_names': list(feature_names),
+                'remove_zeros': bool(remove_zeros),
+                'pipeline_version': pipeline_version,
+                'start': None if start is None else str(start),
+                'end': None if end is None else str(end),
+                'covered_end': str(covered_end),
+                'rows': len(target),
+                'size': size,
+                'created': datetime.datetime.now().isoformat(),
+            }
+            with open(os.path.join(build_dir, 'meta.json'), 'w', encoding='UTF-8') as file:
+                json.dump(meta, file)
+            os.replace(build_dir, entry_dir)
+        except OSError as e:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            self.logger.error(f'put: Entry of {symbol} could not be stored: {str(e)}')
+            return None
+
+        self.logger.info(f'put: Stored {len(target)} rows of {symbol} from {meta["start"]} to {meta["covered_end"]} in {entry_dir}')
+        self.evict()
+        return entry_dir
+
+    def get_all_entries(self) -> list[dict]:
+        """
+        Loads the metadata of all entries of the cache.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list[dict]: The metadata of the entries, including their directory under 'path'.
+        """
+        entries: list[dict] = []
+        if not os.path.isdir(self.path):
+            return entries
+        for symbol in os.listdir(self.path):
+            symbol_dir: str = os.path.join(self.path, symbol)
+            if not os.path.isdir(symbol_dir):
+                continue
+            for family in os.listdir(symbol_dir):
+                entries += self.load_entries(os.path.join(symbol_dir, family))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used entries until the cache fits into dataset_cache.max_bytes. Readers which
+        still map the files of a removed entry keep their data until they release it.
+
+        Parameters:
+        - None
+
+        Returns:
+        - int: The number of removed entries.
+        """
+        entries: list[dict] = self.get_all_entries()
+        total_size: int = sum(entry['size'] for entry in entries)
+        removed: int = 0
+        for entry in sorted(entries, key=lambda entry: os.path.getmtime(os.path.join(entry['path'], 'meta.json'))):
+            if total_size <= self.config.dataset_cache.max_bytes:
+                break
+            shutil.rmtree(entry['path'], ignore_errors=True)
+            total_size -= entry['size']
+            removed += 1
+        if removed:
+            self.logger.info(f'evict: Removed {removed} entries, {total_size / 1024 ** 2:.1f} MB remain')
+        return removed
+
+    def invalidate(self, symbol: str, start=None, end=None) -> int:
+        """
+        Removes all entries of a symbol which contain bars of a date range, e.g. after the range was rewritten in the
+        database.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - start (optional): The first date of the rewritten range. Defaults to the first bar.
+        - end (optional): The last date of the rewritten range. Defaults to the newest bar.
+
+        Returns:
+        - int: The number of removed entries.
+        """
+        symbol_dir: str = os.path.join(self.path, symbol.lower())
+        if not os.path.isdir(symbol_dir):
+            return 0
+        start, end = self.to_minute(start), self.to_minute(end)
+        removed: int = 0
+        for family in os.listdir(symbol_dir):
+            for meta in self.load_entries(os.path.join(symbol_dir, family)):
+                entry_end: np.datetime64 | None = None if meta['end'] is None else np.datetime64(meta['end'], 'm')
+                entry_start: np.datetime64 | None = None if meta['start'] is None else np.datetime64(meta['start'], 'm')
+                if (end is not None and entry_start is not None and entry_start > end) or \
+                   (start is not None and entry_end is not None and entry_end < start):
+                    continue
+                shutil.rmtree(meta['path'], ignore_errors=True)
+                removed += 1
+        if removed:
+            self.logger.info(f'invalidate: Removed {removed} entries of {symbol} between {start} and {end}')
+        return removed
@@ -0,0 +1,103 @@
+"""
+This python module contains the downsampling of price series for the charts.
+
+A chart can not show more points than it has pixels, so long series are reduced to a target number of points before
+they are sent to the browser:
+- 'lttb' (Largest-Triangle-Three-Buckets) keeps the point of every bucket which forms the largest triangle with the
+  point kept in the previous bucket and the average of the next bucket, which preserves the visual shape.
+- 'minmax' keeps the lowest and the highest point of every bucket, which preserves every peak.
+Points which must stay at their exact position (e.g. the bars of trades) are always kept.
+"""
+import numpy as np
+
+MODES: list[str] = ['lttb', 'minmax']
+
+def get_buckets(length: int, number_of_buckets: int) -> np.ndarray:
+    """
+    Splits the indexes between the first and the last point into buckets of equal size.
+
+    Parameters:
+    - length (int): The number of points.
+    - number_of_buckets (int): The number of buckets.
+
+    Returns:
+    - np.ndarray: The bounds of the buckets, bucket i contains the indexes bounds[i] to bounds[i + 1] - 1.
+    """
+    return np.linspace(1, length - 1, number_of_buckets + 1).astype(np.int64)
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Selects points of a series with the Largest-Triangle-Three-Buckets algorithm. The first and the last point are
+    always selected.
+
+    Parameters:
+    - x (np.ndarray): The x values (e.g. epoch seconds), sorted ascending.
+    - y (np.ndarray): The y values.
+    - points (int): The number of selected points.
+
+    Returns:
+    - np.ndarray: The sorted indexes of the selected points.
+    """
+    length: int = len(y)
+    if points >= length:
+        return np.arange(length)
+    points = max(points, 3)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    bounds: np.ndarray = get_buckets(length, points - 2)
+    selected: np.ndarray = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+    previous: int = 0
+    for bucket in range(points - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        next_start, next_end = end, bounds[bucket + 2] if bucket + 2 < len(bounds) else length
+        next_x: float = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        next_y: float = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+        # Twice the area of the triangle of the previous point, each candidate and the average of the next bucket
+        areas: np.ndarray = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas)) if end > start else previous
+        selected[bucket + 1] = previous
+    return np.unique(selected)
+
+def min_max(y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Selects the lowest and the highest point of every bucket of a series. The first and the last point are always
+    selected.
+
+    Parameters:
+    - y (np.ndarray): The y values.
+    - points (int): The maximum number of selected points.
+
+    Returns:
+    - np.ndarray: The sorted indexes of the selected points.
+    """
+    length: int = len(y)
+    if points >= length:
+        return np.arange(length)
+    bounds: np.ndarray = get_buckets(length, max(points - 2, 2) // 2)
+    selected: list[int] = [0, length - 1]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end > start:
+            selected += [start + int(np.argmin(y[start:end])), start + int(np.argmax(y[start:end]))]
+    return np.unique(selected)
+
+def downsample(x: np.ndarray, y: np.ndarray, points: int, mode: str = 'lttb', keep: np.ndarray = None) -> np.ndarray:
+    """
+    Selects at most about 'points' points of a series with one of the MODES.
+
+    Parameters:
+    - x (np.ndarray): The x values (e.g. epoch seconds), sorted ascending.
+    - y (np.ndarray): The y values.
+    - points (int): The target number of points.
+    - mode (str, optional): 'lttb' or 'minmax'. Defaults to 'lttb'.
+    - keep (np.ndarray, optional): Indexes which are selected in addition, e.g. the bars of trades. Defaults to None.
+
+    Returns:
+    - np.ndarray: The sorted indexes of the selected points.
+    """
+    if mode not in MODES:
+        raise ValueError(f'Unknown downsampling mode {mode}, choose one of {", ".join(MODES)}')
+    selected: np.ndarray = lttb(x, y, points) if mode == 'lttb' else min_max(y, points)
+    if keep is not None and len(keep):
+        selected = np.union1d(selected, np.asarray(keep, dtype=np.int64))
+    return selected
@@ -0,0 +1,453 @@
+"""
+This python module contains the shared memory snapshot of the latest bars of a symbol.
+
+The ingestion (BybitData) publishes the last feature_snapshot.capacity bars of every symbol (open, close and all
+technical indicators) and the latest ticker price into a ring buffer in shared memory right after they were written
+to the database. Readers in other threads or processes attach to the buffer by its name and read the latest bars as
+NumPy arrays instead of querying the database. If the buffer does not exist, is stale or does not contain the
+requested bars, the readers fall back to the database.
+
+The buffer is guarded by a sequence number (seqlock): the writer makes the sequence odd before and even after every
+update. Readers copy the data they need and retry if the sequence changed or was odd while reading. Readers which
+keep the zero-copy views returned by FeatureSnapshot.read_views have to check FeatureSnapshot.is_unchanged afterwards.
+
+Every buffer carries the creation id (generation) which the writer stored when it created the buffer. If the
+ingestion restarts, the buffer is recreated under the same name, the writer sets the generation of the old buffer to
+0 before it removes it. Readers re-attach if the generation of their mapping changed and check every
+feature_snapshot.reattach_seconds whether the name still resolves to their buffer.
+
+Layout of the shared memory:
+- header (int64): sequence, count, head, capacity, number of columns, tick timestamp (ns), generation
+- tick (float64): last_price, bid_price, ask_price, bid_size, ask_size, price_change_last_24h
+- timestamps (int64, capacity): the timestamps of the bars in ns
+- values (float64, capacity x number of columns): the columns of the bars
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import time
+import datetime
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from config.config import load_config
+
+HEADER_FIELDS: int = 7
+SEQUENCE, COUNT, HEAD, CAPACITY, NUMBER_OF_COLUMNS, TICK_TIMESTAMP, GENERATION = range(HEADER_FIELDS)
+# The generation of a buffer which was removed by the writer
+RETIRED: int = 0
+TICK_COLUMNS: list[str] = ['last_price', 'bid_price', 'ask_price', 'bid_size', 'ask_size', 'price_change_last_24h']
+
+
+def get_snapshot_columns(config) -> list[str]:
+    """
+    Returns the columns which are stored in the snapshot. They are the columns of the historical price tables
+    without the timestamp.
+
+    Parameters:
+    - config: The configuration of the application.
+
+    Returns:
+    - list[str]: The column names.
+    """
+    columns: list[str] = ['open', 'close']
+    for indicator in config.technical_indicators.indicators:
+        if indicator == 'bollinger_bands':
+            columns += ['lower_bollinger_band', 'upper_bollinger_band']
+        else:
+            columns.append(indicator)
+    return columns
+
+
+class FeatureSnapshot:
+    def __init__(self, symbol: str, create: bool = False, capacity: int = None) -> None:
+        """
+        Initialize the FeatureSnapshot class. The writer creates the shared memory, readers attach to it.
+
+        Parameters:
+        - symbol (str): The symbol whose bars are stored.
+        - create (bool, optional): If True, the shared memory is (re)created, otherwise an existing one is attached.
+          Attaching raises FileNotFoundError if the snapshot does not exist. Defaults to False.
+        - capacity (int, optional): The number of bars which are stored. Defaults to feature_snapshot.capacity.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.symbol: str = symbol.lower()
+        self.name: str = f'ml_trader_{self.symbol}'
+        self.columns: list[str] = get_snapshot_columns(self.config)
+        self.column_index: dict = {column: index for index, column in enumerate(self.columns)}
+        capacity = capacity or self.config.feature_snapshot.capacity
+        size: int = 8 * (HEADER_FIELDS + len(TICK_COLUMNS) + capacity + capacity * len(self.columns))
+
+        if create:
+            try:
+                stale = shared_memory.SharedMemory(name=self.name)
+                # Readers which are still attached to the old buffer re-attach to the new one
+                if stale.size >= 8 * HEADER_FIELDS:
+                    np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=stale.buf)[GENERATION] = RETIRED
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+            # Only the writer owns the shared memory, otherwise it is removed when the first reader exits
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.header: np.ndarray = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[:] = [0, 0, 0, capacity, len(self.columns), 0, time.time_ns()]
+        elif self.header[NUMBER_OF_COLUMNS] != len(self.columns):
+            # E.g. a buffer whose header is not written yet by the writer
+            message: str = f'The snapshot of {self.symbol} has {self.header[NUMBER_OF_COLUMNS]} columns, expected {len(self.columns)}'
+            self.close()
+            raise ValueError(message)
+        self.capacity: int = int(self.header[CAPACITY])
+        capacity = self.capacity
+        self.generation: int = int(self.header[GENERATION])
+
+        offset: int = 8 * HEADER_FIELDS
+        self.tick: np.ndarray = np.ndarray(len(TICK_COLUMNS), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * len(TICK_COLUMNS)
+        self.timestamps: np.ndarray = np.ndarray(capacity, dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * capacity
+        self.values: np.ndarray = np.ndarray((capacity, len(self.columns)), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+
+    def close(self) -> None:
+        """
+        Releases the views and detaches from the shared memory.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.header = self.tick = self.timestamps = self.values = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds views returned by read_views, the mapping is released with the last view
+            pass
+
+    def __del__(self) -> None:
+        # A snapshot which was replaced by FeatureSnapshotReader is detached once the last thread which reads it
+        # released it, instead of while another thread is still inside read
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def unlink(self) -> None:
+        """
+        Marks the shared memory as retired, so attached readers re-attach, and removes it. Called by the writer when
+        it shuts down.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.header[GENERATION] = RETIRED
+        self.close()
+        self.shm.unlink()
+
+    def is_retired(self) -> bool:
+        """
+        Checks if the writer removed the shared memory of this mapping, e.g. because the ingestion restarted.
+
+        Parameters:
+        - None
+
+        Returns:
+        - bool: True if the mapping is not the current snapshot anymore.
+        """
+        return int(self.header[GENERATION]) != self.generation
+
+    def is_current(self) -> bool:
+        """
+        Checks if the name of the snapshot still resolves to the shared memory of this mapping. Detects a buffer which
+        was removed without being marked as retired, e.g. if the writer was killed and the buffer removed by hand.
+
+        Parameters:
+        - None
+
+        Returns:
+        - bool: True if the named shared memory exists and has the generation of this mapping.
+        """
+        try:
+            current = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        try:
+            resource_tracker.unregister(current._name, 'shared_memory')
+            if current.size < 8 * HEADER_FIELDS:
+                return False
+            header: np.ndarray = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=current.buf)
+            generation: int = int(header[GENERATION])
+            del header
+            return generation == self.generation
+        finally:
+            current.close()
+
+    def get_order(self) -> np.ndarray:
+        """
+        Returns the physical positions of the stored bars from the oldest to the newest bar.
+
+        Parameters:
+        - None
+
+        Returns:
+        - np.ndarray: The positions in the ring buffer.
+        """
+        count, head, capacity = int(self.header[COUNT]), int(self.header[HEAD]), int(self.header[CAPACITY])
+        return (head - count + np.arange(count)) % capacity
+
+    def publish(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Writes bars into the ring buffer. Bars which are newer than the newest stored bar are appended and overwrite
+        the oldest bar if the buffer is full. Bars which are already stored are updated in place.
+
+        Parameters:
+        - timestamps (np.ndarray): The timestamps of the bars as datetime64[ns], ascending.
+        - values (np.ndarray): The columns of the bars in the order of self.columns, shape (bars, columns).
+
+        Returns:
+        - None
+        """
+        timestamps = np.asarray(timestamps, dtype='datetime64[ns]').astype(np.int64)
+        capacity: int = int(self.header[CAPACITY])
+        self.header[SEQUENCE] += 1
+        try:
+            order: np.ndarray = self.get_order()
+            stored: np.ndarray = self.timestamps[order]
+            newest: int = int(stored[-1]) if len(stored) else np.iinfo(np.int64).min
+            for timestamp, row in zip(timestamps, values):
+                if timestamp <= newest:
+                    position: int = int(np.searchsorted(stored, timestamp))
+                    if position < len(stored) and stored[position] == timestamp:
+                        self.values[order[position]] = row
+                    continue
+                head: int = int(self.header[HEAD])
+                self.timestamps[head] = timestamp
+                self.values[head] = row
+                self.header[HEAD] = (head + 1) % capacity
+                self.header[COUNT] = min(int(self.header[COUNT]) + 1, capacity)
+                newest = int(timestamp)
+        finally:
+            self.header[SEQUENCE] += 1
+
+    def publish_tick(self, timestamp: datetime.datetime, tick: tuple) -> None:
+        """
+        Writes the latest ticker price.
+
+        Parameters:
+        - timestamp (datetime.datetime): The time of the ticker price.
+        - tick (tuple): The values in the order of TICK_COLUMNS.
+
+        Returns:
+        - None
+        """
+        self.header[SEQUENCE] += 1
+        try:
+            self.header[TICK_TIMESTAMP] = np.datetime64(timestamp, 'ns').astype(np.int64)
+            self.tick[:] = tick
+        finally:
+            self.header[SEQUENCE] += 1
+
+    def is_unchanged(self, sequence: int) -> bool:
+        """
+        Checks if the buffer was not written since the sequence number was read.
+
+        Parameters:
+        - sequence (int): The sequence number returned by read_views.
+
+        Returns:
+        - bool: True if the views read with this sequence number are still consistent.
+        """
+        return sequence % 2 == 0 and int(self.header[SEQUENCE]) == sequence
+
+    def read_views(self, number_of_bars: int) -> tuple[int, np.ndarray, np.ndarray] | None:
+        """
+        Returns zero-copy views of the newest bars. Views are only possible if the bars are stored contiguously,
+        otherwise None is returned and read has to be used.
+
+        Parameters:
+        - number_of_bars (int): The number of bars.
+
+        Returns:
+        - tuple[int, np.ndarray, np.ndarray] | None: The sequence number, the timestamps (int64 ns) and the values of the bars.
+        """
+        sequence: int = int(self.header[SEQUENCE])
+        count, head = int(self.header[COUNT]), int(self.header[HEAD])
+        if sequence % 2 == 1 or number_of_bars > count or number_of_bars > head:
+            return None
+        return sequence, self.timestamps[head - number_of_bars:head], self.values[head - number_of_bars:head]
+
+    def read(self, number_of_bars: int, columns: list[str] = None, retries: int = 10) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Copies the newest bars out of the buffer.
+
+        Parameters:
+        - number_of_bars (int): The number of bars.
+        - columns (list[str], optional): The columns which are returned. Defaults to all columns.
+        - retries (int, optional): How often the read is repeated if the writer updated the buffer meanwhile. Defaults to 10.
+
+        Returns:
+        - tuple[np.ndarray, np.ndarray] | None: The timestamps (datetime64[ns]) and the values of the bars from the oldest
+          to the newest bar, or None if fewer bars are stored, the snapshot is stale or no consistent read was possible.
+        """
+        column_indexes: list[int] | slice = slice(None) if columns is None else [self.column_index[column] for column in columns]
+        for _ in range(retries):
+            sequence: int = int(self.header[SEQUENCE])
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            order: np.ndarray = self.get_order()
+            if len(order) < number_of_bars:
+                return None
+            order = order[len(order) - number_of_bars:]
+            timestamps: np.ndarray = self.timestamps[order].astype('datetime64[ns]')
+            values: np.ndarray = self.values[order][:, column_indexes]
+            if int(self.header[SEQUENCE]) == sequence:
+                # The bars are stored with UTC timestamps
+                if len(timestamps) and self.is_stale(timestamps[-1], datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)):
+                    return None
+                return timestamps, values
+        return None
+
+    def read_tick(self) -> tuple[datetime.datetime, np.ndarray] | None:
+        """
+        Copies the latest ticker price out of the buffer.
+
+        Parameters:
+        - None
+
+        Returns:
+        - tuple[datetime.datetime, np.ndarray] | None: The time and the values (in the order of TICK_COLUMNS) of the
+          latest ticker price, or None if no ticker price was published or it is stale.
+        """
+        for _ in range(10):
+            sequence: int = int(self.header[SEQUENCE])
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            timestamp: int = int(self.header[TICK_TIMESTAMP])
+            tick: np.ndarray = self.tick.copy()
+            if int(self.header[SEQUENCE]) == sequence:
+                if timestamp == 0 or self.is_stale(np.datetime64(timestamp, 'ns'), datetime.datetime.now()):
+                    return None
+                return np.datetime64(timestamp, 'ns').astype('datetime64[us]').astype(datetime.datetime), tick
+        return None
+
+    def is_stale(self, timestamp: np.datetime64, now: datetime.datetime) -> bool:
+        """
+        Checks if the newest data is older than feature_snapshot.max_age_seconds, e.g. because the ingestion stopped.
+
+        Parameters:
+        - timestamp (np.datetime64): The timestamp of the newest data.
+        - now (datetime.datetime): The current time in the same time zone as the timestamp.
+
+        Returns:
+        - bool: True if the data is too old to be used.
+        """
+        age: np.timedelta64 = np.datetime64(now, 'ns') - timestamp
+        return age > np.timedelta64(int(self.config.feature_snapshot.max_age_seconds), 's')
+
+
+class FeatureSnapshotReader:
+    def __init__(self) -> None:
+        """
+        Initialize the FeatureSnapshotReader class, which attaches lazily to the snapshots of all symbols.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.snapshots: dict = {}
+        # Time (time.monotonic) at which the name of the snapshot of a symbol was last resolved: {symbol: seconds}
+        self.checked: dict = {}
+        # The reader is shared by the request threads of the web server and by the prediction threads
+        self.lock: threading.Lock = threading.Lock()
+
+    def get(self, symbol: str) -> FeatureSnapshot | None:
+        """
+        Returns the snapshot of a symbol. A snapshot which was retired by the writer, or whose name resolves to
+        another buffer (checked every feature_snapshot.reattach_seconds), is replaced by the current one. The replaced
+        snapshot is not closed here, because other threads may still read it, it is detached with its last reference.
+
+        Parameters:
+        - symbol (str): The symbol.
+
+        Returns:
+        - FeatureSnapshot | None: The snapshot or None if snapshots are disabled or the snapshot does not exist.
+        """
+        if not self.config.feature_snapshot.enabled:
+            return None
+        symbol = symbol.lower()
+        with self.lock:
+            snapshot: FeatureSnapshot | None = self.snapshots.get(symbol)
+            now: float = time.monotonic()
+            if snapshot is not None:
+                outdated: bool = snapshot.is_retired()
+                if not outdated and now - self.checked.get(symbol, 0.0) >= self.config.feature_snapshot.reattach_seconds:
+                    self.checked[symbol] = now
+                    outdated = not snapshot.is_current()
+                if not outdated:
+                    return snapshot
+                self.snapshots.pop(symbol, None)
+            try:
+                snapshot = FeatureSnapshot(symbol)
+            except (FileNotFoundError, ValueError):
+                # The ingestion did not publish the symbol yet, try again with the next read
+                return None
+            self.snapshots[symbol] = snapshot
+            self.checked[symbol] = now
+            return snapshot
+
+    def read(self, symbol: str, number_of_bars: int, columns: list[str] = None) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Copies the newest bars of a symbol out of its snapshot.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - number_of_bars (int): The number of bars.
+        - columns (list[str], optional): The columns which are returned. Defaults to all columns.
+
+        Returns:
+        - tuple[np.ndarray, np.ndarray] | None: The timestamps and the values of the bars, or None on a cache miss.
+        """
+        snapshot: FeatureSnapshot | None = self.get(symbol)
+        if snapshot is None or (columns is not None and any(column not in snapshot.column_index for column in columns)):
+            return None
+        return snapshot.read(number_of_bars, columns)
+
+    def read_tick(self, symbol: str) -> tuple[datetime.datetime, np.ndarray] | None:
+        """
+        Copies the latest ticker price of a symbol out of its snapshot.
+
+        Parameters:
+        - symbol (str): The symbol.
+
+        Returns:
+        - tuple[datetime.datetime, np.ndarray] | None: The time and the values of the ticker price, or None on a cache miss.
+        """
+        snapshot: FeatureSnapshot | None = self.get(symbol)
+        if snapshot is None:
+            return None
+        return snapshot.read_tick()
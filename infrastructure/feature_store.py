@@ -0,0 +1,314 @@
+"""
+This python module contains the columnar feature store which keeps the historical price tables on disk.
+
+Every column of a symbol table (open, close and the technical indicators) is stored in its own file of float64
+values. The row of a bar is its minute offset from the first bar of the symbol (the epoch), so every time range is
+a constant time slice of the files, and minutes without a bar contain NaN. The files are read through np.memmap, so
+training, validation folds and backtests in any number of processes share the pages of the operating system cache
+instead of querying the database.
+
+The ingestion appends every bar it writes to the database (BybitData.insert_historical_data). A store is only used
+by readers after it was built once from the database with rebuild, which is done on startup for symbols without a
+store and can be repeated with:
+    python infrastructure/feature_store.py --rebuild BTCUSD
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+path_to_config += f'{os.sep}config'
+
+import json
+import uuid
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from config.config import load_config
+from infrastructure.logger import create_logger
+from infrastructure.feature_snapshot import get_snapshot_columns
+
+MINUTE: np.timedelta64 = np.timedelta64(1, 'm')
+
+class FeatureStore:
+    def __init__(self, path: str = None) -> None:
+        """
+        Initialize the FeatureStore class.
+
+        Parameters:
+        - path (str, optional): The directory of the store. Defaults to feature_store.path of the config.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.logger = create_logger('feature_store.log')
+        self.path: str = path or self.config.feature_store.path.replace(f'{os.sep}config', '')
+        self.columns: list[str] = get_snapshot_columns(self.config)
+
+    def get_symbol_dir(self, symbol: str) -> str:
+        """
+        Returns the directory which contains the column files of a symbol.
+
+        Parameters:
+        - symbol (str): The symbol.
+
+        Returns:
+        - str: The directory.
+        """
+        return os.path.join(self.path, symbol.lower())
+
+    def get_column_path(self, symbol: str, column: str) -> str:
+        """
+        Returns the file of a column of a symbol.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - column (str): The column.
+
+        Returns:
+        - str: The location of the file.
+        """
+        return os.path.join(self.get_symbol_dir(symbol), f'{column}.f64')
+
+    def load_meta(self, symbol: str) -> dict | None:
+        """
+        Loads the metadata of a symbol: the epoch (first minute), the number of rows, the columns and whether the
+        store was built from the database.
+
+        Parameters:
+        - symbol (str): The symbol.
+
+        Returns:
+        - dict | None: The metadata or None if the symbol has no store yet.
+        """
+        meta_path: str = os.path.join(self.get_symbol_dir(symbol), 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='UTF-8') as file:
+            meta: dict = json.load(file)
+        meta['epoch'] = np.datetime64(meta['epoch'], 'm')
+        return meta
+
+    def save_meta(self, symbol: str, meta: dict) -> None:
+        """
+        Writes the metadata of a symbol atomically, so readers never see a partially written file.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - meta (dict): The metadata.
+
+        Returns:
+        - None
+        """
+        directory: str = self.get_symbol_dir(symbol)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='UTF-8') as file:
+            json.dump({**meta, 'epoch': str(meta['epoch'])}, file)
+        os.replace(temporary_path, os.path.join(directory, 'meta.json'))
+
+    def write(self, symbol: str, timestamps: np.ndarray, values: np.ndarray, meta: dict = None) -> dict | None:
+        """
+        Writes bars into the store. Bars after the last row extend the files (minutes in between are filled with NaN),
+        bars which are already stored are overwritten. Bars before the epoch can not be stored, the store is marked
+        as not built in that case and has to be rebuilt.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - timestamps (np.ndarray): The timestamps of the bars.
+        - values (np.ndarray): The columns of the bars in the order of self.columns, shape (bars, columns).
+        - meta (dict, optional): The current metadata, loaded if None. Defaults to None.
+
+        Returns:
+        - dict | None: The updated metadata or None if nothing was written.
+        """
+        if len(timestamps) == 0:
+            return meta
+        minutes: np.ndarray = np.asarray(timestamps, dtype='datetime64[m]')
+        os.makedirs(self.get_symbol_dir(symbol), exist_ok=True)
+        meta = meta or self.load_meta(symbol)
+        if meta is None:
+            meta = {'epoch': minutes.min(), 'length': 0, 'columns': self.columns, 'built': False}
+
+        if meta['columns'] != self.columns:
+            self.logger.warning(f'write: The columns of the store of {symbol} differ from the configured indicators, the store has to be rebuilt')
+            meta['built'] = False
+            self.save_meta(symbol, meta)
+            return meta
+
+        offsets: np.ndarray = (minutes - meta['epoch']) // MINUTE
+        if (offsets < 0).any():
+            self.logger.warning(f'write: Bars of {symbol} before {meta["epoch"]} were not stored, the store has to be rebuilt')
+            meta['built'] = False
+            keep: np.ndarray = offsets >= 0
+            offsets, values = offsets[keep], values[keep]
+            if len(offsets) == 0:
+                self.save_meta(symbol, meta)
+                return meta
+
+        length: int = max(int(meta['length']), int(offsets.max()) + 1)
+        for index, column in enumerate(meta['columns']):
+            column_path: str = self.get_column_path(symbol, column)
+            with open(column_path, 'ab') as file:
+                missing_rows: int = length - file.tell() // 8
+                if missing_rows > 0:
+                    file.write(np.full(missing_rows, np.nan, dtype=np.float64).tobytes())
+            column_values: np.ndarray = np.memmap(column_path, dtype=np.float64, mode='r+', shape=(length,))
+            column_values[offsets] = values[:, index]
+            column_values.flush()
+            del column_values
+
+        meta['length'] = length
+        self.save_meta(symbol, meta)
+        return meta
+
+    def append_frame(self, symbol: str, data: pd.DataFrame) -> None:
+        """
+        Writes bars as inserted into the database by BybitData.insert_historical_data into the store.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - data (pd.DataFrame): The bars with a timestamp column and all columns of the store (case insensitive).
+
+        Returns:
+        - None
+        """
+        data = data.rename(columns=str.lower)
+        if data.empty or any(column not in data.columns for column in self.columns):
+            return
+        self.write(symbol, data['timestamp'].to_numpy(dtype='datetime64[ns]'), data[self.columns].to_numpy(dtype=np.float64))
+
+    def get_range(self, meta: dict, start=None, end=None) -> tuple[int, int]:
+        """
+        Converts a time range into a range of rows. Both ends are inclusive and rounded down to the minute like the
+        date conditions of PrepareTrainingData.
+
+        Parameters:
+        - meta (dict): The metadata of the symbol.
+        - start (optional): The start of the range. Defaults to the first row.
+        - end (optional): The end of the range. Defaults to the last row.
+
+        Returns:
+        - tuple[int, int]: The first row and the row after the last row.
+        """
+        first: int = 0 if start is None else int((np.datetime64(pd.Timestamp(start).floor('min'), 'm') - meta['epoch']) // MINUTE)
+        last: int = int(meta['length']) if end is None else int((np.datetime64(pd.Timestamp(end).floor('min'), 'm') - meta['epoch']) // MINUTE) + 1
+        return max(first, 0), min(last, int(meta['length']))
+
+    def covers(self, symbol: str, columns: list[str], start=None, end=None) -> bool:
+        """
+        Checks if the store can answer a query instead of the database: it was built from the database, contains
+        all columns and the range does not reach before its epoch.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - columns (list[str]): The requested columns.
+        - start (optional): The start of the range. Defaults to None.
+        - end (optional): The end of the range. Defaults to None.
+
+        Returns:
+        - bool: True if the store can be used.
+        """
+        if not self.config.feature_store.enabled:
+            return False
+        meta: dict | None = self.load_meta(symbol)
+        if meta is None or not meta['built'] or any(column not in meta['columns'] for column in columns):
+            return False
+        return start is None or np.datetime64(pd.Timestamp(start).floor('min'), 'm') >= meta['epoch']
+
+    def read(self, symbol: str, columns: list[str], start=None, end=None) -> tuple[np.ndarray, dict] | None:
+        """
+        Returns zero-copy views of columns within a time range.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - columns (list[str]): The requested columns.
+        - start (optional): The start of the range (inclusive). Defaults to the first row.
+        - end (optional): The end of the range (inclusive). Defaults to the last row.
+
+        Returns:
+        - tuple[np.ndarray, dict] | None: The timestamps (datetime64[ns]) of the rows and a dictionary with a read-only
+          memory-mapped view per column, or None if the store does not cover the query. Rows of minutes without a bar
+          contain NaN.
+        """
+        if not self.covers(symbol, columns, start, end):
+            return None
+        meta: dict = self.load_meta(symbol)
+        first, last = self.get_range(meta, start, end)
+        last = max(first, last)
+        timestamps: np.ndarray = (meta['epoch'] + np.arange(first, last) * MINUTE).astype('datetime64[ns]')
+        views: dict = {}
+        for column in columns:
+            if meta['length'] == 0:
+                views[column] = np.empty(0, dtype=np.float64)
+                continue
+            views[column] = np.memmap(self.get_column_path(symbol, column), dtype=np.float64, mode='r', shape=(int(meta['length']),))[first:last]
+        return timestamps, views
+
+    def rebuild(self, symbol: str, db, chunk_size: int = 100_000) -> int:
+        """
+        Builds the store of a symbol from its table in the database. The new store is written next to the old one
+        and replaces it when it is complete.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - db (Database): The database which contains the symbol table.
+        - chunk_size (int, optional): The number of rows which are fetched at once. Defaults to 100_000.
+
+        Returns:
+        - int: The number of rows of the new store.
+        """
+        target_dir: str = self.get_symbol_dir(symbol)
+        build_store: FeatureStore = FeatureStore(os.path.join(self.path, f'.build_{uuid.uuid4().hex}'))
+        selected_columns: str = ','.join(['"timestamp"'] + [f'"{column}"' for column in self.columns])
+        cursor = db.connection.cursor(name=f'feature_store_{uuid.uuid4().hex}')
+        cursor.itersize = chunk_size
+        meta: dict | None = None
+        try:
+            cursor.execute(f'SELECT {selected_columns} FROM {symbol.lower()} ORDER BY timestamp')
+            while True:
+                rows: list = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                timestamps: np.ndarray = np.array([row[0] for row in rows], dtype='datetime64[ns]')
+                values: np.ndarray = np.array([row[1:] for row in rows], dtype=np.float64)
+                meta = build_store.write(symbol, timestamps, values, meta)
+        finally:
+            cursor.close()
+            db.commit()
+
+        if meta is None:
+            shutil.rmtree(build_store.path, ignore_errors=True)
+            self.logger.info(f'rebuild: {symbol} has no data, no store was built')
+            return 0
+        meta['built'] = True
+        build_store.save_meta(symbol, meta)
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        os.makedirs(self.path, exist_ok=True)
+        os.replace(build_store.get_symbol_dir(symbol), target_dir)
+        shutil.rmtree(build_store.path, ignore_errors=True)
+        self.logger.info(f'rebuild: Built the store of {symbol} with {meta["length"]} rows from {meta["epoch"]}')
+        return int(meta['length'])
+
+
+if __name__ == '__main__':
+    import argparse
+    from infrastructure.database import Database
+
+    parser = argparse.ArgumentParser(description='Rebuild the columnar feature store from the database.')
+    parser.add_argument('--rebuild', type=str, nargs='+', required=True, help='The symbols which are rebuilt.')
+    args = parser.parse_args()
+
+    store = FeatureStore()
+    database = Database()
+    for symbol_to_rebuild in args.rebuild:
+        rows = store.rebuild(symbol_to_rebuild, database, store.config.training.chunk_size)
+        print(f'{symbol_to_rebuild}: {rows} rows')
@@ -7,7 +7,7 @@ The GapFiller class provides the following functionalities:
 2. Fetching data from the database after a specified gap start timestamp and deleting it.
 3. Downloading missing historical data for a given gap.
 4. Inserting newly downloaded data into the database.
-5. Reinserting temporarily stored data into the database.
+5. Reinserting temporarily stored data into the database and invalidating the cached training data of the rewritten range.
 6. Checking if the timestamps in the database for a given symbol are consecutive and in order.
 7. Verifying the historical data by plotting the closing prices over time using matplotlib.
 
@@ -44,6 +44,7 @@ import pandas as pd
 from infrastructure.logger import create_logger
 from infrastructure.bybit_data import BybitData
 from infrastructure.database import Database
+from infrastructure.dataset_cache import DatasetCache
 
 
 class GapFiller:
@@ -58,11 +59,13 @@ class GapFiller:
         logger (Logger): An instance of the Logger class for logging messages.
         db (Database): An instance of the Database class for interacting with the database.
         bd (BybitData): An instance of the BybitData class for fetching historical data from Bybit.
+        dataset_cache (DatasetCache): The cache of prepared training data, which is invalidated for rewritten ranges.
         """
         self.logger = create_logger('gap_filler.log')
         self.logger.info('-'*100)
         self.db = Database()
         self.bd = BybitData()
+        self.dataset_cache = DatasetCache()
 
     def fetch_gaps(self, symbol: str) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
         """
@@ -160,6 +163,14 @@ class GapFiller:
             self.bd.insert_historical_data(symbol.upper(), temp_data)
             self.logger.info(f"Reinsertion took {time.time() - start_time:.2f} seconds.")
 
+            # Step 5: Remove the cached training datasets which contain the rewritten bars
+            self.dataset_cache.invalidate(symbol, start=gap_start)
+
+            # Step 6: Aggregate the bars of the higher timeframes which contain the rewritten bars again
+            start_time: float = time.time()
+            self.bd.aggregator.rebuild_from(symbol, gap_start)
+            self.logger.info(f"Aggregation of the higher timeframes took {time.time() - start_time:.2f} seconds.")
+
             self.logger.info(f"Process for whole gap took {time.time() - start_time_gap:.2f} seconds.")
 
         self.logger.info(f"Filling all gaps took {round(time.time() - start_time_overall, 2)} seconds.")
@@ -249,4 +260,5 @@ class GapFiller:
                                     symbol=symbol.upper()
                                 )
         self.bd.insert_historical_data(symbol.upper(), new_data)
+        self.dataset_cache.invalidate(symbol, start=newest_date_in_database)
         self.logger.info(f"Downloaded {len(new_data)} new rows of data for {symbol}.")
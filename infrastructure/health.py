@@ -0,0 +1,91 @@
+"""
+This python module contains a small HTTP server which reports the health of a role process (ingestion, execution or
+training) started by supervisor.py. The web role reports its health through the route /api/health instead.
+"""
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class HealthServer:
+    def __init__(self, role: str, host: str, port: int, threads: list[threading.Thread], progress=None, max_progress_age: float = None) -> None:
+        """
+        Initialize the HealthServer class.
+
+        Parameters:
+        - role (str): The name of the role of the process.
+        - host (str): The host the server listens on.
+        - port (int): The port the server listens on.
+        - threads (list[threading.Thread]): The threads which do the work of the role. The role is healthy as long as all of them are alive.
+        - progress (callable, optional): Returns the time (time.time()) of the last iteration of the loop of the role, so
+          a loop which hangs while its thread is alive is detected. Defaults to None (not checked).
+        - max_progress_age (float, optional): The role is failing if its last iteration is older than this many seconds.
+          Defaults to None (not checked).
+
+        Returns:
+        - None
+        """
+        self.role = role
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.progress = progress
+        self.max_progress_age = max_progress_age
+        self.started: float = time.time()
+
+    def get_status(self) -> dict:
+        """
+        Returns the health of the role.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dict: A dictionary containing the role, the process id, the uptime in seconds, the status ('ok' or 'failing'),
+          the state of every thread and the seconds since the last iteration of the loop of the role.
+        """
+        threads: dict = {thread.name: thread.is_alive() for thread in self.threads}
+        progress_age: float | None = time.time() - self.progress() if self.progress is not None else None
+        stalled: bool = progress_age is not None and self.max_progress_age is not None and progress_age > self.max_progress_age
+        return {
+            'role': self.role,
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started, 1),
+            'status': 'ok' if all(threads.values()) and not stalled else 'failing',
+            'threads': threads,
+            'progress_age': None if progress_age is None else round(progress_age, 1)
+        }
+
+    def start(self) -> None:
+        """
+        Starts the HTTP server in a daemon thread. GET /health returns the status as JSON with status code 200 if
+        the role is healthy and 503 otherwise.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        health_server = self
+
+        class HealthRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.rstrip('/') != '/health':
+                    self.send_error(404)
+                    return
+                status: dict = health_server.get_status()
+                body: bytes = json.dumps(status).encode()
+                self.send_response(200 if status['status'] == 'ok' else 503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                # Health checks are polled frequently, do not write them to stderr
+                pass
+
+        server = ThreadingHTTPServer((self.host, self.port), HealthRequestHandler)
+        threading.Thread(target=server.serve_forever, name=f'{self.role}_health', daemon=True).start()
@@ -0,0 +1,332 @@
+"""
+This python module contains the indicator engine which computes technical indicators with parameters of a bot.
+
+The symbol tables only contain the technical indicators of config.technical_indicators with their configured
+parameters. A bot can declare its own parameters in its list of technical indicators, e.g.
+"moving_average:50,rsi:7,bollinger_bands:20:2". The parameters follow the name in the order of
+INDICATOR_PARAMETERS (see infrastructure/technical_indicators.py) and omitted parameters default to the config.
+Indicators whose parameters equal the configuration are read from the stored columns. All others are computed on
+demand from the stored open prices with TechnicalIndicators.calc_fused, like the ingestion computes the stored
+columns, and are named after their parameters, e.g. 'rsi_7' or 'lower_bollinger_band_20_2'.
+
+Computed columns are memoized per symbol and column, so bots with identical parameters share them: a training range
+is computed once and sliced for every range it contains, and the value of the newest bar is computed once per bar
+for all running bots instead of once per bot and tick.
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+path_to_config += f'{os.sep}config'
+
+import datetime
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+from config.config import load_config
+from infrastructure.logger import create_logger
+from infrastructure.technical_indicators import TechnicalIndicators, INDICATOR_PARAMETERS, INDICATOR_OUTPUTS
+from infrastructure.timeframe_aggregator import get_timeframe
+
+def get_default_parameters(config, name: str) -> list:
+    """
+    Returns the configured parameters of an indicator.
+
+    Parameters:
+    - config (Munch): The configuration.
+    - name (str): The name of the indicator.
+
+    Returns:
+    - list: The parameters in the order of INDICATOR_PARAMETERS.
+    """
+    return [config.technical_indicators[name][parameter] for parameter in INDICATOR_PARAMETERS[name]]
+
+
+def parse_indicator(spec: str, config) -> tuple[str, list]:
+    """
+    Parses an entry of a bot's list of technical indicators, e.g. 'rsi', 'rsi:7' or 'bollinger_bands:20:2'.
+
+    Parameters:
+    - spec (str): The entry, optionally quoted.
+    - config (Munch): The configuration.
+
+    Returns:
+    - tuple[str, list]: The name of the indicator and its parameters. Omitted parameters are taken from the config.
+
+    Raises:
+    - ValueError: If the indicator is unknown or a parameter is invalid.
+    """
+    parts: list[str] = spec.strip().strip('"').lower().replace(' ', '_').split(':')
+    name: str = parts[0]
+    if name not in INDICATOR_PARAMETERS:
+        raise ValueError(f'Unknown technical indicator: {name}')
+    parameters: list = get_default_parameters(config, name)
+    if len(parts) - 1 > len(parameters):
+        raise ValueError(f'{name} takes at most {len(parameters)} parameters: {", ".join(INDICATOR_PARAMETERS[name])}')
+    for index, value in enumerate(parts[1:]):
+        if value == '':
+            continue
+        number: float = float(value)
+        if INDICATOR_PARAMETERS[name][index] == 'std_dev':
+            if not 0 < number <= 10:
+                raise ValueError(f'The std_dev of {name} must be between 0 and 10')
+            parameters[index] = int(number) if number.is_integer() else number
+        else:
+            if not number.is_integer() or not 1 <= number <= config.custom_indicators.max_period:
+                raise ValueError(f'The {INDICATOR_PARAMETERS[name][index]} of {name} must be a whole number between 1 and {config.custom_indicators.max_period}')
+            parameters[index] = int(number)
+    if name == 'macd' and parameters[0] >= parameters[1]:
+        raise ValueError('The shorter period of macd must be smaller than the longer period')
+    return name, parameters
+
+
+def format_indicator(name: str, parameters: list) -> str:
+    """
+    Formats an indicator as an entry of a bot's list of technical indicators.
+
+    Parameters:
+    - name (str): The name of the indicator.
+    - parameters (list): The parameters of the indicator.
+
+    Returns:
+    - str: The entry, e.g. 'rsi:7'.
+    """
+    return ':'.join([name] + [str(parameter) for parameter in parameters])
+
+
+def is_stored(name: str, parameters: list, config) -> bool:
+    """
+    Checks if an indicator is stored in the symbol tables, i.e. it is configured with the same parameters.
+
+    Parameters:
+    - name (str): The name of the indicator.
+    - parameters (list): The parameters of the indicator.
+    - config (Munch): The configuration.
+
+    Returns:
+    - bool: True if the indicator is stored.
+    """
+    return name in config.technical_indicators.indicators and parameters == get_default_parameters(config, name)
+
+
+def get_indicator_columns(name: str, parameters: list, config) -> list[str]:
+    """
+    Returns the names of the columns of an indicator.
+
+    Parameters:
+    - name (str): The name of the indicator.
+    - parameters (list): The parameters of the indicator.
+    - config (Munch): The configuration.
+
+    Returns:
+    - list[str]: The stored column names if the indicator is stored, otherwise names which contain the parameters.
+    """
+    outputs: list[str] = INDICATOR_OUTPUTS.get(name, [name])
+    if is_stored(name, parameters, config):
+        return outputs
+    suffix: str = '_'.join(str(parameter).replace('.', 'p') for parameter in parameters)
+    return [f'{output}_{suffix}' for output in outputs]
+
+
+class IndicatorEngine:
+    def __init__(self, db=None, feature_store=None) -> None:
+        """
+        Initialize the IndicatorEngine class.
+
+        Parameters:
+        - db (Database, optional): The database from which the open prices are read if the feature store does not
+          cover a range. Defaults to None.
+        - feature_store (FeatureStore, optional): The feature store from which the open prices are read. Defaults to None.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.logger = create_logger('indicator_engine.log')
+        self.ti = TechnicalIndicators()
+        self.db = db
+        self.feature_store = feature_store
+        # (symbol, column) -> pd.Series of a computed range, least recently used first
+        self.ranges: collections.OrderedDict = collections.OrderedDict()
+        # (symbol, column) -> (timestamp of the newest bar, value)
+        self.latest: dict = {}
+        self.lock = threading.Lock()
+
+    def get_columns(self, feature_columns: list[str]) -> tuple[list[str], dict]:
+        """
+        Expands a bot's list of technical indicators into column names.
+
+        Parameters:
+        - feature_columns (list[str]): The entries, optionally quoted. Entries which are no indicator (e.g. 'open')
+          are passed through.
+
+        Returns:
+        - tuple[list[str], dict]: The column names and a dictionary which maps every computed column to
+          (name, parameters, index of the output).
+        """
+        columns: list[str] = []
+        computed: dict = {}
+        for spec in feature_columns or []:
+            spec = spec.strip().strip('"').replace(' ', '_')
+            if spec.split(':')[0].lower() not in INDICATOR_PARAMETERS:
+                columns.append(spec)
+                continue
+            name, parameters = parse_indicator(spec, self.config)
+            for index, column in enumerate(get_indicator_columns(name, parameters, self.config)):
+                columns.append(column)
+                if not is_stored(name, parameters, self.config):
+                    computed[column] = (name, parameters, index)
+        return columns, computed
+
+    def get_warmup(self, computed: dict) -> int:
+        """
+        Returns the number of bars before the first requested bar which are needed to compute the columns.
+
+        Parameters:
+        - computed (dict): The computed columns as returned by get_columns.
+
+        Returns:
+        - int: The number of bars.
+        """
+        warmup: int = 0
+        for name, parameters, _ in computed.values():
+            bars: int = max(parameters) if name != 'bollinger_bands' else parameters[0]
+            if name == 'exponential_moving_average':
+                # The weights of the exponential moving average decay slowly, older bars have no visible influence
+                bars *= 10
+            warmup = max(warmup, int(bars) + 1)
+        return warmup
+
+    def compute(self, prices: pd.Series, computed: dict) -> pd.DataFrame:
+        """
+        Computes columns on a series of open prices in one pass of TechnicalIndicators.calc_fused, so columns with
+        the same rolling windows share them.
+
+        Parameters:
+        - prices (pd.Series): The open prices, indexed by timestamp.
+        - computed (dict): The computed columns as returned by get_columns.
+
+        Returns:
+        - pd.DataFrame: The columns, indexed by timestamp.
+        """
+        indicators: list[tuple[str, list]] = []
+        for name, parameters, _ in computed.values():
+            if (name, parameters) not in indicators:
+                indicators.append((name, parameters))
+        values: np.ndarray = self.ti.calc_fused(prices, indicators)
+        offsets: list[int] = np.cumsum([0] + [len(INDICATOR_OUTPUTS.get(name, [name])) for name, _ in indicators]).tolist()
+        columns: dict = {column: values[:, offsets[indicators.index((name, parameters))] + index]
+                         for column, (name, parameters, index) in computed.items()}
+        return pd.DataFrame(columns, index=prices.index)
+
+    def load_prices(self, symbol: str, start=None, end=None) -> pd.Series:
+        """
+        Loads the open prices of a symbol within a time range from the feature store or the database.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - start (optional): The first date (inclusive). Defaults to the first bar.
+        - end (optional): The last date (inclusive). Defaults to the newest bar.
+
+        Returns:
+        - pd.Series: The open prices, indexed by timestamp.
+        """
+        stored: tuple | None = self.feature_store.read(symbol, ['open'], start, end) if self.feature_store is not None else None
+        if stored is not None:
+            prices: pd.Series = pd.Series(np.asarray(stored[1]['open']), index=pd.DatetimeIndex(stored[0]))
+            return prices.dropna()
+        conditions: list[str] = []
+        if start is not None:
+            conditions.append(f"TO_TIMESTAMP('{pd.Timestamp(start):%Y-%m-%d %H:%M}', 'YYYY-MM-DD HH24:MI') <= timestamp")
+        if end is not None:
+            conditions.append(f"TO_TIMESTAMP('{pd.Timestamp(end):%Y-%m-%d %H:%M}', 'YYYY-MM-DD HH24:MI') >= timestamp")
+        query: str = f'SELECT "timestamp", open FROM {symbol.lower()}'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        data: pd.DataFrame = self.db.execute_read_query(query + ' ORDER BY timestamp', return_type='pd.DataFrame')
+        return pd.Series(data['open'].to_numpy(dtype=np.float64), index=pd.DatetimeIndex(data['timestamp'])).dropna()
+
+    def get_range(self, symbol: str, computed: dict, start=None, end=None) -> pd.DataFrame:
+        """
+        Returns computed columns within a time range. A column is only computed if no memoized range of the same
+        symbol and column contains the requested range.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - computed (dict): The computed columns as returned by get_columns.
+        - start (optional): The first date (inclusive). Defaults to the first bar.
+        - end (optional): The last date (inclusive). Defaults to the newest bar.
+
+        Returns:
+        - pd.DataFrame: The columns, indexed by timestamp.
+        """
+        first: pd.Timestamp | None = None if start is None else pd.Timestamp(start).floor('min')
+        last: pd.Timestamp | None = None if end is None else pd.Timestamp(end).floor('min') + pd.Timedelta(seconds=59)
+        columns: dict = {}
+        missing: dict = {}
+        with self.lock:
+            for column, definition in computed.items():
+                series: pd.Series | None = self.ranges.get((symbol.lower(), column))
+                if series is not None and first is not None and last is not None and len(series) and \
+                   series.attrs['start'] <= first and last <= series.attrs['end']:
+                    self.ranges.move_to_end((symbol.lower(), column))
+                    columns[column] = series.loc[first:last]
+                else:
+                    missing[column] = definition
+
+        if missing:
+            # The bars of the timeframe tables are get_timeframe minutes apart
+            warmup_start = None if first is None else first - datetime.timedelta(minutes=self.get_warmup(missing) * get_timeframe(symbol.lower()))
+            prices: pd.Series = self.load_prices(symbol, warmup_start, end)
+            computed_frame: pd.DataFrame = self.compute(prices, missing).loc[first:last]
+            for column in missing:
+                series: pd.Series = computed_frame[column]
+                columns[column] = series
+                if first is None or last is None:
+                    continue
+                series.attrs['start'], series.attrs['end'] = first, last
+                with self.lock:
+                    self.ranges[(symbol.lower(), column)] = series
+                    self.ranges.move_to_end((symbol.lower(), column))
+                    while len(self.ranges) > self.config.custom_indicators.memo_size:
+                        self.ranges.popitem(last=False)
+            self.logger.info(f'get_range: Computed {", ".join(missing)} of {symbol} from {len(prices)} bars')
+        return pd.DataFrame(columns)
+
+    def get_latest(self, symbol: str, computed: dict, timestamps: np.ndarray, prices: np.ndarray) -> dict:
+        """
+        Returns the values of computed columns for the newest bar. Every column is computed once per symbol and bar.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - computed (dict): The computed columns as returned by get_columns.
+        - timestamps (np.ndarray): The timestamps of the newest bars, from the oldest to the newest bar.
+        - prices (np.ndarray): The open prices of the newest bars, at least get_warmup bars.
+
+        Returns:
+        - dict: The value of every column.
+        """
+        bar = timestamps[-1]
+        values: dict = {}
+        missing: dict = {}
+        for column, definition in computed.items():
+            memo: tuple | None = self.latest.get((symbol.lower(), column))
+            if memo is not None and memo[0] == bar:
+                values[column] = memo[1]
+            else:
+                missing[column] = definition
+        if missing:
+            series: pd.Series = pd.Series(prices, index=pd.DatetimeIndex(timestamps)).dropna()
+            newest: pd.Series = self.compute(series, missing).iloc[-1]
+            for column in missing:
+                values[column] = float(newest[column])
+                self.latest[(symbol.lower(), column)] = (bar, values[column])
+        return values
@@ -0,0 +1,319 @@
+"""
+This python module contains the versioned schema migrations of the database.
+
+Every migration in MIGRATIONS is applied once, in the order of its version, and recorded in the table
+'schema_migrations'. A migration either calls a function with the Database (e.g. the baseline tables) or creates an
+index online with CREATE INDEX CONCURRENTLY, so the application keeps reading and writing the table meanwhile:
+- the index is created on a separate connection in autocommit mode, because it cannot run inside a transaction,
+- an invalid index which was left by an interrupted or timed out creation is dropped and created again,
+- the representative queries of the migration are executed with EXPLAIN ANALYZE before and after the index was
+  created and their plans and timings are recorded in 'schema_migrations'.
+The tables of the configured symbols depend on config.yaml and are created on every start by
+infrastructure/startup.py instead.
+
+Usage:
+    python infrastructure/migrations.py            (applies the pending migrations)
+    python infrastructure/migrations.py --status   (prints the applied migrations and their EXPLAIN timings)
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+path_to_config += f'{os.sep}config'
+
+import json
+import time
+import argparse
+import datetime
+
+from config.config import load_config
+from infrastructure.database import Database
+from infrastructure.logger import create_logger
+
+def require(success: bool, action: str) -> None:
+    """
+    Raises an error if a step of a migration failed, because Database.create_table and Database.add_column log their
+    errors and return False instead of raising them. The migration is then not recorded and tried again.
+
+    Parameters:
+    - success (bool): The result of the step.
+    - action (str): The description of the step for the error, e.g. 'create the table bots'.
+
+    Returns:
+    - None
+    """
+    if not success:
+        raise RuntimeError(f'Could not {action}')
+
+def create_baseline_tables(db: Database) -> None:
+    """
+    Creates the tables of the application which do not depend on the configured symbols, if they do not exist yet.
+
+    Parameters:
+    - db (Database): The database in which the tables are created.
+
+    Returns:
+    - None
+    """
+    require(db.create_table('prices', ['symbol VARCHAR', '"timestamp" TIMESTAMP', 'last_price FLOAT', 'bid_price FLOAT', 'ask_price FLOAT', 'bid_size FLOAT', 'ask_size FLOAT', 'price_change_last_24h FLOAT'], ['symbol']), 'create the table prices')
+    require(db.create_table('"user"', ['id INT','email VARCHAR','password VARCHAR','first_name VARCHAR','last_name VARCHAR'], primary_keys=['id']), 'create the table user')
+    require(db.create_table('bots', ['id INT', '"user" INT', 'name VARCHAR', 'created TIMESTAMP', 'last_trained TIMESTAMP', 'symbol VARCHAR', 'timeframe INT', 'model_type VARCHAR', 'technical_indicators VARCHAR', 'hyper_parameters JSON', 'training BOOL', 'training_set_percentage FLOAT', 'training_error_metrics JSON', 'running BOOL', 'prediction FLOAT', 'position VARCHAR', 'entry_price FLOAT', 'money FLOAT', 'stop_loss FLOAT', 'stop_loss_trailing BOOL', 'take_profit FLOAT', 'retrain_interval INT', 'training_progress JSON'], primary_keys=['id']), 'create the table bots')
+    require(db.add_column('bots', 'retrain_interval', 'INT'), 'add the column bots.retrain_interval')
+    require(db.add_column('bots', 'training_progress', 'JSON'), 'add the column bots.training_progress')
+    require(db.create_table('trades', ['trade_id INT', '"user" INT', 'bot_id INT', '"timestamp" TIMESTAMP', 'symbol VARCHAR', 'side VARCHAR', 'entry_price FLOAT', 'close_price FLOAT', 'money FLOAT', 'profit_abs FLOAT', 'profit_rel FLOAT', 'trading_fee FLOAT', 'tp_trigger BOOL', 'sl_trigger BOOL'], primary_keys=['trade_id'], create_index_column='timestamp'), 'create the table trades')
+    require(db.create_table('model_versions', ['"user" INT', 'bot_id INT', 'version INT', 'created TIMESTAMP', 'model_type VARCHAR', 'path VARCHAR', 'size_bytes BIGINT', 'metrics JSON', 'min_date TIMESTAMP', 'max_date TIMESTAMP', 'training_mode VARCHAR', 'live BOOL'], primary_keys=['"user"', 'bot_id', 'version']), 'create the table model_versions')
+    # Performance aggregates which are updated with every trade, see Database.update_bot_stats
+    require(db.create_table('bot_stats', ['"user" INT', 'bot_id INT', 'trades INT', 'wins INT', 'cumulative_return FLOAT', 'mean_return FLOAT', 'm2 FLOAT', 'peak_equity FLOAT', 'last_equity FLOAT', 'max_drawdown FLOAT', 'last_trade TIMESTAMP'], primary_keys=['"user"', 'bot_id']), 'create the table bot_stats')
+    # Used by the prediction workers if distributed.enabled is set
+    require(db.create_table('bot_leases', ['"user" INT', 'bot_id INT', 'worker_id VARCHAR', 'lease_until TIMESTAMP', 'last_bar TIMESTAMP'], primary_keys=['"user"', 'bot_id']), 'create the table bot_leases')
+
+
+def create_prediction_workers_table(db: Database) -> None:
+    """
+    Creates the registry of the prediction workers, in which every worker records its heartbeat (see
+    models/lease_manager.py).
+
+    Parameters:
+    - db (Database): The database in which the table is created.
+
+    Returns:
+    - None
+    """
+    require(db.create_table('prediction_workers', ['worker_id VARCHAR', 'started TIMESTAMP', 'heartbeat TIMESTAMP'], primary_keys=['worker_id']), 'create the table prediction_workers')
+
+def create_training_jobs_table(db: Database) -> None:
+    """
+    Creates the queue of the trainings which are requested from the web application and the training lease of the
+    bots (see models/retrain_scheduler.py).
+
+    Parameters:
+    - db (Database): The database in which the table is created.
+
+    Returns:
+    - None
+    """
+    require(db.create_table('training_jobs', ['job_id BIGSERIAL', '"user" INT', 'bot_id INT', 'mode VARCHAR', 'parameters JSON', 'created TIMESTAMP', 'started TIMESTAMP', 'finished TIMESTAMP', 'worker_id VARCHAR', 'attempts INT', 'error VARCHAR'], primary_keys=['job_id']), 'create the table training_jobs')
+    require(db.add_column('bots', 'training_until', 'TIMESTAMP'), 'add the column bots.training_until')
+
+# The migrations in the order of their version. A migration has either the key 'apply' (a function which is called
+# with the Database) or the keys 'index' (the name of the index), 'table' and 'definition' (the part after CREATE
+# INDEX CONCURRENTLY <index>), and optionally 'explain' with the representative queries whose plans are recorded. The
+# queries may use the parameters %(user)s and %(bot_id)s of the bot with the most trades.
+MIGRATIONS: list[dict] = [
+    {'version': 1, 'name': 'baseline_tables', 'apply': create_baseline_tables},
+    {'version': 2, 'name': 'trades_user_bot_timestamp', 'index': 'idx_trades_user_bot_timestamp', 'table': 'trades',
+     'definition': 'ON trades ("user", bot_id, "timestamp" DESC)',
+     'explain': ['SELECT "timestamp", side, entry_price, close_price, profit_rel FROM trades WHERE "user"=%(user)s AND bot_id=%(bot_id)s ORDER BY "timestamp" DESC LIMIT 50',
+                 'SELECT "timestamp", money FROM trades WHERE "user"=%(user)s AND bot_id=%(bot_id)s ORDER BY "timestamp" DESC']},
+    {'version': 3, 'name': 'bots_running', 'index': 'idx_bots_running', 'table': 'bots',
+     'definition': 'ON bots (running) WHERE running',
+     'explain': ['SELECT "user", id, model_type, symbol, timeframe FROM bots WHERE running=True']},
+    {'version': 4, 'name': 'bots_user_id', 'index': 'idx_bots_user_id', 'table': 'bots',
+     'definition': 'ON bots ("user", id)',
+     'explain': ['SELECT id, name, symbol FROM bots WHERE "user"=%(user)s AND id > 0 ORDER BY id LIMIT 50']},
+    {'version': 5, 'name': 'prediction_workers', 'apply': create_prediction_workers_table},
+    {'version': 6, 'name': 'training_jobs', 'apply': create_training_jobs_table},
+]
+
+class MigrationManager:
+    def __init__(self, db: Database = None) -> None:
+        """
+        Initialize the MigrationManager class.
+
+        Parameters:
+        - db (Database, optional): The database which is migrated. Defaults to a new connection.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.db: Database = db if db is not None else Database()
+        self.logger = create_logger('migrations.log')
+        self.db.create_table('schema_migrations', ['version INT', 'name VARCHAR', 'applied TIMESTAMP', 'duration_ms FLOAT', 'explain_before JSON', 'explain_after JSON'], primary_keys=['version'])
+
+    def get_applied_versions(self) -> set[int] | None:
+        """
+        Returns the versions of the applied migrations.
+
+        Parameters:
+        - None
+
+        Returns:
+        - set[int] | None: The versions, or None if 'schema_migrations' could not be read.
+        """
+        rows: list | None = self.db.execute_read_query('SELECT version FROM schema_migrations')
+        return None if rows is None else {row[0] for row in rows}
+
+    def get_sample_parameters(self) -> dict:
+        """
+        Returns the parameters of the EXPLAIN queries, the user and the id of the bot with the most trades.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dict: The keys 'user' and 'bot_id', -1 if there are no trades.
+        """
+        row: tuple | None = self.db.execute_read_query('SELECT "user", bot_id FROM trades GROUP BY "user", bot_id ORDER BY COUNT(*) DESC LIMIT 1', first_only=True)
+        return {'user': row[0], 'bot_id': row[1]} if row else {'user': -1, 'bot_id': -1}
+
+    def explain(self, cursor, queries: list[str], parameters: dict) -> list[dict]:
+        """
+        Executes queries with EXPLAIN ANALYZE and returns their scans and timings.
+
+        Parameters:
+        - cursor: A cursor of a connection in autocommit mode.
+        - queries (list[str]): The queries.
+        - parameters (dict): The parameters of the queries.
+
+        Returns:
+        - list[dict]: Per query the keys 'query', 'scans' (e.g. 'Index Scan on trades using idx_trades_user_bot_timestamp'),
+          'planning_ms' and 'execution_ms'.
+        """
+        results: list[dict] = []
+        for query in queries:
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {query}', parameters)
+            result = cursor.fetchone()[0]
+            result = (json.loads(result) if isinstance(result, str) else result)[0]
+            scans: list[str] = []
+            nodes: list[dict] = [result['Plan']]
+            while nodes:
+                node: dict = nodes.pop(0)
+                if 'Relation Name' in node:
+                    scans.append(f'{node["Node Type"]} on {node["Relation Name"]}' + (f' using {node["Index Name"]}' if 'Index Name' in node else ''))
+                nodes += node.get('Plans', [])
+            results.append({'query': query, 'scans': scans, 'planning_ms': result['Planning Time'], 'execution_ms': result['Execution Time']})
+        return results
+
+    def create_index(self, migration: dict) -> tuple[list[dict], list[dict]]:
+        """
+        Creates the index of a migration with CREATE INDEX CONCURRENTLY and records the plans of its queries before
+        and after. The creation waits at most migrations.lock_timeout_seconds for transactions which use the table.
+
+        Parameters:
+        - migration (dict): The migration.
+
+        Returns:
+        - tuple[list[dict], list[dict]]: The EXPLAIN results before and after the index was created (see explain).
+        """
+        # Open transactions of this connection would block the concurrent creation
+        self.db.commit()
+        parameters: dict = self.get_sample_parameters()
+        self.db.commit()
+        connection = self.db.create_connection()
+        if connection is None:
+            raise ConnectionError('Could not connect to the database')
+        connection.autocommit = True
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"SET lock_timeout = '{int(self.config.migrations.lock_timeout_seconds)}s'")
+            explain: bool = self.config.migrations.explain and bool(migration.get('explain'))
+            before: list[dict] = self.explain(cursor, migration['explain'], parameters) if explain else []
+            cursor.execute('SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s', (migration['index'],))
+            row: tuple | None = cursor.fetchone()
+            if row is not None and not row[0]:
+                self.logger.info(f'create_index: Dropping the invalid index {migration["index"]}')
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {migration["index"]}')
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {migration["index"]} {migration["definition"]}')
+            # Updates the statistics, so the planner considers the new index
+            cursor.execute(f'ANALYZE {migration["table"]}')
+            after: list[dict] = self.explain(cursor, migration['explain'], parameters) if explain else []
+            return before, after
+        finally:
+            connection.close()
+
+    def apply(self, migration: dict) -> dict:
+        """
+        Applies a migration and records it in 'schema_migrations'. Raises an error if a step or the record failed.
+
+        Parameters:
+        - migration (dict): The migration.
+
+        Returns:
+        - dict: The version, the name, the duration in milliseconds and the EXPLAIN results before and after.
+        """
+        start_time: float = time.perf_counter()
+        before, after = [], []
+        if 'apply' in migration:
+            migration['apply'](self.db)
+        else:
+            before, after = self.create_index(migration)
+        duration: float = (time.perf_counter() - start_time) * 1000
+        inserted_rows: int | None = self.db.execute_write_query('INSERT INTO schema_migrations (version, name, applied, duration_ms, explain_before, explain_after) VALUES (%s, %s, %s, %s, %s, %s)',
+                                                                (migration['version'], migration['name'], datetime.datetime.now(), duration, json.dumps(before), json.dumps(after)))
+        require(inserted_rows == 1, f'record the migration {migration["version"]} in schema_migrations')
+        self.db.commit()
+        for query_before, query_after in zip(before, after):
+            self.logger.info(f'apply: {migration["name"]}: {query_before["execution_ms"]:.2f} ms ({", ".join(query_before["scans"])}) -> '
+                             f'{query_after["execution_ms"]:.2f} ms ({", ".join(query_after["scans"])}) for {query_before["query"]}')
+        return {'version': migration['version'], 'name': migration['name'], 'duration_ms': duration, 'explain_before': before, 'explain_after': after}
+
+    def migrate(self) -> list[dict]:
+        """
+        Applies all pending migrations in the order of their version. The migrations after a failed one are not
+        applied, they are tried again with the next start.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list[dict]: The results of the applied migrations (see apply).
+        """
+        applied: set[int] | None = self.get_applied_versions()
+        if applied is None:
+            self.logger.error('migrate: Could not read the applied migrations, no migration is applied')
+            return []
+        results: list[dict] = []
+        for migration in sorted(MIGRATIONS, key=lambda migration: migration['version']):
+            if migration['version'] in applied:
+                continue
+            self.logger.info(f'migrate: Applying migration {migration["version"]} {migration["name"]}')
+            try:
+                results.append(self.apply(migration))
+            except Exception as e:
+                self.logger.error(f'migrate: Migration {migration["version"]} {migration["name"]} failed: {str(e)}')
+                # The failed statements must not abort the transaction of the following queries of the connection
+                try:
+                    self.db.connection.rollback()
+                except Exception as e:
+                    self.logger.error(f'migrate: Error rolling back changes: {str(e)}')
+                break
+        return results
+
+    def get_status(self) -> list[tuple]:
+        """
+        Returns the applied migrations.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list[tuple]: The version, the name, the time it was applied, the duration in milliseconds and the EXPLAIN
+          results before and after of every applied migration.
+        """
+        return self.db.execute_read_query('SELECT version, name, applied, duration_ms, explain_before, explain_after FROM schema_migrations ORDER BY version') or []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Apply the pending schema migrations or print the applied ones.')
+    parser.add_argument('--status', action='store_true')
+    args = parser.parse_args()
+
+    manager = MigrationManager()
+    if not args.status:
+        manager.migrate()
+    for version, name, applied, duration, before, after in manager.get_status():
+        print(f'{version:>4} {name:<30} {applied} {duration:>10.1f} ms')
+        for query_before, query_after in zip(before or [], after or []):
+            print(f'       {query_before["execution_ms"]:>10.3f} ms -> {query_after["execution_ms"]:>10.3f} ms  {query_before["query"]}')
+            print(f'       {", ".join(query_before["scans"])} -> {", ".join(query_after["scans"])}')
+
+
+if __name__ == '__main__':
+    main()
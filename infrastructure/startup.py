@@ -0,0 +1,188 @@
+"""
+This python module contains the startup steps which have to be executed once before the roles of the application
+(ingestion, execution, training and web) are started, either as threads by main.py or as separate processes by
+supervisor.py.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import subprocess
+import pandas as pd
+
+from config.config import load_config
+from infrastructure.database import Database, TRAINING_LEASE_CONDITION, PENDING_JOB_CONDITION
+from infrastructure.fill_gaps import GapFiller
+from infrastructure.feature_store import FeatureStore
+from infrastructure.timeframe_aggregator import TimeframeAggregator, get_table_name
+from infrastructure.migrations import MigrationManager
+from infrastructure.logger import create_logger
+
+config = load_config(f'{path_to_config}{os.sep}config.yaml')
+logger = create_logger('startup.log')
+
+# Execute cmd commands to start the database
+# change_dir_command: str = f'cd {config.postgres.path_to_postgres}{os.sep}bin'
+# start_postgres_command: str = f'.{os.sep}pg_ctl.exe start -D "A:{os.sep}PostgreSQL{os.sep}16{os.sep}data"' # Replace this with path_to_postgres
+# logger.info(f'Starting postgres...')
+# result = subprocess.run(['powershell', '-Command',f'{change_dir_command}; {start_postgres_command}'])
+# logger.info(f'Output: {result.stdout} \nError: {result.stderr}')
+
+# Linux
+def start_postgres():
+    try:
+        # Run the command to start PostgreSQL service
+        subprocess.run(['sudo', '-S', 'service', 'postgresql', 'start'], input=f'{config.sudo_password}', check=True, text=True)
+        print("PostgreSQL service started successfully.")
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to start PostgreSQL service: {e}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def migrate_database(db: Database) -> None:
+    """
+    Applies the pending schema migrations (see infrastructure/migrations.py) and creates the historical price tables
+    of the configured symbols and timeframes if they do not exist yet.
+
+    Parameters:
+    - db (Database): The database in which the tables are created.
+
+    Returns:
+    - None
+    """
+    for result in MigrationManager(db).migrate():
+        logger.info(f'Applied migration {result["version"]} {result["name"]} in {result["duration_ms"]:.0f} ms')
+
+    # Create historical price tables
+    for symbol in config.tradeable_symbols:
+        logger.info(f'Creating historical price tables for {symbol}')
+        column_names_and_types = ['"timestamp" TIMESTAMP', 'open FLOAT', 'close FLOAT']
+        if len(config.technical_indicators.indicators) > 0:
+            for indicator in config.technical_indicators.indicators:
+                if indicator == 'bollinger_bands':
+                    column_names_and_types.append('"lower_bollinger_band" FLOAT')
+                    column_names_and_types.append('"upper_bollinger_band" FLOAT')
+                else:
+                    column_names_and_types.append(f"{indicator} FLOAT")
+        unique_constraints = ['"timestamp"']
+        db.create_table(symbol, column_names_and_types, unique_constraints, create_index_column='timestamp')
+        # The bars of the higher timeframes have the same columns (see infrastructure/timeframe_aggregator.py)
+        for timeframe in config.timeframes.aggregated:
+            db.create_table(get_table_name(symbol, timeframe), column_names_and_types, unique_constraints, create_index_column='timestamp')
+
+
+def fill_gaps() -> None:
+    """
+    Identifies any gaps in the historical data and fills them if they exist.
+    Downloads the missing historical data since the last start of the application.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+    gap_filler = GapFiller()
+    for symbol in config.tradeable_symbols:
+        # Fill gaps
+        gaps: list[tuple[pd.Timestamp, pd.Timestamp]] = gap_filler.fetch_gaps(symbol.lower())
+        logger.info(f'Checking for gaps in the historical data of {symbol}: {len(gaps)} found!')
+        gap_filler.fill_gaps(symbol.lower())
+        if len(gaps) > 0:
+            logger.info(f'Filled gaps in the historical data of {symbol}.')
+
+        # Download the missing data since the last start of the application
+        gap_filler.download_missing_data_since_last_application_start(symbol)
+
+
+def build_timeframes(db: Database) -> None:
+    """
+    Aggregates all 1-minute bars of every symbol which are not part of a bar of the higher timeframes yet.
+
+    Parameters:
+    - db (Database): The database which contains the historical price tables.
+
+    Returns:
+    - None
+    """
+    aggregator = TimeframeAggregator(db)
+    for symbol in config.tradeable_symbols:
+        bars: int = aggregator.update(symbol)
+        logger.info(f'Aggregated {bars} bars of the higher timeframes of {symbol}')
+
+
+def build_bot_stats(db: Database) -> None:
+    """
+    Calculates the performance aggregates of every bot whose trades were inserted before the 'bot_stats' table existed.
+
+    Parameters:
+    - db (Database): The database which contains the 'trades' and the 'bot_stats' table.
+
+    Returns:
+    - None
+    """
+    bots: list | None = db.execute_read_query('SELECT DISTINCT t."user", t.bot_id FROM trades t WHERE NOT EXISTS (SELECT 1 FROM bot_stats s WHERE s."user" = t."user" AND s.bot_id = t.bot_id)')
+    for user, bot_id in bots or []:
+        db.rebuild_bot_stats(user, bot_id)
+    if bots:
+        logger.info(f'Calculated the performance aggregates of {len(bots)} bots')
+
+
+def build_feature_stores(db: Database) -> None:
+    """
+    Builds the columnar feature store of every symbol which has no complete store yet from the database.
+
+    Parameters:
+    - db (Database): The database which contains the historical price tables.
+
+    Returns:
+    - None
+    """
+    if not config.feature_store.enabled:
+        return
+    feature_store = FeatureStore()
+    for symbol in config.tradeable_symbols:
+        meta: dict | None = feature_store.load_meta(symbol)
+        if meta is None or not meta['built'] or meta['columns'] != feature_store.columns:
+            logger.info(f'Building the feature store of {symbol}')
+            feature_store.rebuild(symbol, db, config.training.chunk_size)
+
+
+def reset_positions(db: Database) -> None:
+    """
+    Sets the position of all bots to neutral before the prediction workers start.
+
+    Parameters:
+    - db (Database): The database which contains the 'bots' table.
+
+    Returns:
+    - None
+    """
+    db.execute_write_query("UPDATE bots SET position='neutral'")
+    db.commit()
+
+
+def reset_training(db: Database) -> None:
+    """
+    Clears the 'training' flag of all bots whose training process died, i.e. bots without a valid training lease and
+    without a queued training job. Bots whose training lease expired while a job was running keep the flag, the job
+    is run again by the training workers.
+
+    Parameters:
+    - db (Database): The database which contains the 'bots' table.
+
+    Returns:
+    - None
+    """
+    query: str = f'UPDATE bots b SET training=False, training_until=NULL WHERE b.training AND NOT ({TRAINING_LEASE_CONDITION}) AND NOT {PENDING_JOB_CONDITION}'
+    reset: int | None = db.execute_write_query(query, {'max_attempts': config.training_jobs.max_attempts})
+    db.commit()
+    if reset:
+        logger.info(f'reset_training: Cleared the training flag of {reset} bots')
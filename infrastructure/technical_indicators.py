@@ -17,10 +17,242 @@ import pandas as pd
 import numpy as np
 from config.config import load_config
 
+# The parameters of every indicator in the order in which they are passed to its calc_ function
+INDICATOR_PARAMETERS: dict[str, list[str]] = {
+    'moving_average': ['period'],
+    'exponential_moving_average': ['period'],
+    'moving_std': ['period'],
+    'periodic_highs': ['period'],
+    'periodic_lows': ['period'],
+    'bollinger_bands': ['period', 'std_dev'],
+    'macd': ['shorter', 'longer'],
+    'rsi': ['period'],
+    'momentum': ['period'],
+}
+
+# Indicators with more than one output column
+INDICATOR_OUTPUTS: dict[str, list[str]] = {
+    'bollinger_bands': ['lower_bollinger_band', 'upper_bollinger_band'],
+}
+
+
+def calc_rolling_moments(values: np.ndarray, mean_windows: set[int], var_windows: set[int] = None,
+                         block_size: int = 4_096) -> tuple[dict, dict]:
+    """
+    Calculates the rolling means and sample variances of several window sizes in one pass over the data.
+
+    The sums of each window are differences of cumulative sums, which are shared by all window sizes. To keep
+    the cumulative sums precise on long series, they are restarted for every block of 'block_size' rows and
+    calculated on the values minus the mean of the block. Windows which contain NaN are NaN, like with
+    pd.Series.rolling.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The time series data.
+    mean_windows : set[int]
+        The window sizes of which the rolling mean is needed.
+    var_windows : set[int], optional
+        The window sizes of which the rolling variance is needed.
+    block_size : int, optional
+        The number of rows of which the cumulative sums are calculated at once. The default is 4_096.
+
+    Returns
+    -------
+    dict, dict
+        The rolling means and variances, keyed by window size.
+    """
+    var_windows = set(var_windows or [])
+    windows: list[int] = sorted(set(mean_windows) | var_windows)
+    number_of_rows: int = len(values)
+    means: dict = {window: np.full(number_of_rows, np.nan) for window in windows}
+    variances: dict = {window: np.full(number_of_rows, np.nan) for window in var_windows}
+    if not windows or number_of_rows == 0:
+        return means, variances
+
+    missing: np.ndarray = np.isnan(values)
+    has_missing: bool = bool(missing.any())
+    clean: np.ndarray = np.where(missing, 0.0, values) if has_missing else values
+    max_window: int = windows[-1]
+    for start in range(0, number_of_rows, block_size):
+        end: int = min(start + block_size, number_of_rows)
+        low: int = max(start - max_window + 1, 0)
+        segment: np.ndarray = clean[low:end]
+        reference: float = float(segment.mean())
+        centered: np.ndarray = segment - reference
+        sums: np.ndarray = np.zeros(len(segment) + 1)
+        np.cumsum(centered, out=sums[1:])
+        if var_windows:
+            squares: np.ndarray = np.zeros(len(segment) + 1)
+            np.cumsum(centered * centered, out=squares[1:])
+        if has_missing:
+            counts: np.ndarray = np.zeros(len(segment) + 1, dtype=np.int64)
+            np.cumsum(missing[low:end], out=counts[1:])
+
+        for window in windows:
+            first: int = max(start, window - 1)
+            if first >= end:
+                continue
+            # Rows first..end-1 of the series are rows first-low..end-low-1 of the segment
+            upper: slice = slice(first - low + 1, end - low + 1)
+            lower: slice = slice(first - low + 1 - window, end - low + 1 - window)
+            window_sums: np.ndarray = sums[upper] - sums[lower]
+            window_means: np.ndarray = window_sums / window
+            invalid: np.ndarray | None = (counts[upper] - counts[lower]) > 0 if has_missing else None
+            means[window][first:end] = window_means + reference
+            if window in var_windows and window > 1:
+                window_squares: np.ndarray = squares[upper] - squares[lower]
+                variances[window][first:end] = np.maximum(window_squares - window_sums * window_means, 0.0) / (window - 1)
+            if invalid is not None:
+                means[window][first:end][invalid] = np.nan
+                if window in var_windows:
+                    variances[window][first:end][invalid] = np.nan
+    return means, variances
+
+
 class TechnicalIndicators:
     def __init__(self) -> None:
         self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+
+    def get_configured_indicators(self) -> list[tuple[str, list]]:
+        """
+        Returns the indicators of config.technical_indicators with their configured parameters.
+
+        Returns
+        -------
+        list[tuple[str, list]]
+            The name and the parameters of every indicator.
+        """
+        return [(name, [self.config.technical_indicators[name][parameter] for parameter in INDICATOR_PARAMETERS[name]])
+                for name in self.config.technical_indicators.indicators]
+
+    def get_output_columns(self, indicators: list[tuple[str, list]]) -> list[str]:
+        """
+        Returns the names of the output columns of calc_fused for the configured parameters.
+
+        Parameters
+        ----------
+        indicators : list[tuple[str, list]]
+            The name and the parameters of every indicator.
+
+        Returns
+        -------
+        list[str]
+            The column names, bollinger_bands has a lower and an upper band.
+        """
+        return [column for name, _ in indicators for column in INDICATOR_OUTPUTS.get(name, [name])]
+
+    def calc_fused(self, data: pd.Series | np.ndarray, indicators: list[tuple[str, list]] = None) -> np.ndarray:
+        """
+        Calculates several technical indicators of a time series in a single pass and writes them into one array.
+
+        The requested indicators are first resolved into the intermediate results they depend on: the rolling
+        means (moving average, Bollinger Bands, MACD), the rolling variances (moving standard deviation,
+        Bollinger Bands) and the price differences (RSI). Every intermediate result is calculated once and shared
+        by all indicators which need it, e.g. a moving average and Bollinger Bands with the same period share their
+        rolling mean. The results equal the calc_ functions up to floating point rounding.
+
+        Parameters
+        ----------
+        data : pd.Series | np.ndarray
+            The time series data.
+        indicators : list[tuple[str, list]], optional
+            The name and the parameters of every indicator in the order of INDICATOR_PARAMETERS. The default are the
+            configured indicators.
+
+        Returns
+        -------
+        np.ndarray
+            An array with one row per value and the columns of get_output_columns.
+        """
+        values: np.ndarray = np.asarray(data, dtype=np.float64)
+        if indicators is None:
+            indicators = self.get_configured_indicators()
+
+        # Resolve the intermediate results
+        mean_windows: set[int] = set()
+        var_windows: set[int] = set()
+        for name, parameters in indicators:
+            if name in ('moving_average', 'bollinger_bands'):
+                mean_windows.add(int(parameters[0]))
+            if name in ('moving_std', 'bollinger_bands'):
+                var_windows.add(int(parameters[0]))
+            if name == 'macd':
+                mean_windows.update(int(parameter) for parameter in parameters)
+        means, variances = calc_rolling_moments(values, mean_windows, var_windows)
+        differences: np.ndarray | None = None
+        rolling_extremes: dict = {}
+        series: pd.Series = pd.Series(values)
+
+        number_of_columns: int = len(self.get_output_columns(indicators))
+        result: np.ndarray = np.full((len(values), number_of_columns), np.nan)
+        column: int = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name, parameters in indicators:
+                window: int = int(parameters[0])
+                if name == 'moving_average':
+                    result[:, column] = means[window]
+                elif name == 'moving_std':
+                    result[:, column] = np.sqrt(variances[window])
+                elif name == 'bollinger_bands':
+                    deviation: np.ndarray = parameters[1] * np.sqrt(variances[window])
+                    result[:, column] = means[window] - deviation
+                    result[:, column + 1] = means[window] + deviation
+                elif name == 'macd':
+                    result[:, column] = means[int(parameters[0])] - means[int(parameters[1])]
+                elif name == 'exponential_moving_average':
+                    result[:, column] = series.ewm(span=window).mean().to_numpy()
+                    result[:window - 1, column] = np.nan
+                elif name in ('periodic_highs', 'periodic_lows'):
+                    key: tuple = (name, window)
+                    if key not in rolling_extremes:
+                        rolling = series.rolling(window)
+                        rolling_extremes[key] = (rolling.max() if name == 'periodic_highs' else rolling.min()).to_numpy()
+                    result[:, column] = rolling_extremes[key]
+                elif name == 'momentum':
+                    result[window:, column] = values[window:] - values[:-window] if window < len(values) else np.nan
+                elif name == 'rsi':
+                    if differences is None:
+                        differences = np.empty(len(values))
+                        differences[:1] = 0.0
+                        differences[1:] = np.diff(values)
+                        differences = np.nan_to_num(differences, nan=0.0)
+                    average_gains: np.ndarray = self.calc_rolling_average_change(np.maximum(differences, 0.0), window)
+                    average_losses: np.ndarray = self.calc_rolling_average_change(np.maximum(-differences, 0.0), window)
+                    result[:, column] = 100 - (100 / (1 + average_gains / average_losses))
+                column += len(INDICATOR_OUTPUTS.get(name, [name]))
+        return result
+
     
+    def calc_rolling_average_change(self, changes: np.ndarray, window_size: int) -> np.ndarray:
+        """
+        Calculates the rolling mean of non-negative price changes for calc_fused. The changes are small compared to
+        the prices, so a single cumulative sum is precise enough. Windows without any change are exactly zero, so
+        that the RSI of a constant price is NaN like with calc_rsi.
+
+        Parameters
+        ----------
+        changes : np.ndarray
+            The gains or losses.
+        window_size : int
+            The size of the window.
+
+        Returns
+        -------
+        np.ndarray
+            The rolling mean.
+        """
+        average: np.ndarray = np.full(len(changes), np.nan)
+        if window_size > len(changes):
+            return average
+        sums: np.ndarray = np.zeros(len(changes) + 1)
+        np.cumsum(changes, out=sums[1:])
+        counts: np.ndarray = np.zeros(len(changes) + 1, dtype=np.int64)
+        np.cumsum(changes > 0, out=counts[1:])
+        average[window_size - 1:] = (sums[window_size:] - sums[:-window_size]) / window_size
+        average[window_size - 1:][(counts[window_size:] - counts[:-window_size]) == 0] = 0.0
+        return average
+
     def calc_moving_average(self, data: pd.Series, window_size: int = None):
         """
         Calculates the moving average of a time series.
@@ -0,0 +1,247 @@
+"""
+This python module contains the aggregation of the 1-minute bars into bars of the higher timeframes of
+config.timeframes.aggregated.
+
+The bars of a timeframe are stored in their own table '<symbol>_<minutes>m' (e.g. 'btcusd_60m') with the same
+columns as the symbol table, so training, prediction and the charts read them like the 1-minute bars. A bar starts
+at a multiple of its timeframe since 1970-01-01, its open is the open of its first and its close the close of its
+last 1-minute bar. A bar is aggregated once, as soon as a 1-minute bar of the following bar exists, and the
+technical indicators of the new bars are continued from the last timeframe.warmup_bars stored bars instead of being
+recomputed over the whole table. Ranges of 1-minute bars which are rewritten by the GapFiller are aggregated again
+with rebuild_from.
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+path_to_config += f'{os.sep}config'
+
+import re
+import datetime
+import numpy as np
+import pandas as pd
+import psycopg2.extras
+
+from config.config import load_config
+from infrastructure.database import Database
+from infrastructure.dataset_cache import DatasetCache
+from infrastructure.technical_indicators import TechnicalIndicators
+from infrastructure.logger import create_logger
+
+EPOCH: pd.Timestamp = pd.Timestamp('1970-01-01')
+
+def get_table_name(symbol: str, timeframe: int | None = None) -> str:
+    """
+    Returns the table which contains the bars of a symbol in a timeframe.
+
+    Parameters:
+    - symbol (str): The symbol, e.g. 'BTCUSD'.
+    - timeframe (int | None, optional): The timeframe in minutes. Defaults to None (1 minute).
+
+    Returns:
+    - str: The table, e.g. 'btcusd' or 'btcusd_60m'.
+    """
+    if timeframe is None or int(timeframe) <= 1:
+        return symbol.lower()
+    return f'{symbol.lower()}_{int(timeframe)}m'
+
+def get_timeframe(table: str) -> int:
+    """
+    Returns the timeframe of a table returned by get_table_name.
+
+    Parameters:
+    - table (str): The table, e.g. 'btcusd_60m'.
+
+    Returns:
+    - int: The timeframe in minutes, 1 for the symbol tables.
+    """
+    match = re.search(r'_(\d+)m$', table)
+    return int(match.group(1)) if match else 1
+
+def get_bar_start(timestamp, timeframe: int) -> pd.Timestamp:
+    """
+    Returns the start of the bar of a timeframe which contains a timestamp.
+
+    Parameters:
+    - timestamp: The timestamp.
+    - timeframe (int): The timeframe in minutes.
+
+    Returns:
+    - pd.Timestamp: The start of the bar.
+    """
+    return EPOCH + (pd.Timestamp(timestamp) - EPOCH) // pd.Timedelta(minutes=timeframe) * pd.Timedelta(minutes=timeframe)
+
+
+class TimeframeAggregator:
+    def __init__(self, db: Database = None) -> None:
+        """
+        Initialize the TimeframeAggregator class.
+
+        Parameters:
+        - db (Database, optional): The database which contains the symbol tables. Defaults to a new connection.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.db: Database = db if db is not None else Database()
+        self.ti: TechnicalIndicators = TechnicalIndicators()
+        self.dataset_cache: DatasetCache = DatasetCache()
+        self.logger = create_logger('timeframe_aggregator.log')
+        self.timeframes: list[int] = [int(timeframe) for timeframe in self.config.timeframes.aggregated]
+        self.indicators: list[tuple[str, list]] = self.ti.get_configured_indicators()
+        self.columns: list[str] = ['open', 'close'] + self.ti.get_output_columns(self.indicators)
+        # Start of the newest stored bar of each timeframe table: {table: pd.Timestamp | None}
+        self.last_bars: dict = {}
+
+    def get_last_bar(self, table: str) -> pd.Timestamp | None:
+        """
+        Returns the start of the newest stored bar of a timeframe table.
+
+        Parameters:
+        - table (str): The timeframe table.
+
+        Returns:
+        - pd.Timestamp | None: The start of the newest bar, None if the table is empty.
+        """
+        if table not in self.last_bars:
+            result: tuple | None = self.db.execute_read_query(f'SELECT MAX("timestamp") FROM {table}', first_only=True)
+            self.last_bars[table] = None if result is None or result[0] is None else pd.Timestamp(result[0])
+        return self.last_bars[table]
+
+    def aggregate(self, symbol: str, timeframe: int, start: pd.Timestamp | None, end: pd.Timestamp) -> pd.DataFrame:
+        """
+        Aggregates the 1-minute bars of a symbol within a time range into bars of a timeframe.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - timeframe (int): The timeframe in minutes.
+        - start (pd.Timestamp | None): The start of the first bar (inclusive). None aggregates from the oldest bar.
+        - end (pd.Timestamp): The start of the first bar which is not aggregated (exclusive).
+
+        Returns:
+        - pd.DataFrame: The columns 'timestamp', 'open' and 'close', sorted by timestamp.
+        """
+        query: str = f"""SELECT date_bin(INTERVAL '{timeframe} minutes', "timestamp", TIMESTAMP '1970-01-01') AS bar,
+                                (ARRAY_AGG(open ORDER BY "timestamp"))[1] AS open,
+                                (ARRAY_AGG(close ORDER BY "timestamp" DESC))[1] AS close
+                         FROM {symbol.lower()} WHERE "timestamp" < %s"""
+        params: tuple = (end.to_pydatetime(),)
+        if start is not None:
+            query += ' AND "timestamp" >= %s'
+            params += (start.to_pydatetime(),)
+        rows: list | None = self.db.execute_read_query(query + ' GROUP BY bar ORDER BY bar', params)
+        return pd.DataFrame(rows or [], columns=['timestamp', 'open', 'close'])
+
+    def add_indicators(self, table: str, bars: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calculates the technical indicators of new bars, continued from the last timeframe.warmup_bars stored bars
+        of the timeframe table. Bars without enough history for all indicators are dropped, like the ingestion
+        drops them from the 1-minute bars.
+
+        Parameters:
+        - table (str): The timeframe table.
+        - bars (pd.DataFrame): The new bars as returned by aggregate.
+
+        Returns:
+        - pd.DataFrame: The new bars with the technical indicators.
+        """
+        query: str = f'SELECT open FROM {table} WHERE "timestamp" < %s ORDER BY "timestamp" DESC LIMIT {int(self.config.timeframes.warmup_bars)}'
+        history: list | None = self.db.execute_read_query(query, (bars['timestamp'].iloc[0].to_pydatetime(),))
+        warmup: np.ndarray = np.array([row[0] for row in reversed(history or [])], dtype=np.float64)
+        opens: pd.Series = pd.Series(np.concatenate([warmup, bars['open'].to_numpy(dtype=np.float64)]))
+        values: np.ndarray = self.ti.calc_fused(opens, self.indicators)[len(warmup):]
+        bars = bars.copy()
+        for index, column in enumerate(self.ti.get_output_columns(self.indicators)):
+            bars[column] = values[:, index]
+        return bars.dropna().reset_index(drop=True)
+
+    def insert_bars(self, table: str, bars: pd.DataFrame) -> None:
+        """
+        Inserts bars into a timeframe table, existing bars are updated.
+
+        Parameters:
+        - table (str): The timeframe table.
+        - bars (pd.DataFrame): The bars with the columns 'timestamp' and self.columns.
+
+        Returns:
+        - None
+        """
+        columns: str = ','.join(['"timestamp"'] + [f'"{column}"' for column in self.columns])
+        updates: str = ','.join([f'"{column}" = EXCLUDED."{column}"' for column in self.columns])
+        query: str = f'INSERT INTO {table} ({columns}) VALUES %s ON CONFLICT ("timestamp") DO UPDATE SET {updates}'
+        rows: list[tuple] = [(timestamp.to_pydatetime(),) + tuple(float(value) for value in values)
+                             for timestamp, values in zip(bars['timestamp'], bars[self.columns].to_numpy(dtype=np.float64))]
+        try:
+            psycopg2.extras.execute_values(self.db.cursor, query, rows, page_size=1_000)
+            self.db.commit()
+        except Exception as e:
+            self.db.connection.rollback()
+            self.logger.error(f'insert_bars: Error inserting {len(rows)} bars into {table}: {str(e)}')
+            raise
+
+    def update(self, symbol: str, newest: datetime.datetime = None) -> int:
+        """
+        Aggregates all bars of every timeframe of a symbol which closed since the newest stored bar. A bar is closed
+        as soon as a 1-minute bar of the following bar exists.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - newest (datetime.datetime, optional): The newest 1-minute bar of the symbol. Defaults to the newest bar in
+          the database.
+
+        Returns:
+        - int: The number of new bars of all timeframes.
+        """
+        if newest is None:
+            newest = self.db.determine_newest_data(symbol.lower())
+        if newest is None:
+            return 0
+        inserted: int = 0
+        for timeframe in self.timeframes:
+            table: str = get_table_name(symbol, timeframe)
+            closed_end: pd.Timestamp = get_bar_start(newest, timeframe)
+            last_bar: pd.Timestamp | None = self.get_last_bar(table)
+            start: pd.Timestamp | None = None if last_bar is None else last_bar + pd.Timedelta(minutes=timeframe)
+            if start is not None and start >= closed_end:
+                continue
+            bars: pd.DataFrame = self.aggregate(symbol, timeframe, start, closed_end)
+            if bars.empty:
+                continue
+            bars['timestamp'] = pd.to_datetime(bars['timestamp'])
+            bars = self.add_indicators(table, bars)
+            if bars.empty:
+                continue
+            self.insert_bars(table, bars)
+            self.last_bars[table] = bars['timestamp'].iloc[-1]
+            inserted += len(bars)
+            self.logger.info(f'update: Aggregated {len(bars)} bars of {table} up to {bars["timestamp"].iloc[-1]}')
+        return inserted
+
+    def rebuild_from(self, symbol: str, start: datetime.datetime) -> int:
+        """
+        Aggregates all bars of every timeframe of a symbol again which contain 1-minute bars since a date, e.g. after
+        a gap in the 1-minute bars was filled.
+
+        Parameters:
+        - symbol (str): The symbol.
+        - start (datetime.datetime): The first rewritten 1-minute bar.
+
+        Returns:
+        - int: The number of aggregated bars of all timeframes.
+        """
+        for timeframe in self.timeframes:
+            table: str = get_table_name(symbol, timeframe)
+            bar_start: pd.Timestamp = get_bar_start(start, timeframe)
+            self.db.execute_write_query(f'DELETE FROM {table} WHERE "timestamp" >= %s', (bar_start.to_pydatetime(),))
+            self.db.commit()
+            self.last_bars.pop(table, None)
+            if self.config.dataset_cache.enabled:
+                self.dataset_cache.invalidate(table, start=bar_start)
+        return self.update(symbol)
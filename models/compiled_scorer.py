@@ -0,0 +1,264 @@
+"""
+This python module contains the compiled scorer which evaluates trained xgboost models with NumPy.
+
+For a single row the per call overhead of XGBClassifier.predict (input validation, building a DMatrix) is much
+larger than the traversal of the trees itself. The compiled scorer flattens all trees of a booster into contiguous
+node arrays (feature index, threshold, children, default direction and leaf value) and evaluates all rows and all
+trees at once, one tree level per step. Several compiled models can be stacked into a CompiledScorerGroup, which
+scores one row for each of many bots in a single pass.
+
+Only boosters with tree_method based numeric splits and the objective 'binary:logistic' are supported. Categorical
+splits are not supported.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import json
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+class CompiledScorer:
+    def __init__(self, booster: xgb.Booster) -> None:
+        """
+        Initialize the CompiledScorer class by flattening the trees of a booster into node arrays.
+
+        The nodes of all trees are stored in one array. Leaves point to themselves as left and right child, so that
+        a traversal which already reached a leaf stays there while deeper trees are still evaluated.
+
+        Parameters:
+        - booster (xgb.Booster): The trained booster.
+
+        Returns:
+        - None
+        """
+        model: dict = json.loads(booster.save_raw('json'))
+        learner: dict = model['learner']
+        objective: str = learner['objective']['name']
+        if objective != 'binary:logistic':
+            raise ValueError(f'CompiledScorer only supports the objective binary:logistic, not {objective}')
+        if learner['gradient_booster']['name'] != 'gbtree':
+            raise ValueError('CompiledScorer only supports the booster gbtree')
+
+        base_score: float = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+        self.base_margin: np.float32 = np.float32(np.log(base_score / (1 - base_score)))
+        self.number_of_features: int = int(learner['learner_model_param']['num_feature'])
+        self.feature_names: list[str] | None = booster.feature_names
+
+        trees: list[dict] = learner['gradient_booster']['model']['trees']
+        features, thresholds, left, right, default_left, values, roots = [], [], [], [], [], [], []
+        max_depth: int = 0
+        offset: int = 0
+        for tree in trees:
+            if any(tree.get('split_type', [])):
+                raise ValueError('CompiledScorer does not support categorical splits')
+            left_children = np.asarray(tree['left_children'], dtype=np.int32)
+            right_children = np.asarray(tree['right_children'], dtype=np.int32)
+            is_leaf = left_children == -1
+            node_ids = np.arange(len(left_children), dtype=np.int32)
+
+            features.append(np.where(is_leaf, 0, np.asarray(tree['split_indices'], dtype=np.int32)))
+            thresholds.append(np.asarray(tree['split_conditions'], dtype=np.float32))
+            left.append(np.where(is_leaf, node_ids, left_children) + offset)
+            right.append(np.where(is_leaf, node_ids, right_children) + offset)
+            default_left.append(np.asarray(tree['default_left'], dtype=bool))
+            values.append(np.where(is_leaf, np.asarray(tree['split_conditions'], dtype=np.float32), np.float32(0)))
+            roots.append(offset)
+            max_depth = max(max_depth, self.get_tree_depth(left_children, right_children))
+            offset += len(left_children)
+
+        self.features: np.ndarray = np.concatenate(features) if trees else np.zeros(1, dtype=np.int32)
+        self.thresholds: np.ndarray = np.concatenate(thresholds) if trees else np.zeros(1, dtype=np.float32)
+        self.left: np.ndarray = np.concatenate(left) if trees else np.zeros(1, dtype=np.int32)
+        self.right: np.ndarray = np.concatenate(right) if trees else np.zeros(1, dtype=np.int32)
+        self.default_left: np.ndarray = np.concatenate(default_left) if trees else np.ones(1, dtype=bool)
+        self.values: np.ndarray = np.concatenate(values) if trees else np.zeros(1, dtype=np.float32)
+        self.roots: np.ndarray = np.asarray(roots if trees else [0], dtype=np.int32)
+        self.max_depth: int = max_depth
+
+    @staticmethod
+    def get_tree_depth(left_children: np.ndarray, right_children: np.ndarray) -> int:
+        """
+        Determines the depth of a tree, i.e. the number of splits on the longest path from the root to a leaf.
+
+        Parameters:
+        - left_children (np.ndarray): The index of the left child of each node or -1 for leaves.
+        - right_children (np.ndarray): The index of the right child of each node or -1 for leaves.
+
+        Returns:
+        - int: The depth of the tree.
+        """
+        depth: np.ndarray = np.zeros(len(left_children), dtype=np.int32)
+        # Children always have a higher index than their parent
+        for node in range(len(left_children)):
+            if left_children[node] != -1:
+                depth[left_children[node]] = depth[node] + 1
+                depth[right_children[node]] = depth[node] + 1
+        return int(depth.max()) if len(depth) else 0
+
+    def prepare_features(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """
+        Converts the features into a float32 array whose columns are in the order the booster was trained with.
+
+        Parameters:
+        - features (pd.DataFrame | np.ndarray): The features. DataFrames are reordered by the feature names of the booster.
+
+        Returns:
+        - np.ndarray: A 2D float32 array with one row per sample.
+        """
+        if isinstance(features, pd.DataFrame):
+            if self.feature_names is not None:
+                features = features[self.feature_names]
+            features = features.to_numpy(dtype=np.float32)
+        return np.atleast_2d(np.asarray(features, dtype=np.float32))
+
+    def traverse(self, features: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        """
+        Moves every row through its trees one level per step until all rows reached a leaf in every tree.
+
+        Parameters:
+        - features (np.ndarray): A 2D float32 array with one row per sample.
+        - nodes (np.ndarray): A 2D array with the root node of every tree for every row, shape (rows, trees).
+
+        Returns:
+        - np.ndarray: The reached leaf of every tree for every row, shape (rows, trees).
+        """
+        rows: np.ndarray = np.arange(features.shape[0])[:, None]
+        for _ in range(self.max_depth):
+            values: np.ndarray = features[rows, self.features[nodes]]
+            go_left: np.ndarray = np.where(np.isnan(values), self.default_left[nodes], values < self.thresholds[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_margin(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """
+        Calculates the raw margin (log odds) of every row.
+
+        Parameters:
+        - features (pd.DataFrame | np.ndarray): The features.
+
+        Returns:
+        - np.ndarray: The margin of every row.
+        """
+        features = self.prepare_features(features)
+        nodes: np.ndarray = np.broadcast_to(self.roots, (features.shape[0], len(self.roots)))
+        leaves: np.ndarray = self.traverse(features, nodes)
+        return self.values[leaves].sum(axis=1, dtype=np.float32) + self.base_margin
+
+    def predict_proba(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """
+        Calculates the class probabilities of every row like XGBClassifier.predict_proba.
+
+        Parameters:
+        - features (pd.DataFrame | np.ndarray): The features.
+
+        Returns:
+        - np.ndarray: An array of shape (rows, 2) with the probabilities of class 0 and class 1.
+        """
+        probability: np.ndarray = 1 / (1 + np.exp(-self.predict_margin(features)))
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """
+        Predicts the class of every row like XGBClassifier.predict.
+
+        Parameters:
+        - features (pd.DataFrame | np.ndarray): The features.
+
+        Returns:
+        - np.ndarray: The predicted class (0 or 1) of every row.
+        """
+        return (self.predict_margin(features) > 0).astype(np.int64)
+
+
+class CompiledScorerGroup(CompiledScorer):
+    def __init__(self, scorers: list[CompiledScorer]) -> None:
+        """
+        Initialize the CompiledScorerGroup class by stacking the node arrays of several compiled models.
+
+        Every model gets the same number of tree slots. Models with fewer trees are padded with a shared leaf
+        whose value is 0, so that the rows of all models can be traversed together.
+
+        Parameters:
+        - scorers (list[CompiledScorer]): The compiled models, e.g. one per running bot.
+
+        Returns:
+        - None
+        """
+        self.scorers: list[CompiledScorer] = scorers
+        self.feature_names = None
+        self.number_of_features = max(scorer.number_of_features for scorer in scorers)
+        self.max_depth = max(scorer.max_depth for scorer in scorers)
+        self.base_margins: np.ndarray = np.asarray([scorer.base_margin for scorer in scorers], dtype=np.float32)
+
+        number_of_trees: int = max(len(scorer.roots) for scorer in scorers)
+        # Node 0 is the padding leaf
+        features, thresholds, left, right, default_left, values = [np.zeros(1, dtype=np.int32)], [np.zeros(1, dtype=np.float32)], \
+            [np.zeros(1, dtype=np.int32)], [np.zeros(1, dtype=np.int32)], [np.ones(1, dtype=bool)], [np.zeros(1, dtype=np.float32)]
+        self.model_roots: np.ndarray = np.zeros((len(scorers), number_of_trees), dtype=np.int32)
+        offset: int = 1
+        for index, scorer in enumerate(scorers):
+            features.append(scorer.features)
+            thresholds.append(scorer.thresholds)
+            left.append(scorer.left + offset)
+            right.append(scorer.right + offset)
+            default_left.append(scorer.default_left)
+            values.append(scorer.values)
+            self.model_roots[index, :len(scorer.roots)] = scorer.roots + offset
+            offset += len(scorer.features)
+
+        self.features = np.concatenate(features)
+        self.thresholds = np.concatenate(thresholds)
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.default_left = np.concatenate(default_left)
+        self.values = np.concatenate(values)
+
+    def predict_margin_group(self, rows: list[pd.DataFrame | np.ndarray]) -> np.ndarray:
+        """
+        Calculates the margin of one row per model in a single traversal.
+
+        Parameters:
+        - rows (list[pd.DataFrame | np.ndarray]): One row of features per model, in the order of the models.
+
+        Returns:
+        - np.ndarray: The margin of every row.
+        """
+        features: np.ndarray = np.full((len(rows), self.number_of_features), np.nan, dtype=np.float32)
+        for index, (scorer, row) in enumerate(zip(self.scorers, rows)):
+            row = scorer.prepare_features(row)[-1]
+            features[index, :len(row)] = row
+        leaves: np.ndarray = self.traverse(features, self.model_roots[:len(rows)])
+        return self.values[leaves].sum(axis=1, dtype=np.float32) + self.base_margins[:len(rows)]
+
+    def predict_proba_group(self, rows: list[pd.DataFrame | np.ndarray]) -> np.ndarray:
+        """
+        Calculates the class probabilities of one row per model.
+
+        Parameters:
+        - rows (list[pd.DataFrame | np.ndarray]): One row of features per model, in the order of the models.
+
+        Returns:
+        - np.ndarray: An array of shape (models, 2) with the probabilities of class 0 and class 1.
+        """
+        probability: np.ndarray = 1 / (1 + np.exp(-self.predict_margin_group(rows)))
+        return np.column_stack([1 - probability, probability])
+
+    def predict_group(self, rows: list[pd.DataFrame | np.ndarray]) -> np.ndarray:
+        """
+        Predicts the class of one row per model.
+
+        Parameters:
+        - rows (list[pd.DataFrame | np.ndarray]): One row of features per model, in the order of the models.
+
+        Returns:
+        - np.ndarray: The predicted class (0 or 1) of every model.
+        """
+        return (self.predict_margin_group(rows) > 0).astype(np.int64)
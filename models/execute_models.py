@@ -14,31 +14,327 @@ for part in basedir_split:
     
 import time
 import datetime
+import threading
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
     
 from config.config import load_config
 from infrastructure.database import Database
+from infrastructure.logger import create_logger
+from infrastructure.timeframe_aggregator import get_table_name
+from models.lease_manager import LeaseManager
 from models.prepare_training_data import PrepareTrainingData
 from models.xgboost_model import XGBoostModel
 
 class ExecuteModels:
-    def __init__(self) -> None:
+    def __init__(self, worker_id: str = None) -> None:
         """
         Initialize the ExecuteModels class.
 
         This class is responsible for executing the prediction models and executing trades based on the predictions.
+        If distributed.enabled is set, the instance acts as a prediction worker which only executes the bots it
+        leased from the 'bot_leases' table (see LeaseManager).
 
         Parameters:
-        - None
+        - worker_id (str, optional): The unique name of the worker in distributed mode. Defaults to None.
 
         Returns:
         - None
         """
         self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
         self.db: Database = Database()
-        self.ptd: PrepareTrainingData = PrepareTrainingData()
+        # Queries of a prediction are cancelled by the server after the deadline, so they can not block a pool thread
+        self.ptd: PrepareTrainingData = PrepareTrainingData(db=Database(statement_timeout_seconds=self.config.prediction.deadline_seconds))
         self.TRADING_FEE: float = float(self.config.trading_fees)
+        self.model_classes: dict = {}
+        # Live models which were already used for a prediction: {(user, bot_id): (version, model)}
+        self.loaded_models: dict = {}
+        self.logger = create_logger('execute_models.log')
+        # xgboost releases the GIL while predicting, so the bots of one tick are scored in parallel
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=self.config.prediction.max_workers, thread_name_prefix='prediction')
+        # Predictions which missed their deadline and are still running: {(user, bot_id): future}
+        self.stuck_predictions: dict = {}
+        # Duration of the last prediction of each bot in seconds: {(user, bot_id): seconds}
+        self.prediction_times: dict = {}
+        self.prediction_stats: dict = {'ticks': 0, 'predicted': 0, 'missed_deadline': 0, 'failed': 0, 'skipped_stuck': 0, 'executor_replaced': 0}
+        self.leases: LeaseManager | None = LeaseManager(worker_id, self.db) if self.config.distributed.enabled else None
+        # Time of the last iteration of prediction_loop, reported by the health server of the execution role
+        self.last_progress: float = time.time()
+
+    def get_model_class(self, model_type: str) -> object:
+        """
+        Returns the model class which is responsible for the given model type. One instance per model type is
+        created and reused for all bots.
+
+        Parameters:
+        - model_type (str): The type of the model, e.g. 'xgboost'.
+
+        Returns:
+        - object: The instance of the model class.
+        """
+        model_type = model_type.lower()
+        if model_type not in self.model_classes:
+            if model_type == 'xgboost':
+                self.model_classes[model_type] = XGBoostModel()
+            # Add other model types here
+        return self.model_classes[model_type]
+
+    def get_live_model(self, row: pd.Series) -> object:
+        """
+        Returns the live model of a running bot. The model is loaded lazily on its first use and kept in memory
+        until the model registry reports another live version or the bot stops running. If prediction.compiled_scorer
+        is enabled, the trees of the model are compiled into a NumPy scorer once when the model is loaded.
+
+        Parameters:
+        - row (pd.Series): A row of the DataFrame returned by Database.get_all_running_models.
+
+        Returns:
+        - object: The loaded live model.
+        """
+        key: tuple = (int(row['user']), int(row['id']))
+        version: int | None = None if pd.isna(row['live_version']) else int(row['live_version'])
+        cached: tuple | None = self.loaded_models.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        model_class = self.get_model_class(row['model_type'])
+        model = model_class.load_model(key[0], key[1], use_cache=False, version=version)
+        if self.config.prediction.compiled_scorer and hasattr(model_class, 'compile_model'):
+            model = model_class.compile_model(model)
+        self.loaded_models[key] = (version, model)
+        return model
+
+    def release_idle_models(self, running_models: pd.DataFrame) -> None:
+        """
+        Removes all models and prediction times from memory which belong to bots that are not running anymore.
+
+        Parameters:
+        - running_models (pd.DataFrame): The DataFrame returned by Database.get_all_running_models.
+
+        Returns:
+        - None
+        """
+        running_keys: set = set(zip(running_models['user'].astype(int), running_models['id'].astype(int)))
+        for key in list(self.loaded_models.keys()):
+            if key not in running_keys:
+                del self.loaded_models[key]
+        for key in list(self.prediction_times.keys()):
+            if key not in running_keys:
+                del self.prediction_times[key]
+
+    def get_table(self, row: pd.Series) -> str:
+        """
+        Returns the table which contains the bars of the symbol of a bot in the timeframe of the bot.
+
+        Parameters:
+        - row (pd.Series): A row of the DataFrame returned by Database.get_all_running_models.
+
+        Returns:
+        - str: The table, e.g. 'btcusd' or 'btcusd_60m'.
+        """
+        return get_table_name(row['symbol'], None if pd.isna(row['timeframe']) else int(row['timeframe']))
+
+    def get_bars(self, running_models: pd.DataFrame, bar: datetime.datetime) -> dict:
+        """
+        Returns the bar for which every running bot predicts in this tick: the current minute for bots with a
+        timeframe of 1 minute and the newest closed bar of their timeframe for bots with a higher timeframe. The
+        newest bar of every timeframe table is queried once per tick.
+
+        Parameters:
+        - running_models (pd.DataFrame): The DataFrame returned by Database.get_all_running_models.
+        - bar (datetime.datetime): The start of the current minute.
+
+        Returns:
+        - dict: The bar of every bot, {(user, bot_id): timestamp}. Bots whose timeframe table is empty are missing.
+        """
+        newest_bars: dict = {}
+        bars: dict = {}
+        for _, row in running_models.iterrows():
+            key: tuple = (int(row['user']), int(row['id']))
+            table: str = self.get_table(row)
+            if table == row['symbol'].lower():
+                bars[key] = bar
+                continue
+            if table not in newest_bars:
+                result: tuple | None = self.db.execute_read_query(f'SELECT MAX("timestamp") FROM {table}', first_only=True)
+                newest_bars[table] = None if result is None else result[0]
+            if newest_bars[table] is not None:
+                bars[key] = newest_bars[table]
+        return bars
+
+    def filter_closed_bars(self, running_models: pd.DataFrame, bars: dict) -> pd.DataFrame:
+        """
+        Keeps the bots which were not executed for their bar yet, see get_bars. The executed bar of every bot is read
+        from 'last_bar' of the 'bot_leases' table, in which it is recorded after the trades of the bot were executed
+        (see record_bar), so a bar is not predicted again after a restart of the process or after the lease of a bot
+        moved to another worker, and a bar whose prediction failed is predicted again. This also holds for bots with a
+        timeframe of 1 minute, so a tick which runs twice within the same minute does not trade twice.
+
+        Parameters:
+        - running_models (pd.DataFrame): The DataFrame returned by Database.get_all_running_models.
+        - bars (dict): The bar of every bot, see get_bars.
+
+        Returns:
+        - pd.DataFrame: The rows of the bots which predict in this tick.
+        """
+        rows: list = self.db.execute_read_query('SELECT "user", bot_id, last_bar FROM bot_leases WHERE last_bar IS NOT NULL') or []
+        self.db.commit()
+        last_bars: dict = {(int(user), int(bot_id)): last_bar for user, bot_id, last_bar in rows}
+        keep: list[bool] = []
+        for _, row in running_models.iterrows():
+            key: tuple = (int(row['user']), int(row['id']))
+            if key not in bars:
+                keep.append(False)
+            else:
+                keep.append(key not in last_bars or last_bars[key] < bars[key])
+        return running_models[keep]
+
+    def record_bar(self, row: pd.Series, bar: datetime.datetime) -> None:
+        """
+        Records in 'last_bar' of the 'bot_leases' table that a bot was executed for a bar, after its trades were
+        executed. In the distributed mode the bar is only recorded while this worker holds the lease of the bot (see
+        LeaseManager.record_bar), otherwise with a conditional upsert.
+
+        Parameters:
+        - row (pd.Series): A row of the DataFrame returned by Database.get_all_running_models.
+        - bar (datetime.datetime): The bar of the bot, see get_bars.
+
+        Returns:
+        - None
+        """
+        user, bot_id = int(row['user']), int(row['id'])
+        if self.leases is not None:
+            if not self.leases.record_bar(user, bot_id, bar):
+                self.logger.warning(f'record_bar: The bar {bar} of bot {user}_{bot_id} was not recorded, the lease expired')
+            return
+        query: str = 'INSERT INTO bot_leases ("user", bot_id, last_bar) VALUES (%s, %s, %s) ON CONFLICT ("user", bot_id)'
+        query += ' DO UPDATE SET last_bar = EXCLUDED.last_bar WHERE bot_leases.last_bar IS NULL OR bot_leases.last_bar < EXCLUDED.last_bar'
+        self.db.execute_write_query(query, (user, bot_id, bar))
+        self.db.commit()
+
+    def filter_leased_bots(self, running_models: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keeps only the running bots which are leased by this worker.
+
+        Parameters:
+        - running_models (pd.DataFrame): The DataFrame returned by Database.get_all_running_models.
+
+        Returns:
+        - pd.DataFrame: The rows of the bots which are leased by this worker.
+        """
+        claimed: set[tuple[int, int]] = self.leases.claim_bots()
+        keep: list[bool] = [(int(row['user']), int(row['id'])) in claimed for _, row in running_models.iterrows()]
+        return running_models[keep]
+
+    def predict_bot(self, row: pd.Series, model: object, deadline: float) -> tuple[int, float]:
+        """
+        Loads the latest features of a bot and lets its model predict. Executed in a thread of the prediction pool.
+        The queries are cancelled by the server after prediction.deadline_seconds and the model does not predict if
+        the deadline passed while the features were loaded, so the thread is released for the next tick.
+
+        Parameters:
+        - row (pd.Series): A row of the DataFrame returned by Database.get_all_running_models.
+        - model (object): The live model of the bot.
+        - deadline (float): The time.perf_counter() value after which the result is not used anymore.
+
+        Returns:
+        - tuple[int, float]: The prediction and the time it took in seconds.
+        """
+        start_time: float = time.perf_counter()
+        if start_time > deadline:
+            raise TimeoutError('The deadline passed before the prediction started')
+        prediction_features: pd.DataFrame = self.ptd.load_data_for_prediction(
+            symbol=self.get_table(row),
+            feature_columns=row['technical_indicators'].split(',')
+        )
+        if time.perf_counter() > deadline:
+            raise TimeoutError('The deadline passed while the features were loaded')
+        pred = model.predict(prediction_features)
+        return int(pred[0]), time.perf_counter() - start_time
+
+    def release_stuck_predictions(self) -> None:
+        """
+        Forgets the predictions which missed their deadline and finished meanwhile. If at least
+        prediction.max_stuck_predictions are still running, the thread pool is replaced by a new one, so the stuck
+        threads can not exhaust the pool. The stuck threads end on their own and their results are discarded.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        for key, future in list(self.stuck_predictions.items()):
+            if future.done():
+                del self.stuck_predictions[key]
+        if len(self.stuck_predictions) >= self.config.prediction.max_stuck_predictions:
+            self.logger.error(f'release_stuck_predictions: {len(self.stuck_predictions)} predictions are stuck, replacing the prediction pool')
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = ThreadPoolExecutor(max_workers=self.config.prediction.max_workers, thread_name_prefix='prediction')
+            self.stuck_predictions.clear()
+            self.prediction_stats['executor_replaced'] += 1
+
+    def run_predictions(self, running_models: pd.DataFrame) -> list[tuple[pd.Series, int]]:
+        """
+        Lets all running bots predict in parallel on the prediction thread pool. Bots which do not finish within
+        prediction.deadline_seconds are skipped for this tick and counted, so a slow model does not delay the other
+        bots. A bot whose prediction of an earlier tick is still running is skipped until it finished (see
+        release_stuck_predictions). The duration of every finished prediction is recorded in self.prediction_times.
+
+        Parameters:
+        - running_models (pd.DataFrame): The DataFrame returned by Database.get_all_running_models.
+
+        Returns:
+        - list[tuple[pd.Series, int]]: The row and the prediction of every bot which finished in time, in the order of 'running_models'.
+        """
+        self.release_stuck_predictions()
+        deadline: float = time.perf_counter() + self.config.prediction.deadline_seconds
+        futures: list = []
+        for _, row in running_models.iterrows():
+            key: tuple = (int(row['user']), int(row['id']))
+            if key in self.stuck_predictions:
+                # The prediction of a previous tick still occupies a thread, a second one would occupy another
+                self.prediction_stats['skipped_stuck'] += 1
+                continue
+            try:
+                model = self.get_live_model(row)
+            except Exception as e:
+                self.logger.error(f'run_predictions: Could not load model_{row["user"]}_{row["id"]}: {str(e)}')
+                self.prediction_stats['failed'] += 1
+                continue
+            futures.append((row, self.executor.submit(self.predict_bot, row, model, deadline)))
+
+        wait([future for _, future in futures], timeout=max(deadline - time.perf_counter(), 0))
+
+        results: list[tuple[pd.Series, int]] = []
+        for row, future in futures:
+            key: tuple = (int(row['user']), int(row['id']))
+            if not future.done():
+                # A queued prediction is cancelled, a running one raises or returns after its deadline
+                if not future.cancel():
+                    self.stuck_predictions[key] = future
+                self.prediction_stats['missed_deadline'] += 1
+                self.logger.warning(f'run_predictions: model_{key[0]}_{key[1]} missed the deadline of {self.config.prediction.deadline_seconds}s')
+                continue
+            try:
+                pred, duration = future.result()
+            except TimeoutError:
+                self.prediction_stats['missed_deadline'] += 1
+                self.logger.warning(f'run_predictions: model_{key[0]}_{key[1]} missed the deadline of {self.config.prediction.deadline_seconds}s')
+                continue
+            except Exception as e:
+                self.prediction_stats['failed'] += 1
+                self.logger.error(f'run_predictions: Prediction of model_{key[0]}_{key[1]} failed: {str(e)}')
+                continue
+            self.prediction_times[key] = duration
+            if duration > self.config.prediction.slow_bot_seconds:
+                self.logger.warning(f'run_predictions: model_{key[0]}_{key[1]} took {duration:.3f}s to predict')
+            results.append((row, pred))
+
+        self.prediction_stats['ticks'] += 1
+        self.prediction_stats['predicted'] += len(results)
+        return results
 
     def stop_loss_trake_profit_loop(self) -> None:
         pass
@@ -47,6 +343,9 @@ class ExecuteModels:
         """
         This function is responsible for executing the prediction models and executing trades based on the predictions.
         It runs in an infinite loop, checking every second if it's time to make predictions.
+        The predictions of one tick are made in parallel (see run_predictions), the trades are executed afterwards
+        one bot after another in a stable order. Bots with a higher timeframe only predict in the ticks in which a new
+        bar of their timeframe closed (see get_bars and filter_closed_bars).
 
         Parameters:
         - self (ExecuteModels): The instance of the ExecuteModels class.
@@ -54,34 +353,30 @@ class ExecuteModels:
         Returns:
         - None
         """
+        if self.leases is not None:
+            heartbeat_thread = threading.Thread(target=self.leases.heartbeat_loop, args=(lambda: self.last_progress,), daemon=True)
+            heartbeat_thread.start()
         while True:
-            # TODO Different models can have different time frames --> rewrite this function
+            self.last_progress = time.time()
             if datetime.datetime.now().second == 0:
+                bar: datetime.datetime = datetime.datetime.now().replace(second=0, microsecond=0)
                 time.sleep(0.5) # TODO This makes sure that the data is available in the database. Write code which checks if the data is available and then execute the following code
                 running_models = self.db.get_all_running_models()
-                for _, row in running_models.iterrows():
-                    prediction_features: pd.DataFrame = self.ptd.load_data_for_prediction(
-                        symbol=row['symbol'],
-                        feature_columns=row['technical_indicators'].split(',')
-                    )
-                    if row['model_type'].lower() == 'xgboost':
-                        model_class = XGBoostModel()
-                        model = model_class.load_model(row['user'], row['id'])
-
-                    pred = model.predict(prediction_features)
-                    pred = int(pred[0])
-
+                if self.leases is not None:
+                    running_models = self.filter_leased_bots(running_models)
+                self.release_idle_models(running_models)
+                bars: dict = self.get_bars(running_models, bar)
+                running_models = self.filter_closed_bars(running_models, bars)
+                for row, pred in self.run_predictions(running_models):
                     # TODO Delete this
                     pred = np.random.randint(0,2)
 
-                    self.db.update_table(
-                        table_name='bots',
-                        column='prediction',
-                        value=pred,
-                        where_condition=f'WHERE "user"={row["user"]} AND "id"={row["id"]}'
-                    )
+                    self.db.set_prediction(row['user'], row['id'], pred)
 
                     self.execute_trades(row)
+                    # Only bars whose trades were executed are recorded, failed predictions are repeated in the next tick
+                    self.record_bar(row, bars[(int(row['user']), int(row['id']))])
+                    self.last_progress = time.time()
 
                     print(f'Model_{row["user"]}_{row["id"]} predicts for {row["symbol"]}: ', pred)
 
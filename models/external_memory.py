@@ -0,0 +1,197 @@
+"""
+This python module contains the data iterator which streams training data from a symbol table into xgboost.
+
+The iterator reads the rows of a date range with a server-side cursor in chunks and hands one chunk after another
+to xgboost. xgboost stores the chunks in its on-disk cache (external memory DMatrix), so the memory needed for
+the training is bounded by the chunk size and not by the length of the date range.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import uuid
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from models.prepare_training_data import PrepareTrainingData
+
+class DatabaseChunkIterator(xgb.DataIter):
+    """
+    xgboost data iterator which streams the features and targets of a symbol table in chunks.
+    """
+    def __init__(self, ptd: PrepareTrainingData, symbol: str, feature_columns: list[str], min_date: str = None, max_date: str = None,
+                 chunk_size: int = 100_000, cache_dir: str = None, progress_callback=None) -> None:
+        """
+        Initialize the DatabaseChunkIterator class.
+
+        Parameters:
+        - ptd (PrepareTrainingData): The instance which is used to access the database and to prepare the chunks.
+        - symbol (str): The symbol table from which the data is read.
+        - feature_columns (list[str]): The technical indicators which are used as features.
+        - min_date (str, optional): The minimum date of the data. Defaults to None.
+        - max_date (str, optional): The maximum date of the data. Defaults to None.
+        - chunk_size (int, optional): The number of rows per chunk. Defaults to 100_000.
+        - cache_dir (str, optional): The directory in which xgboost stores its external memory cache. If None,
+          the data is not cached on disk and has to be iterated for every use. Defaults to None.
+        - progress_callback (callable, optional): A function which is called after each chunk with the number of the
+          chunk and the number of rows read so far. Defaults to None.
+
+        Returns:
+        - None
+        """
+        self.ptd = ptd
+        self.symbol = symbol
+        self.column_names: list[str] = ptd.get_feature_names(feature_columns)
+        self.feature_names: list[str] = self.column_names + ['return']
+        computed: dict = ptd.indicators.get_columns(feature_columns)[1]
+        self.stored_names: list[str] = [column for column in self.column_names if column not in computed]
+        # Indicators with parameters of the bot are not stored in the symbol table, they are computed once for the whole range
+        self.computed_frame: pd.DataFrame | None = ptd.indicators.get_range(symbol, computed, min_date, max_date) if computed else None
+        self.date_condition: str = ptd.build_date_condition(min_date, max_date)
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self.cursor = None
+        self.chunk: int = 0
+        self.rows_read: int = 0
+        self.features: np.ndarray = np.empty((chunk_size, len(self.feature_names)), dtype=np.float32)
+        self.target: np.ndarray = np.empty(chunk_size, dtype=np.float32)
+        self.timestamps: np.ndarray = np.empty(chunk_size, dtype='datetime64[ns]')
+
+        cache_prefix: str = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_prefix = os.path.join(cache_dir, f'{symbol}_{uuid.uuid4().hex}')
+        super().__init__(cache_prefix=cache_prefix)
+
+    def open_cursor(self) -> None:
+        """
+        Opens a new server-side cursor which reads the date range ordered by time.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.close_cursor()
+        selected_columns: str = ','.join(['"timestamp"'] + [f'"{column}"' for column in self.stored_names])
+        self.cursor = self.ptd.db.connection.cursor(name=f'external_memory_{uuid.uuid4().hex}')
+        self.cursor.itersize = self.chunk_size
+        self.cursor.execute(f"SELECT {selected_columns} FROM {self.symbol}{self.date_condition} ORDER BY timestamp")
+
+    def close_cursor(self) -> None:
+        """
+        Closes the server-side cursor if one is open and ends its transaction.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+            self.ptd.db.commit()
+
+    def read_chunk(self) -> tuple | None:
+        """
+        Reads the next chunk from the database and prepares it with PrepareTrainingData.fill_training_chunk.
+
+        Parameters:
+        - None
+
+        Returns:
+        - tuple | None: A tuple (features, target, timestamps) of views into the chunk buffers, or None if all rows were read.
+        """
+        if self.cursor is None:
+            self.open_cursor()
+        while True:
+            rows: list = self.cursor.fetchmany(self.chunk_size)
+            if not rows:
+                self.close_cursor()
+                return None
+            self.rows_read += len(rows)
+            number_of_rows: int = self.ptd.fill_training_chunk(rows, self.features, self.target, self.timestamps, 0,
+                                                                column_names=self.column_names, computed_frame=self.computed_frame)
+            if number_of_rows > 0:
+                return self.features[:number_of_rows], self.target[:number_of_rows], self.timestamps[:number_of_rows]
+
+    def next(self, input_data) -> bool:
+        """
+        Passes the next chunk to xgboost. Called by xgboost until it returns False.
+
+        Parameters:
+        - input_data (callable): The function provided by xgboost which receives the data of the chunk.
+
+        Returns:
+        - bool: True if a chunk was passed, False if all chunks were read.
+        """
+        chunk: tuple | None = self.read_chunk()
+        if chunk is None:
+            return False
+        features, target, _ = chunk
+        input_data(data=features, label=target, feature_names=self.feature_names)
+        self.chunk += 1
+        if self.progress_callback is not None:
+            self.progress_callback(self.chunk, self.rows_read)
+        return True
+
+    def reset(self) -> None:
+        """
+        Starts reading the date range from the beginning. Called by xgboost before each pass over the data.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.close_cursor()
+        self.chunk = 0
+        self.rows_read = 0
+
+
+class TrainingProgressCallback(xgb.callback.TrainingCallback):
+    """
+    xgboost training callback which reports the number of finished boosting rounds.
+    """
+    def __init__(self, number_of_rounds: int, progress_callback, report_every: int = 10) -> None:
+        """
+        Initialize the TrainingProgressCallback class.
+
+        Parameters:
+        - number_of_rounds (int): The total number of boosting rounds.
+        - progress_callback (callable): A function which is called with the finished and the total number of rounds.
+        - report_every (int, optional): The progress is reported every 'report_every' rounds. Defaults to 10.
+
+        Returns:
+        - None
+        """
+        self.number_of_rounds = number_of_rounds
+        self.progress_callback = progress_callback
+        self.report_every = report_every
+        super().__init__()
+
+    def after_iteration(self, model, epoch: int, evals_log: dict) -> bool:
+        """
+        Reports the progress after a boosting round.
+
+        Parameters:
+        - model (xgb.Booster): The booster which is trained.
+        - epoch (int): The index of the finished boosting round.
+        - evals_log (dict): The evaluation results of the round.
+
+        Returns:
+        - bool: Always False, the training is never stopped by this callback.
+        """
+        if (epoch + 1) % self.report_every == 0 or epoch + 1 == self.number_of_rounds:
+            self.progress_callback(epoch + 1, self.number_of_rounds)
+        return False
@@ -0,0 +1,214 @@
+"""
+This python module contains the lease manager which distributes the running bots across prediction workers.
+
+Every running bot has a row in the 'bot_leases' table. A worker claims bots by locking free or expired lease rows
+with SELECT ... FOR UPDATE SKIP LOCKED, so two workers never claim the same row at the same time, and renews its
+leases with a heartbeat. Every worker records its heartbeat in the 'prediction_workers' table and holds at most
+its fair share of the bots, the number of bots divided by the number of live workers. A worker which holds more
+bots than its share releases them, so the bots are rebalanced when a worker joins. If a worker dies, its leases
+expire after distributed.lease_seconds and are claimed by the remaining workers, the same happens if the prediction
+loop of a worker hangs, because the heartbeat only renews the leases while the loop makes progress. After the trades
+of a bot were executed for a bar, the worker records the bar in the lease row with a conditional UPDATE, so a bar is
+executed again if its prediction failed and is not executed twice if the lease of the bot moves to another worker.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import math
+import time
+import uuid
+import socket
+import datetime
+
+from config.config import load_config
+from infrastructure.database import Database
+from infrastructure.logger import create_logger
+
+class LeaseManager:
+    def __init__(self, worker_id: str = None, db: Database = None) -> None:
+        """
+        Initialize the LeaseManager class.
+
+        Parameters:
+        - worker_id (str, optional): The unique name of the worker. If None, a name is built from the host name and the process id.
+        - db (Database, optional): The database which contains the 'bot_leases' table. If None, a new connection is created.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.db: Database = db if db is not None else Database()
+        self.logger = create_logger('lease_manager.log')
+        self.worker_id: str = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.lease_seconds: int = self.config.distributed.lease_seconds
+
+    def sync_leases(self) -> None:
+        """
+        Creates a lease row for every running bot and removes the lease rows of bots which are not running anymore.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.db.execute_write_query('INSERT INTO bot_leases ("user", bot_id) SELECT "user", id FROM bots WHERE running ON CONFLICT DO NOTHING')
+        query: str = 'DELETE FROM bot_leases l WHERE NOT EXISTS (SELECT 1 FROM bots b WHERE b."user" = l."user" AND b.id = l.bot_id AND b.running)'
+        self.db.execute_write_query(query)
+        self.db.commit()
+
+    def register_worker(self, db: Database = None) -> None:
+        """
+        Records the heartbeat of this worker in the 'prediction_workers' table and removes the workers whose heartbeat
+        is older than distributed.lease_seconds.
+
+        Parameters:
+        - db (Database, optional): The connection which is used. Defaults to the connection of the lease manager.
+
+        Returns:
+        - None
+        """
+        db = db if db is not None else self.db
+        query: str = 'INSERT INTO prediction_workers (worker_id, started, heartbeat) VALUES (%s, NOW(), NOW())'
+        query += ' ON CONFLICT (worker_id) DO UPDATE SET heartbeat = EXCLUDED.heartbeat'
+        db.execute_write_query(query, (self.worker_id,))
+        db.execute_write_query("DELETE FROM prediction_workers WHERE heartbeat < NOW() - %s * INTERVAL '1 second'", (self.lease_seconds,))
+        db.commit()
+
+    def get_fair_share(self) -> int:
+        """
+        Returns the number of bots this worker should hold, i.e. the number of leased bots divided by the number of
+        live workers in the 'prediction_workers' table (including this worker).
+
+        Parameters:
+        - None
+
+        Returns:
+        - int: The maximum number of bots this worker claims.
+        """
+        query: str = 'SELECT (SELECT COUNT(*) FROM bot_leases),'
+        query += " (SELECT COUNT(*) FROM prediction_workers WHERE worker_id <> %s AND heartbeat > NOW() - %s * INTERVAL '1 second')"
+        result = self.db.execute_read_query(query, (self.worker_id, self.lease_seconds), first_only=True)
+        if not result:
+            return 0
+        number_of_bots, other_workers = int(result[0]), int(result[1])
+        share: int = math.ceil(number_of_bots / (other_workers + 1)) if number_of_bots else 0
+        return min(share, self.config.distributed.max_bots_per_worker)
+
+    def claim_bots(self) -> set[tuple[int, int]]:
+        """
+        Claims up to the fair share of bots. Bots which are already leased by this worker are kept first, then free
+        bots and bots with expired leases are claimed. Rows which are locked by another worker at the same moment are
+        skipped. Leases beyond the fair share are released, so the bots are rebalanced when workers join: the
+        released bots are claimed by the new worker with its next claim.
+
+        Parameters:
+        - None
+
+        Returns:
+        - set[tuple[int, int]]: The (user, bot_id) pairs which are leased by this worker.
+        """
+        self.register_worker()
+        self.sync_leases()
+        share: int = self.get_fair_share()
+
+        query: str = 'SELECT "user", bot_id FROM bot_leases WHERE worker_id = %s OR worker_id IS NULL OR lease_until IS NULL OR lease_until < NOW()'
+        query += ' ORDER BY (worker_id IS NOT DISTINCT FROM %s) DESC, "user", bot_id LIMIT %s FOR UPDATE SKIP LOCKED'
+        rows: list = self.db.execute_read_query(query, (self.worker_id, self.worker_id, share)) or []
+        claimed: set[tuple[int, int]] = {(int(user), int(bot_id)) for user, bot_id in rows}
+
+        if claimed:
+            query = "UPDATE bot_leases SET worker_id = %s, lease_until = NOW() + %s * INTERVAL '1 second' WHERE (\"user\", bot_id) IN %s"
+            self.db.execute_write_query(query, (self.worker_id, self.lease_seconds, tuple(claimed)))
+            query = 'UPDATE bot_leases SET worker_id = NULL, lease_until = NULL WHERE worker_id = %s AND ("user", bot_id) NOT IN %s'
+            self.db.execute_write_query(query, (self.worker_id, tuple(claimed)))
+        else:
+            self.db.execute_write_query('UPDATE bot_leases SET worker_id = NULL, lease_until = NULL WHERE worker_id = %s', (self.worker_id,))
+        self.db.commit()
+        return claimed
+
+    def record_bar(self, user: int, bot_id: int, bar: datetime.datetime) -> bool:
+        """
+        Records that this worker executed a bot for a bar, after its trades were executed. A bar whose prediction
+        failed or missed its deadline is not recorded and is therefore executed again in the next tick. The update
+        only succeeds if the worker still holds a valid lease for the bot and no later bar was recorded yet.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - bar (datetime.datetime): The start of the bar.
+
+        Returns:
+        - bool: True if the bar was recorded, False otherwise.
+        """
+        query: str = 'UPDATE bot_leases SET last_bar = %s WHERE "user" = %s AND bot_id = %s AND worker_id = %s AND lease_until > NOW()'
+        query += ' AND (last_bar IS NULL OR last_bar < %s)'
+        updated_rows: int | None = self.db.execute_write_query(query, (bar, user, bot_id, self.worker_id, bar))
+        self.db.commit()
+        return updated_rows == 1
+
+    def heartbeat(self, db: Database = None) -> int:
+        """
+        Records the heartbeat of the worker and extends all leases of this worker by distributed.lease_seconds.
+
+        Parameters:
+        - db (Database, optional): The connection which is used. Defaults to the connection of the lease manager.
+
+        Returns:
+        - int: The number of renewed leases.
+        """
+        db = db if db is not None else self.db
+        self.register_worker(db)
+        query: str = "UPDATE bot_leases SET lease_until = NOW() + %s * INTERVAL '1 second' WHERE worker_id = %s"
+        renewed: int | None = db.execute_write_query(query, (self.lease_seconds, self.worker_id))
+        db.commit()
+        return renewed or 0
+
+    def heartbeat_loop(self, progress=None) -> None:
+        """
+        Renews the leases of this worker every distributed.heartbeat_seconds. Runs in its own thread and therefore
+        uses its own database connection. The leases are not renewed while the prediction loop of the worker made no
+        progress for distributed.lease_seconds, so the bots of a worker whose loop hangs are taken over by other
+        workers once their leases expired.
+
+        Parameters:
+        - progress (callable, optional): Returns the time (time.time()) of the last iteration of the prediction loop.
+          Defaults to None (the leases are always renewed).
+
+        Returns:
+        - None
+        """
+        db: Database = Database()
+        self.logger.info(f'Starting heartbeat of worker {self.worker_id}')
+        while True:
+            try:
+                if progress is not None and time.time() - progress() > self.lease_seconds:
+                    self.logger.warning(f'The prediction loop of worker {self.worker_id} made no progress for {time.time() - progress():.0f} s, the leases are not renewed')
+                else:
+                    self.heartbeat(db)
+            except Exception as e:
+                self.logger.error(f'Error in heartbeat of worker {self.worker_id}: {str(e)}')
+            time.sleep(self.config.distributed.heartbeat_seconds)
+
+    def release_all(self) -> None:
+        """
+        Releases all leases of this worker, e.g. when the worker shuts down, so that other workers can claim the bots
+        immediately instead of waiting for the leases to expire.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.db.execute_write_query('UPDATE bot_leases SET worker_id = NULL, lease_until = NULL WHERE worker_id = %s', (self.worker_id,))
+        self.db.execute_write_query('DELETE FROM prediction_workers WHERE worker_id = %s', (self.worker_id,))
+        self.db.commit()
+        self.logger.info(f'Worker {self.worker_id} released its leases')
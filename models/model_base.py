@@ -11,17 +11,31 @@ for part in basedir_split:
         path_to_config += f'{os.sep}config'
         break
     
+import abc
+import json
 import pickle
+import tempfile
+import datetime
+import threading
 import numpy as np
+import pandas as pd
 from sklearn.metrics import confusion_matrix, balanced_accuracy_score, accuracy_score, precision_score, recall_score
     
 from config.config import load_config
 from infrastructure.database import Database
+from infrastructure.timeframe_aggregator import get_table_name
 
-class ModelBase():
+MODEL_FILE_EXTENSION: str = 'ubj'
+MODEL_FORMAT_VERSION: int = 1
+
+class ModelBase(abc.ABC):
     """
     Base class for all model-related operations. Contains several functions which are necessary for all models.
     """
+    # Loaded models shared by all instances: {model_path: ((mtime_ns, size), model)}
+    _model_cache: dict = {}
+    _model_cache_lock: threading.Lock = threading.Lock()
+
     def __init__(self, db, config) -> None:
         """
         Initializes a new instance of the ModelBase class.
@@ -91,43 +105,198 @@ class ModelBase():
         symbol = symbol['symbol'].iloc[0]
         return symbol.lower()
 
-    def save_model(self, model, user: int, model_id: int) -> None:
+    def get_table_from_database(self, user: int, model_id: int) -> str:
         """
-        Saves a trained model to a specified location in the filesystem.
+        Retrieves the table which contains the bars of the symbol of a specific model in the timeframe of the model.
+
+        Parameters:
+        user (int): The unique identifier of the user who owns the model.
+        model_id (int): The unique identifier of the model.
 
-        The function constructs the path to the model file based on the user and model ID,
-        then uses the pickle module to serialize the model and save it to the filesystem.
+        Returns:
+        str: The table, e.g. 'btcusd' for a timeframe of 1 minute or 'btcusd_60m' for a timeframe of 60 minutes.
+        """
+        query: str = f'SELECT symbol, timeframe FROM bots WHERE "user"={user} AND id={model_id}'
+        bot = self.db.execute_read_query(query, return_type='pd.DataFrame')
+        timeframe = bot['timeframe'].iloc[0]
+        return get_table_name(bot['symbol'].iloc[0], None if pd.isna(timeframe) else int(timeframe))
+
+    @abc.abstractmethod
+    def create_model(self, mode: str = 'direction', params: dict = None) -> object:
+        """
+        Creates an untrained model instance. Has to be implemented by every model type, a subclass without it can not
+        be instantiated. It is used by load_model to create an empty model into which the saved model file is loaded.
+
+        Parameters:
+        - mode (str): The mode for which the model is created, e.g. 'direction' or 'return'.
+        - params (dict): A dictionary containing the parameters for the model.
+
+        Returns:
+        - object: An untrained model instance.
+        """
+
+    def get_model_path(self, user: int, model_id: int, extension: str = MODEL_FILE_EXTENSION, version: int = None) -> str:
+        """
+        Constructs the path of a model file based on the user and model ID.
 
         Parameters:
-        - model: The trained model object to be saved.
         - user (int): The unique identifier of the user who owns the model.
         - model_id (int): The unique identifier of the model.
+        - extension (str): The file extension of the model file. Defaults to the native model format 'ubj'.
+        - version (int, optional): The version of the model as recorded in the model registry. If None, the path of the
+          unversioned model file is returned. Defaults to None.
 
         Returns:
-        - None: The function does not return any value.
+        - str: The absolute path of the model file.
         """
         path_to_model: str = self.config.path_to_models.replace(f'{os.sep}config','')
-        pickle.dump(model, open(f'{path_to_model}model_{user}_{model_id}.pkl', 'wb'))
+        if version is not None:
+            return f'{path_to_model}model_{user}_{model_id}_v{version}.{extension}'
+        return f'{path_to_model}model_{user}_{model_id}.{extension}'
 
+    def get_metadata_path(self, model_path: str) -> str:
+        """
+        Returns the path of the metadata sidecar file which belongs to a model file.
 
-    def load_model(self, user: int, model_id: int) -> object:
+        Parameters:
+        - model_path (str): The path of the model file.
+
+        Returns:
+        - str: The path of the metadata file, which has the same name as the model file but ends with '.json'.
+        """
+        return f'{os.path.splitext(model_path)[0]}.json'
+
+    def atomic_write(self, path: str, write_function) -> None:
+        """
+        Writes a file atomically. The content is written to a temporary file in the same directory first
+        which is then renamed to the target path, so that readers never see a partially written file.
+
+        Parameters:
+        - path (str): The path of the file which should be written.
+        - write_function (callable): A function which takes the path of the temporary file and writes the content to it.
+
+        Returns:
+        - None
+        """
+        directory: str = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix=os.path.splitext(path)[1])
+        os.close(file_descriptor)
+        try:
+            write_function(temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def save_model(self, model, user: int, model_id: int, metadata: dict = None, version: int = None) -> str:
+        """
+        Saves a trained model to a specified location in the filesystem.
+
+        The model is stored in the native binary format of the model library (UBJSON) next to a small
+        metadata sidecar file in JSON format. Both files are written atomically via a temporary file which
+        is renamed afterwards, the sidecar is written last so that it always describes a complete model file.
+
+        Parameters:
+        - model: The trained model object to be saved. It has to provide a save_model(path) method.
+        - user (int): The unique identifier of the user who owns the model.
+        - model_id (int): The unique identifier of the model.
+        - metadata (dict, optional): Additional information about the model such as feature names, technical indicators
+          and the training range. Defaults to None.
+        - version (int, optional): The version of the model as recorded in the model registry. Defaults to None.
+
+        Returns:
+        - str: The path of the saved model file.
+        """
+        model_path: str = self.get_model_path(user, model_id, version=version)
+        self.atomic_write(model_path, model.save_model)
+
+        metadata: dict = dict(metadata) if metadata else {}
+        metadata['format_version'] = MODEL_FORMAT_VERSION
+        metadata['model_file'] = os.path.basename(model_path)
+        metadata['saved'] = datetime.datetime.now().isoformat()
+
+        def write_metadata(path: str) -> None:
+            with open(path, 'w', encoding='UTF-8') as file:
+                json.dump(metadata, file, default=str)
+
+        self.atomic_write(self.get_metadata_path(model_path), write_metadata)
+        return model_path
+
+    def load_model_metadata(self, user: int, model_id: int, version: int = None) -> dict:
+        """
+        Loads the metadata sidecar of a saved model.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the model.
+        - model_id (int): The unique identifier of the model.
+        - version (int, optional): The version of the model. Defaults to None.
+
+        Returns:
+        - dict: The metadata of the model. If no metadata file exists an empty dictionary is returned.
+        """
+        metadata_path: str = self.get_metadata_path(self.get_model_path(user, model_id, version=version))
+        if not os.path.exists(metadata_path):
+            return {}
+        with open(metadata_path, 'r', encoding='UTF-8') as file:
+            return json.load(file)
+
+    def load_model(self, user: int, model_id: int, use_cache: bool = True, version: int = None) -> object:
         """
         Loads a trained model from the filesystem based on the provided user and model ID.
 
-        The function constructs the path to the model file based on the user and model ID,
-        then uses the pickle module to deserialize the model and return it.
+        The model is loaded from the native model format. If use_cache is True, an already loaded model is
+        returned without parsing the file again as long as the modification time and size of the file are unchanged.
+        Models which were saved with pickle by older versions of the application are still supported.
 
         Parameters:
         - user (int): The unique identifier of the user who owns the model.
         - model_id (int): The unique identifier of the model.
+        - use_cache (bool, optional): If True, reuse the already loaded model if the file did not change. Defaults to True.
+        - version (int, optional): The version of the model as recorded in the model registry. Defaults to None.
 
         Returns:
         - object: The loaded trained model object.
         """
-        path_to_model: str = self.config.path_to_models.replace(f'{os.sep}config','')
-        model = pickle.load(open(f'{path_to_model}model_{user}_{model_id}.pkl', 'rb'))
+        model_path: str = self.get_model_path(user, model_id, version=version)
+        if not os.path.exists(model_path) and version is None:
+            legacy_path: str = self.get_model_path(user, model_id, extension='pkl')
+            with open(legacy_path, 'rb') as file:
+                return pickle.load(file)
+
+        file_stat: os.stat_result = os.stat(model_path)
+        file_signature: tuple = (file_stat.st_mtime_ns, file_stat.st_size)
+        if use_cache:
+            with ModelBase._model_cache_lock:
+                cached: tuple = ModelBase._model_cache.get(model_path)
+            if cached is not None and cached[0] == file_signature:
+                return cached[1]
+
+        metadata: dict = self.load_model_metadata(user, model_id, version=version)
+        model = self.create_model(mode=metadata.get('mode', 'direction'))
+        model.load_model(model_path)
+
+        if use_cache:
+            with ModelBase._model_cache_lock:
+                ModelBase._model_cache[model_path] = (file_signature, model)
         return model
 
+    def evict_model(self, user: int, model_id: int, version: int = None) -> None:
+        """
+        Removes a model from the cache of loaded models.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the model.
+        - model_id (int): The unique identifier of the model.
+        - version (int, optional): The version of the model. Defaults to None.
+
+        Returns:
+        - None
+        """
+        with ModelBase._model_cache_lock:
+            ModelBase._model_cache.pop(self.get_model_path(user, model_id, version=version), None)
+
 
     def create_confusion_matrix(self, y_test: np.array, y_pred: np.array) -> np.array:
         """
@@ -210,3 +379,24 @@ class ModelBase():
         - float: The recall score, a value between 0 and 1, where 1 indicates perfect recall.
         """
         return recall_score(y_test, y_pred)
+
+
+    def calc_error_metrics(self, y_test: np.array, y_pred: np.array) -> dict:
+        """
+        Calculates all error metrics which are stored for a trained classification model.
+
+        Parameters:
+        - y_test (np.array): A 1D numpy array containing the true labels of the test dataset.
+        - y_pred (np.array): A 1D numpy array containing the predicted labels of the test dataset.
+
+        Returns:
+        - dict: A dictionary containing the confusion matrix as JSON string, the accuracy, the balanced accuracy,
+        the precision and the recall.
+        """
+        return {
+            'confusion_matrix': json.dumps(self.create_confusion_matrix(y_test, y_pred).tolist()),
+            'accuracy': self.calc_accuracy(y_test, y_pred),
+            'balanced_accuracy': self.calc_balanced_accuracy(y_test, y_pred),
+            'precision': self.calc_precision(y_test, y_pred),
+            'recall': self.calc_recall(y_test, y_pred)
+        }
@@ -0,0 +1,259 @@
+"""
+This python module contains the model registry which records every trained version of a model.
+
+Every training run stores its model in a new versioned file and registers the version together with its
+error metrics, the data range it was trained on and the location of the file in the 'model_versions' table.
+Exactly one version per bot is marked as live. The prediction loop only loads the live version, so promoting
+another version or rolling back to the previous one takes effect with the next prediction without retraining.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import json
+import datetime
+import psycopg2
+import psycopg2.errors
+import pandas as pd
+
+from config.config import load_config
+from infrastructure.database import Database
+from infrastructure.logger import create_logger
+
+class ModelRegistry:
+    def __init__(self, db: Database = None) -> None:
+        """
+        Initialize the ModelRegistry class.
+
+        Parameters:
+        - db (Database, optional): The database which contains the 'model_versions' table. If None, a new connection is created.
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.db: Database = db if db is not None else Database()
+        self.logger = create_logger('model_registry.log')
+
+    def reserve_version(self, user: int, bot_id: int, model_type: str, training_mode: str = 'full') -> int:
+        """
+        Reserves the next free version number for the model of a bot. The version is allocated by the INSERT of its
+        row, so two trainings of the same bot can not obtain the same version. If a concurrent INSERT took the
+        version first, the unique violation is retried with the next version. The row is completed by
+        register_version once the model file was written.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - model_type (str): The type of the model, e.g. 'xgboost'.
+        - training_mode (str, optional): How the model is trained, e.g. 'full' or 'incremental'. Defaults to 'full'.
+
+        Returns:
+        - int: The reserved version, the highest registered version plus one or 1 if no version was registered yet.
+        """
+        query: str = 'INSERT INTO model_versions ("user", bot_id, version, created, model_type, size_bytes, training_mode, live)'
+        query += ' SELECT %s, %s, COALESCE(MAX(version), 0) + 1, %s, %s, 0, %s, FALSE FROM model_versions WHERE "user" = %s AND bot_id = %s'
+        query += ' RETURNING version'
+        for attempt in range(1, self.config.model_registry.reserve_attempts + 1):
+            try:
+                self.db.cursor.execute(query, (user, bot_id, datetime.datetime.now(), model_type, training_mode, user, bot_id))
+                version: int = int(self.db.cursor.fetchone()[0])
+                self.db.commit()
+                return version
+            except psycopg2.errors.UniqueViolation:
+                self.db.connection.rollback()
+                self.logger.info(f'reserve_version: Version of model_{user}_{bot_id} was taken concurrently, attempt {attempt}')
+            except Exception:
+                self.db.connection.rollback()
+                raise
+        raise RuntimeError(f'reserve_version: Could not reserve a version of model_{user}_{bot_id} after {self.config.model_registry.reserve_attempts} attempts')
+
+    def register_version(self, user: int, bot_id: int, version: int, path: str, metrics: dict,
+                         min_date: datetime.datetime, max_date: datetime.datetime) -> None:
+        """
+        Records a newly trained model version whose number was reserved with reserve_version. The version is not
+        live until it is promoted.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - version (int): The reserved version number of the model.
+        - path (str): The location of the model file.
+        - metrics (dict): The error metrics which were determined during training.
+        - min_date (datetime.datetime): The start of the data range the model was trained on.
+        - max_date (datetime.datetime): The end of the data range the model was trained on.
+
+        Returns:
+        - None
+        """
+        size_bytes: int = 0
+        for file_path in [path, f'{os.path.splitext(path)[0]}.json']:
+            if os.path.exists(file_path):
+                size_bytes += os.path.getsize(file_path)
+
+        query: str = 'UPDATE model_versions SET path = %s, size_bytes = %s, metrics = %s, min_date = %s, max_date = %s'
+        query += ' WHERE "user" = %s AND bot_id = %s AND version = %s'
+        self.db.execute_write_query(query, (path, size_bytes, json.dumps(metrics, default=str), min_date, max_date, user, bot_id, version))
+        self.db.commit()
+        self.logger.info(f'Registered version {version} of model_{user}_{bot_id} ({size_bytes} bytes)')
+
+    def promote(self, user: int, bot_id: int, version: int) -> bool:
+        """
+        Marks a version as the live version of a bot. All other versions of the bot are marked as not live
+        within the same statement, so there is no point in time with zero or two live versions.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - version (int): The version which should become live.
+
+        Returns:
+        - bool: True if the version exists and was registered and promoted, False otherwise.
+        """
+        exists = self.db.execute_read_query(f'SELECT 1 FROM model_versions WHERE "user"={user} AND bot_id={bot_id} AND version={version} AND path IS NOT NULL', first_only=True)
+        if not exists:
+            self.logger.error(f'promote: Version {version} of model_{user}_{bot_id} does not exist!')
+            return False
+
+        query: str = 'UPDATE model_versions SET live = (version = %s) WHERE "user" = %s AND bot_id = %s'
+        self.db.execute_write_query(query, (version, user, bot_id))
+        self.db.commit()
+        self.logger.info(f'Promoted version {version} of model_{user}_{bot_id} to live')
+        return True
+
+    def rollback(self, user: int, bot_id: int) -> int | None:
+        """
+        Promotes the version which was registered before the current live version.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - int | None: The version which is live after the rollback, or None if there is no older version.
+        """
+        live_version: dict | None = self.get_live_version(user, bot_id)
+        if live_version is None:
+            return None
+        query: str = f'SELECT MAX(version) FROM model_versions WHERE "user"={user} AND bot_id={bot_id} AND version < {live_version["version"]} AND path IS NOT NULL'
+        result = self.db.execute_read_query(query, first_only=True)
+        if not result or result[0] is None:
+            self.logger.info(f'rollback: model_{user}_{bot_id} has no version older than {live_version["version"]}')
+            return None
+        previous_version: int = int(result[0])
+        self.promote(user, bot_id, previous_version)
+        return previous_version
+
+    def get_live_version(self, user: int, bot_id: int) -> dict | None:
+        """
+        Returns the live version of a bot.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - dict | None: The row of the live version as dictionary, or None if no version is live.
+        """
+        query: str = f'SELECT * FROM model_versions WHERE "user"={user} AND bot_id={bot_id} AND live'
+        data: pd.DataFrame = self.db.execute_read_query(query, return_type='pd.DataFrame')
+        if data is None or data.empty:
+            return None
+        return data.iloc[0].to_dict()
+
+    def list_versions(self, user: int, bot_id: int) -> pd.DataFrame:
+        """
+        Returns all registered versions of a bot, newest first.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - pd.DataFrame: A DataFrame with one row per version.
+        """
+        query: str = f'SELECT version, created, model_type, size_bytes, metrics, min_date, max_date, training_mode, live FROM model_versions WHERE "user"={user} AND bot_id={bot_id} ORDER BY version DESC'
+        return self.db.execute_read_query(query, return_type='pd.DataFrame')
+
+    def garbage_collect(self, user: int, bot_id: int, keep_versions: int = None, max_bytes: int = None) -> list[int]:
+        """
+        Deletes old versions of a bot. The newest 'keep_versions' versions are kept and older versions are deleted
+        until the versions of the bot use at most 'max_bytes' bytes. The live version is never deleted.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - keep_versions (int, optional): The number of versions to keep. Defaults to model_registry.keep_versions of the config.
+        - max_bytes (int, optional): The maximum disk usage of all versions of the bot. Defaults to model_registry.max_bytes_per_bot of the config.
+
+        Returns:
+        - list[int]: The deleted versions.
+        """
+        if keep_versions is None:
+            keep_versions = self.config.model_registry.keep_versions
+        if max_bytes is None:
+            max_bytes = self.config.model_registry.max_bytes_per_bot
+
+        query: str = f'SELECT version, path, size_bytes, live FROM model_versions WHERE "user"={user} AND bot_id={bot_id} ORDER BY version DESC'
+        versions: list = self.db.execute_read_query(query) or []
+
+        deleted_versions: list[int] = []
+        total_bytes: int = 0
+        kept: int = 0
+        for version, path, size_bytes, live in versions:
+            size_bytes = size_bytes or 0
+            within_budget: bool = (kept < keep_versions) and (not max_bytes or total_bytes + size_bytes <= max_bytes)
+            if live or within_budget:
+                total_bytes += size_bytes
+                kept += 1
+                continue
+            self.delete_version(user, bot_id, version, path)
+            deleted_versions.append(version)
+
+        if deleted_versions:
+            self.logger.info(f'Garbage collected versions {deleted_versions} of model_{user}_{bot_id}')
+        return deleted_versions
+
+    def delete_version(self, user: int, bot_id: int, version: int, path: str) -> None:
+        """
+        Deletes a version from the registry and removes its files.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - version (int): The version which should be deleted.
+        - path (str): The location of the model file.
+
+        Returns:
+        - None
+        """
+        # A reserved version whose training failed has no file
+        for file_path in ([path, f'{os.path.splitext(path)[0]}.json'] if path else []):
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            except OSError as e:
+                self.logger.error(f'delete_version: Could not remove {file_path}: {str(e)}')
+        self.db.execute_write_query(f'DELETE FROM model_versions WHERE "user"={user} AND bot_id={bot_id} AND version={version}')
+        self.db.commit()
+
+    def delete_all_versions(self, user: int, bot_id: int) -> None:
+        """
+        Deletes all versions of a bot including the live version, e.g. when the bot is deleted.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - None
+        """
+        versions: list = self.db.execute_read_query(f'SELECT version, path FROM model_versions WHERE "user"={user} AND bot_id={bot_id}') or []
+        for version, path in versions:
+            self.delete_version(user, bot_id, version, path)
@@ -12,14 +12,72 @@ for part in basedir_split:
         break
 sys.path.append(path_to_config)
 
+import uuid
+import threading
+import tracemalloc
 import pandas as pd
 import numpy as np
 
 from infrastructure.database import Database
+from infrastructure.dataset_cache import DatasetCache
+from infrastructure.feature_snapshot import FeatureSnapshotReader
+from infrastructure.feature_store import FeatureStore
+from infrastructure.indicator_engine import IndicatorEngine
 from infrastructure.logger import create_logger
 
+# tracemalloc is process-wide and the training arrays are built by concurrent training threads, so tracing is
+# started by the first and stopped by the last build which measures (see start_memory_tracing).
+_tracing_lock: threading.Lock = threading.Lock()
+_tracing_users: int = 0
+# False if tracemalloc was already started by someone else, e.g. a profiler, it is then never stopped here
+_tracing_owned: bool = False
+
+def start_memory_tracing() -> None:
+    """
+    Starts tracemalloc for a build of training arrays, unless another build already traces. The peak memory is
+    only reset by the first build, so a concurrent build never resets the peak of another one.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0:
+            _tracing_owned = not tracemalloc.is_tracing()
+            if _tracing_owned:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        _tracing_users += 1
+
+def stop_memory_tracing() -> int:
+    """
+    Returns the peak memory traced since the first running build started tracing and stops tracemalloc after the
+    last running build. If builds overlap, the peak includes the allocations of all of them.
+
+    Parameters:
+    - None
+
+    Returns:
+    - int: The peak memory in bytes.
+    """
+    global _tracing_users
+    with _tracing_lock:
+        peak_memory: int = tracemalloc.get_traced_memory()[1]
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+    return peak_memory
+
+
 class PrepareTrainingData:
-    def __init__(self) -> None:
+    # Increase when the derivation of the features or the target in fill_training_values changes, so that
+    # the entries of the dataset cache which were prepared by an older pipeline are not used anymore
+    PIPELINE_VERSION: int = 1
+
+    def __init__(self, db: Database = None) -> None:
         """
         Initialize PrepareTrainingData class.
 
@@ -27,45 +85,60 @@ class PrepareTrainingData:
         The Database instance is used to interact with the database, while the Logger instance is used for logging purposes.
 
         Parameters:
-        - None
+        - db (Database, optional): The database from which the data is read. If None, a new connection is created.
 
         Returns:
         - None
         """
-        self.db = Database()
+        self.db = db if db is not None else Database()
         self.logger = create_logger('prepare_training_data.log')
+        self.snapshots = FeatureSnapshotReader()
+        self.feature_store = FeatureStore()
+        self.dataset_cache = DatasetCache()
+        self.indicators = IndicatorEngine(db=self.db, feature_store=self.feature_store)
         
     def load_data_for_prediction(self, symbol, feature_columns: list[str]) -> pd.DataFrame:
         """
         Load the latest data for a specific symbol from the database for prediction purposes.
 
-        This function constructs a SQL query to retrieve the latest data for a given symbol from the database.
+        The latest bars are read from the shared memory snapshot of the symbol if it is available (see
+        infrastructure/feature_snapshot.py). Otherwise this function constructs a SQL query to retrieve the
+        latest data for a given symbol from the database.
         If 'open' or 'close' columns are not specified in the feature_columns list, they are added at the beginning.
-        The function assumes that the historic price data is inserted in ascending order by time.
+        Technical indicators with parameters of the bot are computed from the open prices of the latest bars
+        (see infrastructure/indicator_engine.py).
 
         Parameters:
         - symbol (str): The symbol for which data needs to be retrieved.
-        - feature_columns (list[str]): A list of column names to select. If 'open' or 'close' are not included, they are added at the beginning.
+        - feature_columns (list[str]): The technical indicators of the bot. If 'open' or 'close' are not included, they are added at the beginning.
 
         Returns:
         - pd.DataFrame: A pandas DataFrame containing the latest data for the specified symbol.
         """
-        if 'open' not in feature_columns:
-            feature_columns.insert(0, 'open')
-        if 'close' not in feature_columns:
-            feature_columns.insert(1,'close')
-        for idx, feature in enumerate(feature_columns):
-            if feature.find(' ') != -1:
-                feature_columns[idx] = feature.replace(' ','_')
-
-        # This assumes that the historic price data is inserted ascending by time
-        query = f"SELECT {','.join(feature_columns)} FROM {symbol} ORDER BY timestamp DESC LIMIT(1)"
-        data: pd.DataFrame = self.db.execute_read_query(query, return_type='pd.DataFrame')
+        column_names: list[str] = self.get_feature_names(feature_columns)
+        computed: dict = self.indicators.get_columns(feature_columns)[1]
+        stored_names: list[str] = [column for column in column_names if column not in computed]
+        number_of_bars: int = max(self.indicators.get_warmup(computed), 1)
+
+        bars: tuple | None = self.snapshots.read(symbol, number_of_bars, stored_names)
+        if bars is None:
+            # This assumes that the historic price data is inserted ascending by time
+            selected_columns: str = ','.join(['"timestamp"'] + [f'"{column}"' for column in stored_names])
+            query = f"SELECT {selected_columns} FROM {symbol} ORDER BY timestamp DESC LIMIT({number_of_bars})"
+            rows: pd.DataFrame = self.db.execute_read_query(query, return_type='pd.DataFrame').iloc[::-1]
+            bars = (rows['timestamp'].to_numpy(dtype='datetime64[ns]'), rows[stored_names].to_numpy(dtype=np.float64))
+        timestamps, values = bars
+
+        data: pd.DataFrame = pd.DataFrame(values[-1:], columns=stored_names)
+        if computed and len(timestamps) > 0:
+            latest: dict = self.indicators.get_latest(symbol, computed, timestamps, values[:, stored_names.index('open')])
+            for column, value in latest.items():
+                data[column] = value
+        data = data.reindex(columns=column_names)
         data = self.add_return(data)
         data = self.remove_na(data)
         return data
 
-        
     def load_data(self, symbol: str, feature_columns: list[str] = None, min_date: str = None, max_date: str = None) -> pd.DataFrame:
         """
         Load data from the database for a specific symbol.
@@ -86,6 +159,7 @@ class PrepareTrainingData:
         if not feature_columns:
             query: str = f"SELECT * FROM {symbol}"
         else:
+            feature_columns = list(feature_columns)
             if 'open' not in feature_columns:
                 feature_columns.insert(0, 'open')
             if 'close' not in feature_columns:
@@ -95,16 +169,297 @@ class PrepareTrainingData:
                     feature_columns[idx] = feature.replace(' ','_')
             query: str = f"SELECT {','.join(feature_columns)} FROM {symbol}"
             
+        query += self.build_date_condition(min_date, max_date)
+            
+        return self.db.execute_read_query(query, return_type='pd.DataFrame')
+
+    def build_date_condition(self, min_date: str = None, max_date: str = None) -> str:
+        """
+        Builds the WHERE clause which restricts a query on a symbol table to a date range.
+
+        Parameters:
+        - min_date (str, optional): The minimum date. If provided, only data with a timestamp greater than or equal to this value is selected. Defaults to None.
+        - max_date (str, optional): The maximum date. If provided, only data with a timestamp less than or equal to this value is selected. Defaults to None.
+
+        Returns:
+        - str: The WHERE clause including a leading space, or an empty string if no date is provided.
+        """
+        conditions: list[str] = []
         if min_date:
-            query += f" WHERE TO_TIMESTAMP('{min_date}', 'YYYY-MM-DD HH24:MI') <= timestamp"
+            conditions.append(f"TO_TIMESTAMP('{min_date}', 'YYYY-MM-DD HH24:MI') <= timestamp")
         if max_date:
-            if min_date:
-                query += " AND"
+            conditions.append(f"TO_TIMESTAMP('{max_date}', 'YYYY-MM-DD HH24:MI') >= timestamp")
+        if not conditions:
+            return ''
+        return ' WHERE ' + ' AND '.join(conditions)
+
+    def count_rows(self, symbol: str, min_date: str = None, max_date: str = None) -> int:
+        """
+        Counts the rows of a symbol table within a date range.
+
+        Parameters:
+        - symbol (str): The symbol table.
+        - min_date (str, optional): The minimum date. Defaults to None.
+        - max_date (str, optional): The maximum date. Defaults to None.
+
+        Returns:
+        - int: The number of rows.
+        """
+        return self.db.execute_read_query(f"SELECT COUNT(*) FROM {symbol}{self.build_date_condition(min_date, max_date)}", first_only=True)[0]
+
+    def get_split_date(self, symbol: str, min_date: str, max_date: str, train_size: float):
+        """
+        Determines the timestamp at which a date range is split into a training and a testing set, so that the
+        first 'train_size' proportion of the rows belongs to the training set.
+
+        Parameters:
+        - symbol (str): The symbol table.
+        - min_date (str): The minimum date of the range.
+        - max_date (str): The maximum date of the range.
+        - train_size (float): The proportion of the rows which belong to the training set (between 0 and 1).
+
+        Returns:
+        - datetime.datetime: The timestamp of the first row of the testing set.
+        """
+        offset: int = int(self.count_rows(symbol, min_date, max_date) * train_size)
+        query: str = f"SELECT timestamp FROM {symbol}{self.build_date_condition(min_date, max_date)} ORDER BY timestamp OFFSET {offset} LIMIT 1"
+        return self.db.execute_read_query(query, first_only=True)[0]
+
+    def get_feature_names(self, feature_columns: list[str] = None) -> list[str]:
+        """
+        Returns the names of the price and indicator columns which are used as features, in the same order as
+        load_data selects them: 'open' and 'close' first, followed by the technical indicators.
+        Indicators with parameters (e.g. 'rsi:7') are expanded into their column names (see IndicatorEngine.get_columns).
+        The passed list is not modified.
+
+        Parameters:
+        - feature_columns (list[str], optional): The technical indicators, optionally quoted. Defaults to None.
+
+        Returns:
+        - list[str]: The unquoted column names.
+        """
+        feature_names: list[str] = self.indicators.get_columns(feature_columns)[0]
+        if 'open' not in feature_names:
+            feature_names.insert(0, 'open')
+        if 'close' not in feature_names:
+            feature_names.insert(1, 'close')
+        return feature_names
+
+    def build_training_arrays(self, symbol: str, feature_columns: list[str] = None, min_date: str = None, max_date: str = None,
+                              remove_zeros: bool = True, chunk_size: int = 100_000, as_dmatrix: bool = False) -> dict:
+        """
+        Builds the features and targets for the training of a model in a single pass without intermediate DataFrames.
+
+        If the dataset cache (see infrastructure/dataset_cache.py) contains an entry which covers the date range,
+        the arrays are sliced from the entry. Otherwise, if the columnar feature store covers the date range (see infrastructure/feature_store.py), the rows are read
+        from its memory-mapped files. Otherwise they are streamed from the database with a server-side cursor.
+        Indicators with parameters of the bot are computed by the IndicatorEngine and joined by timestamp.
+        In both cases the rows are processed in chunks of 'chunk_size' rows and written directly into preallocated
+        float32 arrays. Within each chunk rows with missing values are dropped, the return
+        and the direction are calculated and rows with a direction of zero are removed if 'remove_zeros' is True.
+        The result contains the same features in the same order as the pipeline
+        load_data -> remove_na -> remove_timestamp -> add_return -> add_direction -> create_features_and_targets.
+
+        Parameters:
+        - symbol (str): The symbol for which data needs to be retrieved.
+        - feature_columns (list[str], optional): The technical indicators which are used as features. Defaults to None.
+        - min_date (str, optional): The minimum date of the training data. Defaults to None.
+        - max_date (str, optional): The maximum date of the training data. Defaults to None.
+        - remove_zeros (bool, optional): If True, rows with a return of exactly zero are removed. Defaults to True.
+        - chunk_size (int, optional): The number of rows which are fetched from the database at once. Defaults to 100_000.
+        - as_dmatrix (bool, optional): If True, an xgboost QuantileDMatrix is created from the arrays. Defaults to False.
+
+        Returns:
+        - dict: A dictionary with the following keys:
+            - features (np.ndarray): A float32 array with one row per sample (read-only if served by the dataset cache).
+            - target (np.ndarray): A float32 array containing the direction (1 = up, 0 = down).
+            - timestamps (np.ndarray): A datetime64 array containing the timestamp of each sample.
+            - feature_names (list[str]): The names of the feature columns.
+            - dmatrix (xgb.QuantileDMatrix | None): The QuantileDMatrix if 'as_dmatrix' is True, otherwise None.
+            - peak_memory (int): The peak memory in bytes which was allocated while building the arrays (including
+              the arrays of concurrent builds).
+        """
+        start_memory_tracing()
+        try:
+            column_names: list[str] = self.get_feature_names(feature_columns)
+            feature_names: list[str] = column_names + ['return']
+            date_condition: str = self.build_date_condition(min_date, max_date)
+            computed: dict = self.indicators.get_columns(feature_columns)[1]
+            stored_names: list[str] = [column for column in column_names if column not in computed]
+
+            result: dict | None = self.dataset_cache.get(symbol, feature_names, min_date, max_date, remove_zeros, self.PIPELINE_VERSION)
+            if result is not None:
+                return self.finish_training_arrays(symbol, result, len(result['target']), as_dmatrix, cached=True)
+
+            computed_frame: pd.DataFrame | None = self.indicators.get_range(symbol, computed, min_date, max_date) if computed else None
+            stored_columns: tuple | None = self.feature_store.read(symbol, stored_names, min_date, max_date)
+            if stored_columns is not None:
+                store_timestamps, store_views = stored_columns
+                # Minutes without a bar are NaN in the store and are dropped like rows with missing values
+                number_of_rows: int = len(store_timestamps)
             else:
-                query += " WHERE"
-            query += f" TO_TIMESTAMP('{max_date}', 'YYYY-MM-DD HH24:MI') >= timestamp"
-            
-        return self.db.execute_read_query(query, return_type='pd.DataFrame')
+                number_of_rows: int = self.count_rows(symbol, min_date, max_date)
+            features: np.ndarray = np.empty((number_of_rows, len(feature_names)), dtype=np.float32)
+            target: np.ndarray = np.empty(number_of_rows, dtype=np.float32)
+            timestamps: np.ndarray = np.empty(number_of_rows, dtype='datetime64[ns]')
+            position: int = 0
+
+            if stored_columns is not None:
+                for start in range(0, number_of_rows, chunk_size):
+                    end: int = min(start + chunk_size, number_of_rows)
+                    values: np.ndarray = np.column_stack([store_views[column][start:end] for column in stored_names])
+                    values = self.add_computed_columns(store_timestamps[start:end], values, column_names, computed_frame)
+                    position = self.fill_training_values(store_timestamps[start:end], values, features, target, timestamps, position, remove_zeros)
+            else:
+                selected_columns: str = ','.join(['"timestamp"'] + [f'"{column}"' for column in stored_names])
+                query: str = f"SELECT {selected_columns} FROM {symbol}{date_condition} ORDER BY timestamp"
+                cursor = self.db.connection.cursor(name=f'training_data_{uuid.uuid4().hex}')
+                cursor.itersize = chunk_size
+                try:
+                    cursor.execute(query)
+                    while True:
+                        rows: list = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        position = self.fill_training_chunk(rows, features, target, timestamps, position, remove_zeros,
+                                                            column_names, computed_frame)
+                finally:
+                    cursor.close()
+                    self.db.commit()
+
+            result: dict = {
+                'features': features[:position],
+                'target': target[:position],
+                'timestamps': timestamps[:position],
+                'feature_names': feature_names,
+            }
+            self.dataset_cache.put(symbol, feature_names, min_date, max_date, remove_zeros, self.PIPELINE_VERSION,
+                                   result['features'], result['target'], result['timestamps'])
+            return self.finish_training_arrays(symbol, result, number_of_rows, as_dmatrix)
+        except Exception:
+            stop_memory_tracing()
+            raise
+
+
+    def finish_training_arrays(self, symbol: str, result: dict, number_of_rows: int, as_dmatrix: bool, cached: bool = False) -> dict:
+        """
+        Adds the QuantileDMatrix and the peak memory to the result of build_training_arrays and ends the memory
+        tracing of the build.
+
+        Parameters:
+        - symbol (str): The symbol of the training data.
+        - result (dict): The features, targets, timestamps and feature names.
+        - number_of_rows (int): The number of rows which were read.
+        - as_dmatrix (bool): If True, an xgboost QuantileDMatrix is created from the arrays.
+        - cached (bool, optional): If True, the arrays were served by the dataset cache. Defaults to False.
+
+        Returns:
+        - dict: The completed result.
+        """
+        result['dmatrix'] = None
+        if as_dmatrix:
+            import xgboost as xgb
+            result['dmatrix'] = xgb.QuantileDMatrix(result['features'], label=result['target'], feature_names=result['feature_names'])
+
+        result['peak_memory'] = stop_memory_tracing()
+        self.logger.info(f'build_training_arrays: {len(result["target"])} of {number_of_rows} rows of {symbol} used'
+                         f'{" from the dataset cache" if cached else ""}, peak memory {result["peak_memory"] / 1024 ** 2:.1f} MB')
+        return result
+
+    def as_feature_frame(self, training_data: dict) -> pd.DataFrame:
+        """
+        Wraps the feature array returned by build_training_arrays into a DataFrame without copying it, so that
+        the feature names are attached to the model during training.
+
+        Parameters:
+        - training_data (dict): The dictionary returned by build_training_arrays.
+
+        Returns:
+        - pd.DataFrame: A DataFrame which shares its memory with training_data['features'].
+        """
+        return pd.DataFrame(training_data['features'], columns=training_data['feature_names'], copy=False)
+
+    def fill_training_chunk(self, rows: list, features: np.ndarray, target: np.ndarray, timestamps: np.ndarray,
+                            position: int, remove_zeros: bool = True, column_names: list[str] = None,
+                            computed_frame: pd.DataFrame = None) -> int:
+        """
+        Writes a chunk of database rows into the preallocated training arrays.
+
+        Parameters:
+        - rows (list): A list of tuples (timestamp, open, close, indicators...) as returned by the database.
+        - features (np.ndarray): The preallocated feature array, the last column receives the return.
+        - target (np.ndarray): The preallocated target array.
+        - timestamps (np.ndarray): The preallocated timestamp array.
+        - position (int): The index of the first free row of the arrays.
+        - remove_zeros (bool, optional): If True, rows with a return of exactly zero are skipped. Defaults to True.
+        - column_names (list[str], optional): All feature columns, required if 'computed_frame' is passed. Defaults to None.
+        - computed_frame (pd.DataFrame, optional): The computed indicator columns which are not part of the rows,
+          as returned by IndicatorEngine.get_range. Defaults to None.
+
+        Returns:
+        - int: The index of the first free row after the chunk was written.
+        """
+        chunk_timestamps: np.ndarray = np.array([row[0] for row in rows], dtype='datetime64[ns]')
+        values: np.ndarray = np.array([row[1:] for row in rows], dtype=np.float64)
+        values = self.add_computed_columns(chunk_timestamps, values, column_names, computed_frame)
+        return self.fill_training_values(chunk_timestamps, values, features, target, timestamps, position, remove_zeros)
+
+    def add_computed_columns(self, chunk_timestamps: np.ndarray, values: np.ndarray, column_names: list[str],
+                             computed_frame: pd.DataFrame = None) -> np.ndarray:
+        """
+        Inserts computed indicator columns into a chunk of stored columns, joined by timestamp.
+
+        Parameters:
+        - chunk_timestamps (np.ndarray): The timestamps of the rows.
+        - values (np.ndarray): The stored columns of the rows in the order of 'column_names', shape (rows, stored columns).
+        - column_names (list[str]): All feature columns.
+        - computed_frame (pd.DataFrame, optional): The computed columns, indexed by timestamp. Defaults to None.
+
+        Returns:
+        - np.ndarray: The columns of the rows in the order of 'column_names'. Bars without a computed value contain NaN.
+        """
+        if computed_frame is None:
+            return values
+        merged: np.ndarray = np.empty((len(values), len(column_names)), dtype=np.float64)
+        index: pd.DatetimeIndex = pd.DatetimeIndex(chunk_timestamps)
+        stored_index: int = 0
+        for column_index, column in enumerate(column_names):
+            if column in computed_frame.columns:
+                merged[:, column_index] = computed_frame[column].reindex(index).to_numpy(dtype=np.float64)
+            else:
+                merged[:, column_index] = values[:, stored_index]
+                stored_index += 1
+        return merged
+
+    def fill_training_values(self, chunk_timestamps: np.ndarray, values: np.ndarray, features: np.ndarray, target: np.ndarray,
+                             timestamps: np.ndarray, position: int, remove_zeros: bool = True) -> int:
+        """
+        Writes a chunk of rows into the preallocated training arrays. Rows with missing values are skipped.
+
+        Parameters:
+        - chunk_timestamps (np.ndarray): The timestamps of the rows.
+        - values (np.ndarray): The columns of the rows (open, close, indicators...), shape (rows, columns).
+        - features (np.ndarray): The preallocated feature array, the last column receives the return.
+        - target (np.ndarray): The preallocated target array.
+        - timestamps (np.ndarray): The preallocated timestamp array.
+        - position (int): The index of the first free row of the arrays.
+        - remove_zeros (bool, optional): If True, rows with a return of exactly zero are skipped. Defaults to True.
+
+        Returns:
+        - int: The index of the first free row after the chunk was written.
+        """
+        returns: np.ndarray = (values[:, 1] - values[:, 0]) / values[:, 1]
+        valid: np.ndarray = ~np.isnan(values).any(axis=1) & np.isfinite(returns)
+        if remove_zeros:
+            valid &= returns != 0
+
+        number_of_valid_rows: int = int(valid.sum())
+        end: int = position + number_of_valid_rows
+        features[position:end, :-1] = values[valid]
+        features[position:end, -1] = returns[valid]
+        target[position:end] = returns[valid] > 0
+        timestamps[position:end] = chunk_timestamps[valid]
+        return end
     
     def remove_na(self, data: pd.DataFrame) -> pd.DataFrame:
         """
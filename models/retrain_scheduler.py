@@ -0,0 +1,296 @@
+"""
+This python module contains the training worker, which runs the trainings requested from the web application and
+incrementally retrains bots on a per bot schedule.
+
+The web application only queues a training in the 'training_jobs' table (see Database.enqueue_training_job), the
+training role claims the queued jobs with SELECT ... FOR UPDATE SKIP LOCKED and runs them. A bot is retrained on
+schedule if its column 'retrain_interval' (in minutes) is set, it is not training at the moment and its last
+training is at least 'retrain_interval' minutes ago. The retraining itself continues boosting the live model on the
+new bars, see XGBoostModel.train_incremental.
+
+While a bot is trained the worker holds its training lease ('training_until') and renews it every
+training_jobs.lease_seconds / 3 seconds. If the worker dies the lease expires and the bot is picked up again.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import time
+import json
+import socket
+import datetime
+import threading
+
+from config.config import load_config
+from infrastructure.database import Database, TRAINING_PROGRESS_CHANNEL, TRAINING_LEASE_CONDITION, PENDING_JOB_CONDITION
+from infrastructure.logger import create_logger
+from models.xgboost_model import XGBoostModel
+
+class RetrainScheduler:
+    def __init__(self) -> None:
+        """
+        Initialize the RetrainScheduler class.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.db: Database = Database()
+        self.logger = create_logger('retrain_scheduler.log')
+        self.model_classes: dict = {}
+        self.worker_id: str = f'{socket.gethostname()}-{os.getpid()}'
+        # The bots which are trained by this worker at the moment, their training leases are renewed by lease_loop
+        self.active: set[tuple[int, int]] = set()
+        self.active_lock: threading.Lock = threading.Lock()
+        # Time of the last iteration of retrain_loop, reported by the health server of the training role
+        self.last_progress: float = time.time()
+
+    def get_model_class(self, model_type: str) -> XGBoostModel | None:
+        """
+        Returns the model class which is responsible for the given model type. One instance per model type is
+        created and reused for all bots.
+
+        Parameters:
+        - model_type (str): The type of the model, e.g. 'xgboost'.
+
+        Returns:
+        - XGBoostModel | None: The instance of the model class, or None if the model type is not supported.
+        """
+        if model_type.lower() != 'xgboost':
+            # Add other model types here
+            return None
+        if model_type.lower() not in self.model_classes:
+            self.model_classes[model_type.lower()] = XGBoostModel()
+        return self.model_classes[model_type.lower()]
+
+    def start_training(self, user: int, bot_id: int) -> None:
+        """
+        Takes the training lease of a bot and registers the bot for the lease renewal.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - None
+        """
+        self.db.set_training(user, bot_id, True)
+        # Removes the 'queued' stage of a training job
+        self.db.set_training_progress(user, bot_id, None)
+        with self.active_lock:
+            self.active.add((int(user), int(bot_id)))
+
+    def finish_training(self, user: int, bot_id: int) -> None:
+        """
+        Updates 'last_trained' of a bot and releases its training lease.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+
+        Returns:
+        - None
+        """
+        with self.active_lock:
+            self.active.discard((int(user), int(bot_id)))
+        self.db.update_table(table_name='bots', column='last_trained', value=datetime.datetime.now(), where_condition=f'WHERE "user"={user} AND "id"={bot_id}')
+        self.db.set_training(user, bot_id, False)
+
+    def lease_loop(self) -> None:
+        """
+        Renews the training leases of the bots which are trained by this worker every training_jobs.lease_seconds / 3
+        seconds. Runs in its own thread and therefore uses its own database connection.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        db: Database = Database()
+        while True:
+            try:
+                with self.active_lock:
+                    active: list[tuple[int, int]] = list(self.active)
+                db.renew_training(active)
+            except Exception as e:
+                self.logger.error(f'lease_loop: Could not renew the training leases: {str(e)}')
+            time.sleep(self.config.training_jobs.lease_seconds / 3)
+
+    def get_due_bots(self) -> list:
+        """
+        Retrieves all bots whose incremental retraining is due and takes their training lease in the same statement.
+        The rows are locked with FOR UPDATE SKIP LOCKED, so if several training workers run at the same time every
+        due bot is returned to exactly one of them. Bots whose 'training' flag is set without a valid lease and
+        without a queued job were left by a dead worker and are retrained as well.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list: A list of tuples containing the user, the id and the model type of each bot which should be retrained.
+        """
+        query: str = "UPDATE bots SET training = True, training_until = NOW() + %(lease_seconds)s * INTERVAL '1 second'"
+        query += ' WHERE id IN (SELECT b.id FROM bots b WHERE b.retrain_interval > 0 AND b.last_trained IS NOT NULL'
+        query += f' AND NOT ({TRAINING_LEASE_CONDITION}) AND NOT {PENDING_JOB_CONDITION}'
+        query += " AND b.last_trained + b.retrain_interval * INTERVAL '1 minute' <= NOW() FOR UPDATE SKIP LOCKED)"
+        query += ' RETURNING "user", id, model_type'
+        self.db.execute_write_query(query, {'lease_seconds': self.config.training_jobs.lease_seconds, 'max_attempts': self.config.training_jobs.max_attempts})
+        due_bots: list = self.db.cursor.fetchall() if self.db.cursor.description else []
+        for user, bot_id, _ in due_bots:
+            self.db.notify(TRAINING_PROGRESS_CHANNEL, json.dumps({'user': int(user), 'bot_id': int(bot_id), 'training': True}))
+        self.db.commit()
+        with self.active_lock:
+            self.active.update((int(user), int(bot_id)) for user, bot_id, _ in due_bots)
+        return due_bots
+
+    def claim_job(self) -> tuple | None:
+        """
+        Claims the oldest queued training job. A job is claimed if it was not started yet, or if it was started by a
+        worker whose training lease expired, at most training_jobs.max_attempts times. The jobs of a bot which is
+        trained at the moment are skipped.
+
+        Parameters:
+        - None
+
+        Returns:
+        - tuple | None: The job id, the user, the bot id, the mode and the parameters of the job, or None if no job is queued.
+        """
+        query: str = 'UPDATE training_jobs SET started = NOW(), worker_id = %(worker_id)s, attempts = attempts + 1'
+        query += ' WHERE job_id = (SELECT j.job_id FROM training_jobs j JOIN bots b ON b."user" = j."user" AND b.id = j.bot_id'
+        query += f' WHERE j.finished IS NULL AND j.attempts < %(max_attempts)s AND NOT ({TRAINING_LEASE_CONDITION})'
+        query += ' ORDER BY j.created LIMIT 1 FOR UPDATE OF j SKIP LOCKED)'
+        query += ' RETURNING job_id, "user", bot_id, mode, parameters'
+        self.db.execute_write_query(query, {'worker_id': self.worker_id, 'max_attempts': self.config.training_jobs.max_attempts})
+        job: tuple | None = self.db.cursor.fetchone() if self.db.cursor.description else None
+        if job is not None:
+            # The lease is taken before the claim is committed, so no other worker starts a training of the bot
+            self.db.execute_write_query(f"UPDATE bots SET training_until = NOW() + %s * INTERVAL '1 second' WHERE \"user\"={job[1]} AND id={job[2]}",
+                                        (self.config.training_jobs.lease_seconds,))
+        self.db.commit()
+        return job
+
+    def run_job(self, job: tuple) -> None:
+        """
+        Runs a training job and records its end and its error, if any, in 'training_jobs'.
+
+        Parameters:
+        - job (tuple): The job as returned by claim_job.
+
+        Returns:
+        - None
+        """
+        job_id, user, bot_id, mode, parameters = job
+        parameters = json.loads(parameters) if isinstance(parameters, str) else (parameters or {})
+        error: str | None = None
+        bot: list | None = self.db.get_bot_by_id(bot_id)
+        try:
+            if bot is None:
+                raise ValueError(f'Bot {bot_id} does not exist')
+            self.logger.info(f'run_job: Running {mode} training job {job_id} of model_{user}_{bot_id}')
+            if mode == 'full':
+                self.train_bot(user, bot_id, bot[7], datetime.datetime.fromisoformat(parameters['start_time']),
+                               datetime.datetime.fromisoformat(parameters['end_time']), float(parameters['data_percentage']))
+            else:
+                self.retrain_bot(user, bot_id, bot[7])
+        except Exception as e:
+            error = str(e)
+            self.logger.error(f'run_job: Training job {job_id} of model_{user}_{bot_id} failed: {error}')
+            with self.active_lock:
+                self.active.discard((int(user), int(bot_id)))
+            self.db.set_training(user, bot_id, False)
+        self.db.execute_write_query('UPDATE training_jobs SET finished = NOW(), error = %s WHERE job_id = %s', (error, job_id))
+        self.db.commit()
+
+    def train_bot(self, user: int, bot_id: int, model_type: str, start_time: datetime.datetime, end_time: datetime.datetime, data_percentage: float) -> None:
+        """
+        Trains a new model of a bot on a date range, a full training requested from the web application.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - model_type (str): The type of the model of the bot.
+        - start_time (datetime.datetime): The start time for training data.
+        - end_time (datetime.datetime): The end time for training data.
+        - data_percentage (float): The percentage of data to be used for training.
+
+        Returns:
+        - None
+        """
+        model_class: XGBoostModel | None = self.get_model_class(model_type)
+        if model_class is None:
+            raise ValueError(f'The model type {model_type} is not supported')
+        self.start_training(user, bot_id)
+        try:
+            self.db.update_table(table_name='bots', column='training_set_percentage', value=data_percentage, where_condition=f'WHERE "user"={user} AND "id"={bot_id}')
+            model = model_class.create_model(params=model_class.get_params_from_database(user, bot_id))
+            model_class.train(user=user, model_id=bot_id, model=model, start_date=start_time, end_date=end_time, train_size=data_percentage)
+        finally:
+            self.finish_training(user, bot_id)
+
+    def retrain_bot(self, user: int, bot_id: int, model_type: str) -> dict | None:
+        """
+        Incrementally retrains a single bot. The 'training' flag of the bot is set while the retraining runs and
+        'last_trained' is updated afterwards, also if the new version was not promoted, so that the bot is not
+        retrained again before its next interval.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - bot_id (int): The unique identifier of the bot.
+        - model_type (str): The type of the model of the bot.
+
+        Returns:
+        - dict | None: The result of the incremental training or None if the bot was not retrained.
+        """
+        model_class: XGBoostModel | None = self.get_model_class(model_type)
+        if model_class is None:
+            self.finish_training(user, bot_id)
+            return None
+
+        self.start_training(user, bot_id)
+        try:
+            result: dict | None = model_class.train_incremental(user, bot_id)
+        except Exception as e:
+            self.logger.error(f'retrain_bot: Incremental training of model_{user}_{bot_id} failed: {str(e)}')
+            result = None
+        finally:
+            self.finish_training(user, bot_id)
+        return result
+
+    def retrain_loop(self) -> None:
+        """
+        Runs the queued training jobs every training_jobs.poll_seconds and checks every
+        incremental_training.scheduler_interval seconds which bots are due and retrains them one after another.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.logger.info(f'Starting retrain scheduler: {datetime.datetime.now()}')
+        threading.Thread(target=self.lease_loop, name='training_leases', daemon=True).start()
+        last_check: float = 0.0
+        while True:
+            self.last_progress = time.time()
+            try:
+                job: tuple | None = self.claim_job()
+                while job is not None:
+                    self.run_job(job)
+                    job = self.claim_job()
+                if time.time() - last_check >= self.config.incremental_training.scheduler_interval:
+                    last_check = time.time()
+                    for user, bot_id, model_type in self.get_due_bots():
+                        self.retrain_bot(user, bot_id, model_type)
+            except Exception as e:
+                self.logger.error(f'Error in retrain loop: {str(e)}')
+            time.sleep(self.config.training_jobs.poll_seconds)
@@ -23,7 +23,10 @@ from infrastructure.logger import create_logger
 from infrastructure.database import Database
 
 from models.model_base import ModelBase
+from models.model_registry import ModelRegistry
 from models.prepare_training_data import PrepareTrainingData
+from models.external_memory import DatabaseChunkIterator, TrainingProgressCallback
+from models.compiled_scorer import CompiledScorer
 
 class XGBoostModel(ModelBase):
     """
@@ -43,6 +46,7 @@ class XGBoostModel(ModelBase):
         self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
         self.logger = create_logger('xgboost.log')
         self.ptd = PrepareTrainingData()
+        self.registry = ModelRegistry(self.db)
         super().__init__(self.db, self.config)
         
     def get_default_params(self, mode: str = 'direction') -> dict:
@@ -76,6 +80,32 @@ class XGBoostModel(ModelBase):
             }
         return default_params
         
+    def get_params_from_database(self, user: int, model_id: int, mode: str = 'direction') -> dict:
+        """
+        Returns the parameters of the XGBoost model of a bot, the hyperparameters which were entered when the bot was
+        created and the default parameters for all hyperparameters which were left empty.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - model_id (int): The unique identifier of the bot.
+        - mode (str): The mode of the model, either 'direction' or 'return'. Default value is 'direction'.
+
+        Returns:
+        - dict: A dictionary containing the parameters for the XGBoost model.
+        """
+        params: dict = self.get_default_params(mode)
+        hyper_parameters = self.get_model_params_from_database(user, model_id)
+        if isinstance(hyper_parameters, str):
+            hyper_parameters = json.loads(hyper_parameters)
+        # The names of the bot creation form and the type of every parameter
+        parameter_types: dict = {'num_trees': ('n_estimators', int), 'max_depth': ('max_depth', int), 'learning_rate': ('learning_rate', float),
+                                 'gamma': ('gamma', float), 'colsample_bytree': ('colsample_bytree', float)}
+        for name, value in (hyper_parameters or {}).items():
+            if name in parameter_types and value not in (None, ''):
+                parameter, parameter_type = parameter_types[name]
+                params[parameter] = parameter_type(value)
+        return params
+
     def create_model(self, mode: str = 'direction', params: dict = None) -> xgb.XGBClassifier | xgb.XGBRegressor:
         """
         This function creates an XGBoost model based on the specified mode and parameters.
@@ -102,7 +132,7 @@ class XGBoostModel(ModelBase):
         return model
     
     
-    def train(self, user: int, model_id: int, model: xgb.XGBClassifier, start_date: datetime.datetime, end_date: datetime.datetime, train_size: float) -> None:
+    def train(self, user: int, model_id: int, model: xgb.XGBClassifier, start_date: datetime.datetime, end_date: datetime.datetime, train_size: float, external_memory: bool = None) -> None:
         """
         Trains the XGBoost model using data from the specified symbol and technical indicators within the given date range.
 
@@ -113,45 +143,237 @@ class XGBoostModel(ModelBase):
         - start_date (datetime.datetime): The start date of the data range for training.
         - end_date (datetime.datetime): The end date of the data range for training.
         - train_size (float): The proportion of the data to be used for training (between 0 and 1).
+        - external_memory (bool, optional): If True, the data is streamed in chunks into an external memory DMatrix instead
+          of being loaded into memory. If None, external memory is used if the date range contains at least
+          training.external_memory_min_rows rows. Defaults to None.
 
         Returns:
         - None: The function does not return anything. It trains the XGBoost model using the specified data.
         """
-        symbol: str = self.get_symbol_from_database(user, model_id)
+        symbol: str = self.get_table_from_database(user, model_id)
         technical_indicators: list[str] = self.get_technical_indicators_from_database(user, model_id)
+        indicator_names: list[str] = [technical_indicator.strip('"') for technical_indicator in technical_indicators]
+
+        if external_memory is None:
+            external_memory = self.ptd.count_rows(symbol, start_date, end_date) >= self.config.training.external_memory_min_rows
         
-        data = self.ptd.load_data(symbol, feature_columns=technical_indicators, min_date=start_date, max_date=end_date)
-        data = data.pipe(self.ptd.remove_na).pipe(self.ptd.remove_timestamp).pipe(self.ptd.add_return).pipe(self.ptd.add_direction, remove_zeros=True)
-        features, target = self.ptd.create_features_and_targets(data)
-        
-        if train_size != 1:
-            features_train, target_train, features_test, target_test = self.ptd.create_training_and_testing_set(features, target, train_size)   
+        if external_memory:
+            model, metrics, feature_names = self.train_external_memory(user, model_id, model, symbol, technical_indicators, start_date, end_date, train_size)
         else:
-            features_train = features
-            target_train = target 
-            features_test = features
-            target_test = target
-                
-        model.fit(features_train, target_train)
-        pred = self.predict(model, features_test)
-        
-        confusion_matrix: list = self.create_confusion_matrix(target_test, pred).tolist()
-        confusion_matrix: dict = json.dumps(confusion_matrix)
-        
-        metrics: dict = {
-            'confusion_matrix': confusion_matrix,
-            'accuracy': self.calc_accuracy(target_test, pred),
-            'balanced_accuracy': self.calc_balanced_accuracy(target_test, pred),
-            'precision': self.calc_precision(target_test, pred),
-            'recall': self.calc_recall(target_test, pred)
-        }
+            training_data: dict = self.ptd.build_training_arrays(symbol, feature_columns=technical_indicators, min_date=start_date, max_date=end_date,
+                                                                 chunk_size=self.config.training.chunk_size)
+            features: pd.DataFrame = self.ptd.as_feature_frame(training_data)
+            target: np.ndarray = training_data['target']
+            feature_names: list[str] = training_data['feature_names']
+            
+            if train_size != 1:
+                split_index: int = int(len(features) * train_size)
+                features_train, target_train = features.iloc[:split_index], target[:split_index]
+                features_test, target_test = features.iloc[split_index:], target[split_index:]
+            else:
+                features_train = features
+                target_train = target 
+                features_test = features
+                target_test = target
+                    
+            model.fit(features_train, target_train)
+            pred = self.predict(model, features_test)
+            
+            metrics: dict = self.calc_error_metrics(target_test, pred)
         
         self.db.insert_training_error_metrics(user=user, model_id=model_id, metrics=metrics)
         
-        self.save_model(model, user, model_id)
+        metadata: dict = {
+            'model_type': 'xgboost',
+            'mode': 'direction',
+            'library_version': xgb.__version__,
+            'feature_names': feature_names,
+            'technical_indicators': indicator_names,
+            'training_start': start_date,
+            'training_end': end_date,
+            'train_size': train_size,
+            'external_memory': external_memory
+        }
+        version: int = self.registry.reserve_version(user, model_id, 'xgboost')
+        model_path: str = self.save_model(model, user, model_id, metadata=metadata, version=version)
+        self.registry.register_version(user, model_id, version, model_path, metrics, start_date, end_date)
+        self.registry.promote(user, model_id, version)
+        self.registry.garbage_collect(user, model_id)
         
         return model
     
+    def train_external_memory(self, user: int, model_id: int, model: xgb.XGBClassifier, symbol: str, technical_indicators: list[str],
+                              start_date: datetime.datetime, end_date: datetime.datetime, train_size: float) -> tuple:
+        """
+        Trains the XGBoost model on a date range which does not need to fit into memory.
+
+        The training rows are streamed chunk by chunk from the symbol table into an external memory DMatrix which
+        xgboost caches on disk, and the trees are built with tree_method 'hist'. The test rows are streamed in the same
+        way for the evaluation. The progress is written to the column 'training_progress' of the bot after every
+        chunk and every few boosting rounds, so that it can be read through the training status API.
+
+        Parameters:
+        - user (int): The unique identifier of the user for whom the model is being trained.
+        - model_id (int): The unique identifier of the model instance.
+        - model (xgb.XGBClassifier): The model instance whose parameters are used for the training.
+        - symbol (str): The symbol table from which the data is read.
+        - technical_indicators (list[str]): The technical indicators which are used as features.
+        - start_date (datetime.datetime): The start date of the data range for training.
+        - end_date (datetime.datetime): The end date of the data range for training.
+        - train_size (float): The proportion of the data to be used for training (between 0 and 1).
+
+        Returns:
+        - tuple: A tuple containing the trained xgb.Booster, the error metrics (dict) and the feature names (list[str]).
+        """
+        total_rows: int = self.ptd.count_rows(symbol, start_date, end_date)
+        train_end_date: datetime.datetime = end_date
+        test_start_date: datetime.datetime = start_date
+        if train_size != 1:
+            split_date: datetime.datetime = self.ptd.get_split_date(symbol, start_date, end_date, train_size)
+            train_end_date = split_date - datetime.timedelta(minutes=1)
+            test_start_date = split_date
+
+        def report_loading(chunk: int, rows: int) -> None:
+            self.db.set_training_progress(user, model_id, {'stage': 'loading', 'chunk': chunk, 'rows': rows, 'total_rows': total_rows})
+
+        def report_training(finished_rounds: int, number_of_rounds: int) -> None:
+            self.db.set_training_progress(user, model_id, {'stage': 'training', 'round': finished_rounds, 'total_rounds': number_of_rounds})
+
+        training_config = self.config.training
+        train_iterator = DatabaseChunkIterator(self.ptd, symbol, technical_indicators, min_date=start_date, max_date=train_end_date,
+                                               chunk_size=training_config.chunk_size, cache_dir=training_config.external_memory_cache_dir.replace(f'{os.sep}config', ''),
+                                               progress_callback=report_loading)
+        dtrain: xgb.DMatrix = xgb.DMatrix(train_iterator)
+
+        params: dict = model.get_xgb_params()
+        params['tree_method'] = 'hist'
+        number_of_rounds: int = model.n_estimators or self.get_default_params()['n_estimators']
+        booster: xgb.Booster = xgb.train(params, dtrain, num_boost_round=number_of_rounds,
+                                         callbacks=[TrainingProgressCallback(number_of_rounds, report_training)])
+        booster.set_attr(scikit_learn=json.dumps({'_estimator_type': 'classifier'}))
+        del dtrain
+
+        test_iterator = DatabaseChunkIterator(self.ptd, symbol, technical_indicators, min_date=test_start_date, max_date=end_date,
+                                              chunk_size=training_config.chunk_size)
+        targets: list[np.ndarray] = []
+        predictions: list[np.ndarray] = []
+        while True:
+            chunk: tuple | None = test_iterator.read_chunk()
+            if chunk is None:
+                break
+            features, target, _ = chunk
+            targets.append(target.astype(np.int8))
+            predictions.append((booster.inplace_predict(features) > 0.5).astype(np.int8))
+            self.db.set_training_progress(user, model_id, {'stage': 'evaluating', 'rows': test_iterator.rows_read})
+
+        metrics: dict = self.calc_error_metrics(np.concatenate(targets), np.concatenate(predictions))
+        self.db.set_training_progress(user, model_id, {'stage': 'finished'})
+        return booster, metrics, train_iterator.feature_names
+
+    def train_incremental(self, user: int, model_id: int, holdout_size: float = None, additional_trees: int = None) -> dict | None:
+        """
+        Continues boosting the live model of a bot on the bars which arrived after the end of its training range
+        instead of refitting all trees from scratch.
+
+        The new bars are split chronologically into a training part and a holdout. The live model and the continued
+        model are both evaluated on the holdout and the continued model is registered as a new version. It is only
+        promoted to live if its balanced accuracy does not regress by more than incremental_training.max_regression.
+
+        Parameters:
+        - user (int): The unique identifier of the user who owns the bot.
+        - model_id (int): The unique identifier of the bot.
+        - holdout_size (float, optional): The proportion of the new bars which is used as holdout.
+          Defaults to incremental_training.holdout_size of the config.
+        - additional_trees (int, optional): The number of trees which are added to the live model.
+          Defaults to incremental_training.additional_trees of the config.
+
+        Returns:
+        - dict | None: A dictionary with the keys 'version', 'promoted', 'baseline' and 'metrics', or None if no
+        retraining was done because there is no live model, too few new bars or the model is already too large.
+        """
+        incremental_config = self.config.incremental_training
+        if holdout_size is None:
+            holdout_size = incremental_config.holdout_size
+        if additional_trees is None:
+            additional_trees = incremental_config.additional_trees
+
+        live_version: dict | None = self.registry.get_live_version(user, model_id)
+        if live_version is None:
+            self.logger.info(f'train_incremental: model_{user}_{model_id} has no live version, a full training is required.')
+            return None
+
+        live_model: xgb.XGBClassifier = self.load_model(user, model_id, use_cache=False, version=int(live_version['version']))
+        number_of_trees: int = live_model.get_booster().num_boosted_rounds()
+        if number_of_trees + additional_trees > incremental_config.max_trees:
+            self.logger.info(f'train_incremental: model_{user}_{model_id} has {number_of_trees} trees, a full training is required.')
+            return None
+
+        symbol: str = self.get_table_from_database(user, model_id)
+        technical_indicators: list[str] = self.get_technical_indicators_from_database(user, model_id)
+        indicator_names: list[str] = [technical_indicator.strip('"') for technical_indicator in technical_indicators]
+        start_date: datetime.datetime = pd.Timestamp(live_version['max_date']).to_pydatetime() + datetime.timedelta(minutes=1)
+        end_date: datetime.datetime = datetime.datetime.now()
+
+        training_data: dict = self.ptd.build_training_arrays(symbol, feature_columns=technical_indicators, min_date=start_date, max_date=end_date)
+        features: pd.DataFrame = self.ptd.as_feature_frame(training_data)
+        target: np.ndarray = training_data['target']
+        if len(features) < incremental_config.min_new_bars:
+            self.logger.info(f'train_incremental: Only {len(features)} new bars for model_{user}_{model_id}, skipping.')
+            return None
+
+        split_index: int = int(len(features) * (1 - holdout_size))
+        features_train, target_train = features.iloc[:split_index], target[:split_index]
+        features_holdout, target_holdout = features.iloc[split_index:], target[split_index:]
+
+        baseline: dict = self.calc_error_metrics(target_holdout, self.predict(live_model, features_holdout))
+
+        # The parameters of a loaded model are not restored from the model file, the added trees are grown with the
+        # hyperparameters of the bot like the trees of the full training
+        params: dict = self.get_params_from_database(user, model_id)
+        params['n_estimators'] = additional_trees
+        model: xgb.XGBClassifier = self.create_model(params=params)
+        model.fit(features_train, target_train, xgb_model=live_model.get_booster())
+        metrics: dict = self.calc_error_metrics(target_holdout, self.predict(model, features_holdout))
+
+        metadata: dict = self.load_model_metadata(user, model_id, version=int(live_version['version']))
+        metadata.update({
+            'library_version': xgb.__version__,
+            'feature_names': training_data['feature_names'],
+            'technical_indicators': indicator_names,
+            'training_end': end_date,
+            'parent_version': int(live_version['version'])
+        })
+        version: int = self.registry.reserve_version(user, model_id, 'xgboost', training_mode='incremental')
+        model_path: str = self.save_model(model, user, model_id, metadata=metadata, version=version)
+        self.registry.register_version(user, model_id, version, model_path, metrics, live_version['min_date'], end_date)
+
+        promoted: bool = metrics['balanced_accuracy'] >= baseline['balanced_accuracy'] - incremental_config.max_regression
+        if promoted:
+            self.registry.promote(user, model_id, version)
+            self.db.insert_training_error_metrics(user=user, model_id=model_id, metrics=metrics)
+        self.logger.info(f'train_incremental: model_{user}_{model_id} version {version} balanced accuracy {metrics["balanced_accuracy"]:.4f} '
+                         f'(live: {baseline["balanced_accuracy"]:.4f}), promoted: {promoted}')
+        self.registry.garbage_collect(user, model_id)
+
+        return {'version': version, 'promoted': promoted, 'baseline': baseline, 'metrics': metrics}
+
+    def compile_model(self, model: xgb.XGBClassifier) -> CompiledScorer | xgb.XGBClassifier:
+        """
+        Flattens the trees of a trained model into a CompiledScorer, which predicts single rows without the
+        overhead of XGBClassifier.predict. If the model can not be compiled, the model itself is returned.
+
+        Parameters:
+        - model (xgb.XGBClassifier): The trained model.
+
+        Returns:
+        - CompiledScorer | xgb.XGBClassifier: The compiled model or the unchanged model.
+        """
+        try:
+            return CompiledScorer(model.get_booster())
+        except ValueError as e:
+            self.logger.warning(f'compile_model: Model can not be compiled, using XGBClassifier.predict: {str(e)}')
+            return model
+
     def predict(self, model, features: pd.DataFrame) -> np.ndarray:
         """
         This function uses a trained model to predict the target values for the given features.
@@ -0,0 +1,47 @@
+"""
+This file starts a prediction worker which executes a share of the running bots.
+
+Workers can run on the host of the web application or on other hosts which can reach the database. Every worker
+claims bots through leases in the 'bot_leases' table (see models/lease_manager.py), renews them with a heartbeat
+and takes over the bots of workers which stopped. distributed.enabled has to be set in config.yaml, the tables are
+created by main.py.
+
+Usage:
+    python prediction_worker.py --worker-id worker-1
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+
+import argparse
+
+from config.config import load_config
+from infrastructure.logger import create_logger
+from models.execute_models import ExecuteModels
+
+logger = create_logger('prediction_worker.log')
+config = load_config(f'{path_to_config}{os.sep}config{os.sep}config.yaml')
+
+parser = argparse.ArgumentParser(description='Start a prediction worker which executes a share of the running bots.')
+parser.add_argument('--worker-id', type=str, default=None, help='Unique name of the worker. Defaults to <host>-<pid>-<random>.')
+args = parser.parse_args()
+
+if not config.distributed.enabled:
+    logger.error('distributed.enabled is not set in config.yaml, the prediction worker is not started.')
+    sys.exit(1)
+
+em = ExecuteModels(worker_id=args.worker_id)
+logger.info(f'Starting prediction worker {em.leases.worker_id}')
+try:
+    em.prediction_loop()
+except KeyboardInterrupt:
+    logger.info(f'Stopping prediction worker {em.leases.worker_id}')
+finally:
+    em.leases.release_all()
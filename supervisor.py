@@ -0,0 +1,321 @@
+"""
+This file is the entry point to run the ML Trader application as separate processes. It performs the following tasks:
+
+1. Starts the database, applies the schema migrations, creates the tables of the symbols, downloads the missing historical data and aggregates the bars of the
+   higher timeframes (see infrastructure/startup.py).
+2. Starts one process per replica of each role configured in supervisor.roles:
+   - ingestion: fetches and processes data from the ByBit API.
+   - execution: creates predictions for the running bots. More than one replica requires distributed.enabled.
+   - training: incrementally retrains bots with a retrain interval.
+   - web: serves the web application with gunicorn and supervisor.roles.web.workers worker processes of
+     supervisor.roles.web.threads threads each, the event streams of the browsers are held open by these threads.
+3. Restarts every process which exits, with an exponentially increasing delay if it keeps crashing.
+4. Polls the health endpoint of every process every supervisor.health_interval seconds and restarts a process whose
+   health check failed supervisor.health_failures times in a row, e.g. because its loop made no progress for
+   supervisor.max_progress_age_seconds.
+
+Every ingestion, execution and training process serves GET /health on supervisor.health_port plus its process index,
+the web role serves /api/health on the port of the web server. The trainings requested from the web application are
+queued and run by the training role, so the web workers only serve requests.
+
+Usage:
+    python supervisor.py
+    python supervisor.py --role execution --replica 0 --health-port 8101   (started by the supervisor)
+"""
+import os
+import sys
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        break
+sys.path.append(path_to_config)
+
+import ssl
+import time
+import socket
+import signal
+import argparse
+import threading
+import subprocess
+import urllib.request
+
+from config.config import load_config
+from infrastructure.logger import create_logger
+
+logger = create_logger('supervisor.log')
+config = load_config(f'{path_to_config}{os.sep}config{os.sep}config.yaml')
+
+ROLES: list[str] = ['ingestion', 'execution', 'training', 'web']
+
+
+def run_role(role: str, replica: int, health_port: int) -> None:
+    """
+    Runs a single role in the current process until it is stopped.
+
+    Parameters:
+    - role (str): The role which is executed ('ingestion', 'execution' or 'training').
+    - replica (int): The index of the replica of the role.
+    - health_port (int): The port of the health server of the process.
+
+    Returns:
+    - None
+    """
+    from infrastructure.health import HealthServer
+
+    if role == 'ingestion':
+        from infrastructure.bybit_data import BybitData
+        worker = BybitData()
+        target = worker.get_data_thread
+    elif role == 'execution':
+        from models.execute_models import ExecuteModels
+        worker = ExecuteModels(worker_id=f'{socket.gethostname()}-execution-{replica}')
+        target = worker.prediction_loop
+    elif role == 'training':
+        from models.retrain_scheduler import RetrainScheduler
+        worker = RetrainScheduler()
+        target = worker.retrain_loop
+    else:
+        raise ValueError(f'Unknown role: {role}')
+
+    worker_thread = threading.Thread(target=target, name=f'{role}_{replica}', daemon=True)
+    worker_thread.start()
+    # The loop of the role records the time of every iteration, a loop which hangs fails the health check
+    max_progress_age: float = config.supervisor.roles[role].get('max_progress_age_seconds', config.supervisor.max_progress_age_seconds)
+    HealthServer(role, config.supervisor.health_host, health_port, [worker_thread], progress=lambda: worker.last_progress, max_progress_age=max_progress_age).start()
+    logger.info(f'Started role {role} (replica {replica}, pid {os.getpid()}, health port {health_port})')
+
+    # The process exits if the worker thread dies, so that the supervisor restarts it
+    worker_thread.join()
+    logger.error(f'Role {role} (replica {replica}) stopped, exiting')
+    sys.exit(1)
+
+
+class Supervisor:
+    def __init__(self) -> None:
+        """
+        Initialize the Supervisor class.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        # [{'role', 'replica', 'command', 'health_url', 'process', 'restarts', 'next_start', 'started', 'health_failures'}]
+        self.processes: list[dict] = []
+        self.stopping: bool = False
+
+    def get_replicas(self, role: str) -> int:
+        """
+        Returns the number of processes which are started for a role.
+
+        Parameters:
+        - role (str): The role.
+
+        Returns:
+        - int: The number of replicas.
+        """
+        replicas: int = int(config.supervisor.roles[role].replicas)
+        if role == 'web' and replicas > 1:
+            # Gunicorn manages the worker processes of the web role (supervisor.roles.web.workers)
+            replicas = 1
+        if role == 'ingestion' and replicas > 1:
+            logger.warning(f'Only one ingestion process is supported, starting 1 instead of {replicas}')
+            replicas = 1
+        if role == 'execution' and replicas > 1 and not config.distributed.enabled:
+            logger.warning(f'More than one execution process requires distributed.enabled, starting 1 instead of {replicas}')
+            replicas = 1
+        return replicas
+
+    def build_command(self, role: str, replica: int, health_port: int) -> list[str]:
+        """
+        Builds the command which starts a process of a role.
+
+        Parameters:
+        - role (str): The role.
+        - replica (int): The index of the replica.
+        - health_port (int): The port of the health server of the process.
+
+        Returns:
+        - list[str]: The command.
+        """
+        if role == 'web':
+            command: list[str] = [sys.executable, '-m', 'gunicorn',
+                                  '--workers', str(config.supervisor.roles.web.workers),
+                                  '--worker-class', 'gthread', '--threads', str(config.supervisor.roles.web.threads),
+                                  '--bind', f'{config.webserver.host}:{config.webserver.port}',
+                                  '--chdir', path_to_config]
+            if config.webserver.certfile and config.webserver.keyfile:
+                command += ['--certfile', config.webserver.certfile, '--keyfile', config.webserver.keyfile]
+            return command + ['website.wsgi:app']
+        return [sys.executable, os.path.abspath(__file__), '--role', role, '--replica', str(replica), '--health-port', str(health_port)]
+
+    def build_health_url(self, role: str, health_port: int) -> str:
+        """
+        Builds the URL of the health endpoint of a process of a role.
+
+        Parameters:
+        - role (str): The role.
+        - health_port (int): The port of the health server of the process.
+
+        Returns:
+        - str: The URL.
+        """
+        if role == 'web':
+            scheme: str = 'https' if config.webserver.certfile and config.webserver.keyfile else 'http'
+            host: str = '127.0.0.1' if config.webserver.host in ('0.0.0.0', '') else config.webserver.host
+            return f'{scheme}://{host}:{config.webserver.port}/api/health'
+        return f'http://{config.supervisor.health_host}:{health_port}/health'
+
+    def check_health(self, entry: dict) -> bool:
+        """
+        Requests the health endpoint of a process with a timeout of supervisor.health_timeout seconds.
+
+        Parameters:
+        - entry (dict): The entry of the replica in self.processes.
+
+        Returns:
+        - bool: True if the endpoint answered with status code 200, False otherwise.
+        """
+        # The certificate of the web server is usually issued for its public name, not for the local address
+        context: ssl.SSLContext = ssl._create_unverified_context()
+        try:
+            with urllib.request.urlopen(entry['health_url'], timeout=config.supervisor.health_timeout, context=context) as response:
+                return response.status == 200
+        except Exception as e:
+            logger.warning(f'Health check of {entry["role"]} replica {entry["replica"]} failed: {str(e)}')
+            return False
+
+    def start(self) -> None:
+        """
+        Starts the processes of all roles.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        health_port: int = config.supervisor.health_port
+        for role in ROLES:
+            replicas: int = self.get_replicas(role)
+            for replica in range(replicas):
+                entry: dict = {'role': role, 'replica': replica, 'command': self.build_command(role, replica, health_port),
+                               'health_url': self.build_health_url(role, health_port),
+                               'process': None, 'restarts': 0, 'next_start': 0.0, 'started': 0.0, 'health_failures': 0}
+                if role != 'web':
+                    health_port += 1
+                self.processes.append(entry)
+                self.start_process(entry)
+
+    def start_process(self, entry: dict) -> None:
+        """
+        Starts the process of a replica.
+
+        Parameters:
+        - entry (dict): The entry of the replica in self.processes.
+
+        Returns:
+        - None
+        """
+        entry['process'] = subprocess.Popen(entry['command'], cwd=path_to_config)
+        entry['started'] = time.time()
+        entry['health_failures'] = 0
+        logger.info(f'Started {entry["role"]} replica {entry["replica"]} with pid {entry["process"].pid}')
+
+    def monitor(self) -> None:
+        """
+        Restarts every process which exited after supervisor.restart_delay seconds. A process which ran for less than
+        supervisor.stable_seconds is considered crashing and every further restart doubles the delay, up to
+        supervisor.max_restart_delay. The health endpoint of every running process is polled every
+        supervisor.health_interval seconds, once it is older than supervisor.health_grace_seconds. A process whose
+        health check failed supervisor.health_failures times in a row is killed and restarted like a process which exited.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        last_health_check: float = 0.0
+        while not self.stopping:
+            now: float = time.time()
+            check_health: bool = now - last_health_check >= config.supervisor.health_interval
+            if check_health:
+                last_health_check = now
+            for entry in self.processes:
+                process = entry['process']
+                if process is not None and process.poll() is None:
+                    if check_health and now - entry['started'] >= config.supervisor.health_grace_seconds:
+                        entry['health_failures'] = 0 if self.check_health(entry) else entry['health_failures'] + 1
+                        if entry['health_failures'] >= config.supervisor.health_failures:
+                            logger.error(f'{entry["role"]} replica {entry["replica"]} failed {entry["health_failures"]} health checks, killing pid {process.pid}')
+                            process.kill()
+                            process.wait()
+                    continue
+                if process is not None:
+                    crashed: bool = now - entry['started'] < config.supervisor.stable_seconds
+                    entry['restarts'] = entry['restarts'] + 1 if crashed else 0
+                    delay: float = min(config.supervisor.restart_delay * 2 ** max(entry['restarts'] - 1, 0), config.supervisor.max_restart_delay)
+                    entry['next_start'] = now + delay
+                    entry['process'] = None
+                    logger.error(f'{entry["role"]} replica {entry["replica"]} exited with code {process.returncode}, restarting in {delay}s')
+                elif now >= entry['next_start']:
+                    self.start_process(entry)
+            time.sleep(1)
+
+    def stop(self, *args) -> None:
+        """
+        Terminates all processes.
+
+        Parameters:
+        - *args: The arguments of the signal handler.
+
+        Returns:
+        - None
+        """
+        self.stopping = True
+        for entry in self.processes:
+            if entry['process'] is not None and entry['process'].poll() is None:
+                entry['process'].terminate()
+        for entry in self.processes:
+            if entry['process'] is not None:
+                try:
+                    entry['process'].wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    entry['process'].kill()
+        logger.info('Supervisor stopped')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Start the roles of ML Trader as supervised processes.')
+    parser.add_argument('--role', type=str, choices=ROLES[:-1], default=None, help='Run a single role in this process (used by the supervisor).')
+    parser.add_argument('--replica', type=int, default=0)
+    parser.add_argument('--health-port', type=int, default=config.supervisor.health_port)
+    args = parser.parse_args()
+
+    if args.role is not None:
+        run_role(args.role, args.replica, args.health_port)
+    else:
+        from infrastructure.database import Database
+        from infrastructure.startup import start_postgres, migrate_database, build_bot_stats, fill_gaps, build_timeframes, build_feature_stores, reset_positions, reset_training
+
+        logger.info('Starting ML Trader supervisor...')
+        start_postgres()
+        db = Database()
+        migrate_database(db)
+        build_bot_stats(db)
+        fill_gaps()
+        build_timeframes(db)
+        build_feature_stores(db)
+        reset_positions(db)
+        reset_training(db)
+
+        supervisor = Supervisor()
+        signal.signal(signal.SIGTERM, supervisor.stop)
+        signal.signal(signal.SIGINT, supervisor.stop)
+        supervisor.start()
+        supervisor.monitor()
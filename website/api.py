@@ -1,8 +1,10 @@
-from flask import Blueprint, render_template, redirect, flash, request, url_for
+from flask import Blueprint, render_template, redirect, flash, request, url_for, Response, stream_with_context
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import os
 import json
+import math
 import datetime
 import numpy as np
 import pandas as pd
@@ -10,16 +12,227 @@ import pandas as pd
 from website.user import User
 from website.app import db
 from infrastructure.database import Database
+from infrastructure.feature_snapshot import FeatureSnapshotReader, TICK_COLUMNS
+from infrastructure.timeframe_aggregator import get_table_name
+from infrastructure.downsampling import downsample, MODES
+from infrastructure.columnar_encoding import encode_series, encode_array, ENCODING
+from infrastructure.database import BARS_READY_CHANNEL, PRICES_READY_CHANNEL, TRADE_INSERTED_CHANNEL
+from website.response_cache import response_cache
+from website.event_bus import event_bus
+from models.model_registry import ModelRegistry
 
 
 api = Blueprint('api', __name__)
 
+# The response formats of the time series APIs
+FORMATS: list[str] = ['json', ENCODING]
+
 postgres_db = Database()
+model_registry = ModelRegistry(postgres_db)
+snapshots = FeatureSnapshotReader()
 
 # TODO Include a check if the user who send the request is allowed to execute the method for the requested bot
 
+@api.route('/api/health')
+def health() -> tuple:
+    """
+    Health check of the web role which is used by supervisor.py and load balancers.
+
+    Returns:
+    - tuple: A JSON string with the role, the process id and the status, and the status code 200 if the database is reachable or 503 otherwise.
+    """
+    database_reachable: bool = postgres_db.execute_read_query('SELECT 1', first_only=True) is not None
+    if not database_reachable:
+        try:
+            # Leave an aborted transaction so that the next requests can use the connection again
+            postgres_db.connection.rollback()
+        except Exception:
+            pass
+    result = json.dumps({'role': 'web', 'pid': os.getpid(), 'status': 'ok' if database_reachable else 'failing'})
+    return result, 200 if database_reachable else 503
+
+def parse_time(value: str | None) -> datetime.datetime | None:
+    """
+    Parses a time parameter of the chart APIs. Accepted are the format of the dates of the charts
+    ('%d.%m.%Y %H:%M:%S') and ISO 8601, e.g. the cursor of a previous response.
+
+    Parameters:
+    - value (str | None): The parameter.
+
+    Returns:
+    - datetime.datetime | None: The time, None if the parameter is missing.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%d.%m.%Y %H:%M:%S')
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid time {value}, use ISO 8601 or %d.%m.%Y %H:%M:%S')
+
+def format_cursor(timestamp) -> str | None:
+    """
+    Formats the newest timestamp of a response as the cursor which the client passes as 'since' with its next request.
+
+    Parameters:
+    - timestamp: The timestamp, None if the response is empty.
+
+    Returns:
+    - str | None: The timestamp in ISO 8601 with microseconds.
+    """
+    if timestamp is None or pd.isna(timestamp):
+        return None
+    return pd.Timestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+def get_rollup_timeframe(timeframe: int, entries: int, points: int | None) -> int | None:
+    """
+    Returns the coarsest aggregated timeframe (see config.timeframes.aggregated) from which a downsampled chart can
+    be read. The timeframe must still contain more bars within the range than the chart shows points.
+
+    Parameters:
+    - timeframe (int): The timeframe of the chart in minutes.
+    - entries (int): The number of bars of the chart in its timeframe.
+    - points (int | None): The number of points of the downsampled chart, None if the chart is not downsampled.
+
+    Returns:
+    - int | None: The aggregated timeframe in minutes, None if the bars of the chart are read.
+    """
+    if points is None or entries <= points:
+        return None
+    rollups: list[int] = [int(rollup) for rollup in postgres_db.config.timeframes.aggregated
+                          if int(rollup) > timeframe and int(rollup) % timeframe == 0 and entries * timeframe // int(rollup) >= points]
+    return max(rollups) if rollups else None
+
+def align_trades(bar_times: np.ndarray, trade_times: np.ndarray) -> np.ndarray:
+    """
+    Returns the index of the nearest bar of every trade. If a trade lies exactly between two bars the older bar is
+    used.
+
+    Parameters:
+    - bar_times (np.ndarray): The times of the bars as int64, sorted ascending.
+    - trade_times (np.ndarray): The times of the trades as int64 in the same unit.
+
+    Returns:
+    - np.ndarray: The index of the nearest bar of every trade.
+    """
+    if len(bar_times) < 2:
+        return np.zeros(len(trade_times), dtype=np.int64)
+    right: np.ndarray = np.clip(np.searchsorted(bar_times, trade_times), 1, len(bar_times) - 1)
+    left: np.ndarray = right - 1
+    return np.where(trade_times - bar_times[left] <= bar_times[right] - trade_times, left, right)
+
+def position_trades(bar_times: np.ndarray, trade_times: np.ndarray) -> np.ndarray:
+    """
+    Returns the fractional position of every trade on the x-axis of a chart whose points are the bars, e.g. 2.25 for a
+    trade a quarter of the way from the third to the fourth bar. Trades outside the bars are placed at the first or last bar.
+
+    Parameters:
+    - bar_times (np.ndarray): The times of the bars as int64, sorted ascending.
+    - trade_times (np.ndarray): The times of the trades as int64 in the same unit.
+
+    Returns:
+    - np.ndarray: The position of every trade as float64.
+    """
+    if not len(bar_times):
+        return np.zeros(len(trade_times), dtype=np.float64)
+    return np.interp(trade_times, bar_times, np.arange(len(bar_times), dtype=np.float64))
+
+@login_required
+@api.route('/api/cache_stats')
+def cache_stats() -> str:
+    """
+    Returns the counters of the response cache of this web worker (see website/response_cache.py).
+
+    Parameters:
+    - None
+
+    Returns:
+    - str: A JSON string with the hits, misses, 304 responses, invalidations, entries and the counters per route.
+    """
+    return json.dumps({'pid': os.getpid(), **response_cache.get_stats()})
+
+@login_required
+@api.route('/api/events')
+def events():
+    """
+    Streams the events of the current user with Server-Sent Events (see website/event_bus.py): the new prices
+    ('prices_ready') and bars ('bars_ready') of the requested symbols and the predictions ('prediction_made'), trades
+    ('trade_inserted') and training progress ('training_progress') of the bots of the user. The stream replaces the
+    polling of the charts and of the training status. Every stream occupies one thread of the web worker, so at most
+    event_bus.max_streams streams are open per worker (see EventBus.subscribe) and the browsers poll beyond it. The
+    stream only reads the queue of its subscription and never uses postgres_db, whose cursor is shared by the requests.
+
+    Parameters:
+    - symbols (str): The comma separated symbols whose prices and bars are streamed, e.g. 'BTCUSD,ETHUSD'.
+
+    Returns:
+    - flask.Response: The stream with the mimetype text/event-stream, status code 401 if no user is logged in or
+      status code 503 if the maximum number of streams is open.
+    """
+    if not current_user.is_authenticated:
+        return json.dumps({'error': 'Not logged in'}), 401
+    symbols: set[str] = {symbol for symbol in request.args.get('symbols', '').split(',') if symbol}
+    subscription = event_bus.subscribe(int(current_user.get_id()), symbols)
+    if subscription is None:
+        return json.dumps({'error': 'Too many open event streams'}), 503, {'Retry-After': str(event_bus.config.event_bus.keepalive_seconds)}
+    response = Response(stream_with_context(event_bus.stream(subscription)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disables the buffering of reverse proxies like nginx, which would hold the events back
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@api.route('/api/bots_state')
+def bots_state() -> str:
+    """
+    Retrieves the state of the bots of the current user (status, risk settings, prediction, live model version and
+    performance aggregates) with the latest prices of their symbols, replacing one request per bot and setting. The bots
+    are read with one query per page (see Database.get_bots_state) and the prices from the shared memory snapshots or
+    with one query, so the time per page does not depend on the number of bots of the user.
+
+    Parameters:
+    - after (int, optional): The 'next_after' of the previous page. Defaults to the first page.
+    - limit (int, optional): The number of bots per page, between 1 and dashboard.max_page_size. Defaults to dashboard.page_size.
+    - bot_id (int, optional): Only the state of this bot, e.g. for the page of a bot. Defaults to all bots.
+
+    Returns:
+    - str: A JSON string with the keys 'bots' (one object per bot), 'prices' (the latest price of every symbol of the
+      page by upper case symbol) and 'next_after' (the keyset of the next page, None on the last page), or status code 401 if no
+      user is logged in.
+    """
+    if not current_user.is_authenticated:
+        return json.dumps({'error': 'Not logged in'}), 401
+    try:
+        after: int | None = int(request.args['after']) if request.args.get('after') else None
+        limit: int = max(1, min(int(request.args.get('limit', postgres_db.config.dashboard.page_size)), postgres_db.config.dashboard.max_page_size))
+        bot_id: int | None = int(request.args['bot_id']) if request.args.get('bot_id') else None
+    except ValueError as e:
+        return json.dumps({'error': str(e)}), 400
+    # One more bot than requested tells whether there is a next page
+    bots: pd.DataFrame = postgres_db.get_bots_state(int(current_user.get_id()), after, limit + 1, bot_id=bot_id)
+    next_after: int | None = int(bots['id'].iloc[limit - 1]) if len(bots) > limit else None
+    bots = bots.iloc[:limit]
+
+    prices: dict = {}
+    for symbol in bots['symbol'].dropna().unique():
+        tick: tuple | None = snapshots.read_tick(symbol)
+        if tick is not None:
+            prices[symbol.upper()] = {'timestamp': pd.Timestamp(tick[0]), **dict(zip(TICK_COLUMNS, tick[1].tolist()))}
+    missing: list[str] = [symbol for symbol in bots['symbol'].dropna().unique() if symbol.upper() not in prices]
+    if missing:
+        latest: pd.DataFrame = postgres_db.get_latest_prices(missing)
+        prices.update({row['symbol'].upper(): row.drop('symbol').to_dict() for _, row in latest.iterrows()})
+
+    result: dict = {'bots': bots.to_dict('records'), 'prices': prices, 'next_after': next_after}
+    return json.dumps(result, default=str)
+
 @login_required
 @api.route('/api/chart_data')
+@response_cache.cached(lambda: [(BARS_READY_CHANNEL, request.args.get('symbol', '').lower())] +
+                       ([(TRADE_INSERTED_CHANNEL, f"{request.args.get('user')}:{request.args.get('bot_id')}")] if request.args.get('return_trades') == 'True' else []))
 def chart_data() -> dict:
     """
     This function retrieves the last 'entries' number of closing prices for a given symbol from a PostgreSQL database.
@@ -27,65 +240,138 @@ def chart_data() -> dict:
 
     Parameters:
     - symbol (str): The symbol for which the closing prices are to be retrieved.
-    - entries (int): The number of closing prices to retrieve.
+    - entries (int, optional): The maximum number of closing prices to retrieve. Defaults to all bars between 'from' and
+      'to', at most chart.max_entries.
+    - timeframe (int, optional): The timeframe of the bars in minutes, e.g. the timeframe of a bot. Defaults to 1.
+    - points (int, optional): If the range contains more bars, it is downsampled to about this number of points (at most
+      chart.max_points), the bars of trades are always kept. Defaults to no downsampling.
+    - mode (str, optional): The downsampling mode, 'lttb' or 'minmax' (see infrastructure/downsampling.py). Defaults to 'lttb'.
+    - from (str, optional): The first bar (inclusive), see parse_time. Defaults to the newest 'entries' bars.
+    - to (str, optional): The last bar (inclusive), see parse_time. Defaults to the newest bar.
+    - since (str, optional): The cursor of a previous response, only the bar of the cursor and the bars after it are
+      returned. The bar of the cursor is returned again because it can still be rewritten. Defaults to None.
+    - trades_since (str, optional): The trade cursor of a previous response, only trades after it are returned.
+      Defaults to 'since'.
+    - format (str, optional): 'json' or 'columnar' (see infrastructure/columnar_encoding.py). Defaults to 'json'.
 
     Returns:
-    - dict: A dictionary containing the symbol, dates, and price data. The dates are formatted as '%d.%m.%Y %H:%M:%S'.
+    - dict: A dictionary containing the symbol, dates, price data and the cursor of the newest bar. The dates are
+      formatted as '%d.%m.%Y %H:%M:%S'. In the 'columnar' format the dates are encoded in 'time', the price data in
+      'columns' and the trade indexes, positions, prices and times (epoch seconds) as typed arrays. The
+      positions place the trades at their exact time between the bars (see position_trades).
     """
     # TODO Error handling
     symbol: str = request.args.get('symbol')
-    entries: int = int(request.args.get('entries'))
-    # TODO Rewrite entries to be timeframes instead and change the SQL query to something like SELECT price WHERE timestamp >= TO_DATE(...)
-    # Check if that makes sense due to the loss of trades which are shown then...
+    timeframe: int = int(request.args.get('timeframe', 1))
+    table: str = get_table_name(symbol, timeframe)
+    points: int | None = min(int(request.args.get('points')), postgres_db.config.chart.max_points) if request.args.get('points') else None
+    mode: str = request.args.get('mode', 'lttb')
+    if mode not in MODES:
+        return json.dumps({'error': f'Unknown mode {mode}, choose one of {", ".join(MODES)}'}), 400
+    if request.args.get('format', 'json') not in FORMATS:
+        return json.dumps({'error': f'Unknown format {request.args.get("format")}, choose one of {", ".join(FORMATS)}'}), 400
+    columnar: bool = request.args.get('format') == ENCODING
+    try:
+        start, end, since = parse_time(request.args.get('from')), parse_time(request.args.get('to')), parse_time(request.args.get('since'))
+        trades_since: datetime.datetime | None = parse_time(request.args.get('trades_since')) or since
+    except ValueError as e:
+        return json.dumps({'error': str(e)}), 400
+    if request.args.get('entries'):
+        entries: int = int(request.args.get('entries'))
+    elif start is not None:
+        entries: int = min(int(((end or datetime.datetime.now()) - start).total_seconds() // (60 * timeframe)) + 1, postgres_db.config.chart.max_entries)
+    else:
+        entries: int = postgres_db.config.chart.max_entries
     
     return_trades: bool = eval(request.args.get('return_trades'))
+    trades: pd.DataFrame | None = None
+    timestamps: np.ndarray | None = None
     
-    # TODO Check if this query can be optimized by deleting the ORDER BY statement and then reversing the list
-    query_result: list = postgres_db.execute_read_query(f"SELECT timestamp, close FROM {symbol.lower()} ORDER BY timestamp DESC LIMIT {entries}")
-    dates = [data[0].strftime('%d.%m.%Y %H:%M:%S') for data in query_result]
-    dates.reverse()
-    price_data = [data[1] for data in query_result]
-    price_data.reverse()
-    result: dict = {
-        'symbol': symbol,
-        'dates': dates,
-        'price_data': price_data,
-    }
+    # Long ranges which are downsampled anyway are read from the coarsest aggregated timeframe which still has more
+    # bars than points, the bars after its newest closed bar from the requested timeframe
+    rollup_timeframe: int | None = get_rollup_timeframe(timeframe, entries, points) if since is None else None
+    if rollup_timeframe is not None:
+        prices: pd.DataFrame | None = postgres_db.get_rollup_prices_for_plotting(get_table_name(symbol, rollup_timeframe), math.ceil(entries * timeframe / rollup_timeframe),
+                                                                                  rollup_timeframe, table, start=start, end=end)
+        if prices is not None and not prices.empty:
+            timestamps = prices['timestamp'].to_numpy(dtype='datetime64[ns]')
+            price_data = prices['close'].to_numpy(dtype=np.float64)
+
+    # The shared memory snapshot only contains the newest 1-minute bars
+    use_snapshot: bool = timestamps is None and table == symbol.lower() and start is None and end is None
+    snapshot: tuple | None = snapshots.read(symbol, entries, ['close']) if use_snapshot else None
+    if snapshot is not None:
+        new_bars: np.ndarray = snapshot[0] >= np.datetime64(since) if since is not None else np.ones(len(snapshot[0]), dtype=bool)
+        timestamps = snapshot[0][new_bars].astype('datetime64[ns]')
+        price_data = snapshot[1][new_bars, 0].astype(np.float64)
+    elif timestamps is None and return_trades:
+        # The bars and the trades since the oldest bar (or since the cursor of the client) are read with one query
+        prices_and_trades: tuple | None = postgres_db.get_prices_and_trades_for_plotting(table, entries, int(request.args.get('user')), int(request.args.get('bot_id')),
+                                                                                       start=start, end=end, since=since, trades_after=trades_since)
+        if prices_and_trades is None:
+            return json.dumps({'error': f'The bars of {table} could not be read'}), 500
+        prices, trades = prices_and_trades
+        timestamps = prices['timestamp'].to_numpy(dtype='datetime64[ns]')
+        price_data = prices['close'].to_numpy(dtype=np.float64)
+    elif timestamps is None:
+        conditions, params = postgres_db.get_time_conditions(start, end, since=since)
+        where: str = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        query_result: list | None = postgres_db.execute_read_query(f"SELECT timestamp, close FROM {table}{where} ORDER BY timestamp DESC LIMIT {entries}", params)
+        if query_result is None:
+            return json.dumps({'error': f'The bars of {table} could not be read'}), 500
+        timestamps = np.array([data[0] for data in reversed(query_result)], dtype='datetime64[ns]')
+        price_data = np.array([data[1] for data in reversed(query_result)], dtype=np.float64)
+
+    bar_times: np.ndarray = timestamps.astype('datetime64[s]').astype(np.int64)
+    if return_trades:
+        if trades is None and (len(timestamps) or trades_since is not None):
+            trades = postgres_db.get_trades_for_plotting(int(request.args.get('user')), int(request.args.get('bot_id')),
+                                                         timestamps[0] if trades_since is None else None, columns=['"timestamp"', 'side', 'entry_price'],
+                                                         max_date=end, after=trades_since)
+        if trades is None or trades.empty or not len(timestamps):
+            trades = pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'), 'side': pd.Series(dtype=object), 'entry_price': pd.Series(dtype=float)})
+        # The bars of the trades are kept by the downsampling, the trade times are truncated to seconds like the dates of the bars
+        trade_times: np.ndarray = trades['timestamp'].to_numpy(dtype='datetime64[ns]').astype('datetime64[s]').astype(np.int64)
+        trade_indexes: np.ndarray = align_trades(bar_times, trade_times)
+
+    if points is not None and len(timestamps) > points:
+        # The bars of the trades are always kept, so the markers stay at their exact position
+        selected: np.ndarray = downsample(bar_times, price_data, points, mode, keep=trade_indexes if return_trades else None)
+        timestamps = timestamps[selected]
+        price_data = price_data[selected]
+        bar_times = bar_times[selected]
+        if return_trades:
+            trade_indexes = np.searchsorted(selected, trade_indexes)
+
+    if columnar:
+        result: dict = {'symbol': symbol, **encode_series(timestamps, {'price_data': price_data})}
+    else:
+        result: dict = {
+            'symbol': symbol,
+            'dates': pd.DatetimeIndex(timestamps).strftime('%d.%m.%Y %H:%M:%S').tolist(),
+            'price_data': price_data.tolist(),
+        }
+    # The client passes the cursor as 'since' to receive the newest bar of this response again and the bars after it
+    result['cursor'] = format_cursor(timestamps[-1]) if len(timestamps) else format_cursor(since)
     
     if return_trades:
-        user: int = int(request.args.get('user'))
-        bot_id: int = int(request.args.get('bot_id'))
-        min_date: datetime.datetime = dates[0]
-        
-        trades: pd.DataFrame = postgres_db.get_trades_for_plotting(user, bot_id, min_date)
-        prices: pd.DataFrame = pd.DataFrame()
-        prices['timestamp'] = pd.to_datetime(dates, format='mixed')
-        
-        short_trades_indexes = []
-        long_trades_indexes = []
-
-        short_trade_entry_prices = []
-        long_trade_entry_prices = []
-
-        for _, trade in trades.iterrows():
-            trade_time = trade['timestamp']
-            trade_time: str = datetime.datetime.strftime(trade_time, '%Y-%m-%d %H:%M:%S') 
-            trade_time = pd.to_datetime(trade_time)
-            price_time_diff = (prices['timestamp'] - trade_time).abs()
-            closest_price_index = price_time_diff.idxmin()
-
-            if trade['side'] == 'short':
-                short_trades_indexes.append(closest_price_index)
-                short_trade_entry_prices.append(trade['entry_price'])
-            elif trade['side'] == 'long':
-                long_trades_indexes.append(closest_price_index)
-                long_trade_entry_prices.append(trade['entry_price'])
+        short_trades: np.ndarray = (trades['side'] == 'short').to_numpy()
+        long_trades: np.ndarray = (trades['side'] == 'long').to_numpy()
+        entry_prices: np.ndarray = trades['entry_price'].to_numpy(dtype=np.float64)
+        # The markers are placed at the exact trade times between the returned bars, which are rollup bars for long ranges
+        trade_positions: np.ndarray = position_trades(bar_times, trade_times)
+        encode = encode_array if columnar else (lambda values, dtype: values.tolist())
                 
         additional_trade_info: dict = {
-            'short_trades_indexes': short_trades_indexes,
-            'long_trades_indexes': long_trades_indexes,
-            'short_trade_entry_prices': short_trade_entry_prices,
-            'long_trade_entry_prices': long_trade_entry_prices
+            'short_trades_indexes': encode(trade_indexes[short_trades], 'int32'),
+            'long_trades_indexes': encode(trade_indexes[long_trades], 'int32'),
+            'short_trades_positions': encode(trade_positions[short_trades], 'float64'),
+            'long_trades_positions': encode(trade_positions[long_trades], 'float64'),
+            'short_trade_entry_prices': encode(entry_prices[short_trades], 'float64'),
+            'long_trade_entry_prices': encode(entry_prices[long_trades], 'float64'),
+            'short_trade_times': encode(trade_times[short_trades].astype(np.float64), 'float64'),
+            'long_trade_times': encode(trade_times[long_trades].astype(np.float64), 'float64'),
+            'trade_cursor': format_cursor(trades['timestamp'].max()) if not trades.empty else format_cursor(trades_since)
         }
         
         result.update(additional_trade_info)
@@ -94,24 +380,46 @@ def chart_data() -> dict:
 
 @login_required
 @api.route('/api/get_money_development_data/<int:user>/<int:bot_id>', methods=['GET'])
+@response_cache.cached(lambda user, bot_id: [(TRADE_INSERTED_CHANNEL, f'{user}:{bot_id}')])
 def get_money_development_data(user: int, bot_id: int) -> dict:
-    query: str = f'SELECT timestamp, money FROM trades WHERE "user"={user} AND bot_id={bot_id} ORDER BY timestamp DESC'
-    query_result: pd.DataFrame = postgres_db.execute_read_query(query)
+    """
+    Retrieves the money of a bot after each of its trades.
 
-    dates = [data[0].strftime('%d.%m.%Y %H:%M:%S') for data in query_result]
-    dates.reverse()
-    money_data = [data[1] for data in query_result]
-    money_data.reverse()
+    Parameters:
+    - user (int): The unique identifier of the user who owns the bot.
+    - bot_id (int): The unique identifier of the bot.
+    - from (str, optional): The first trade (inclusive), see parse_time. Defaults to the first trade.
+    - to (str, optional): The last trade (inclusive), see parse_time. Defaults to the newest trade.
+    - since (str, optional): The cursor of a previous response, only trades after it are returned. Defaults to None.
+    - format (str, optional): 'json' or 'columnar' (see infrastructure/columnar_encoding.py). Defaults to 'json'.
 
-    result: dict = {
-        'dates': dates,
-        'money': money_data,
-    }
+    Returns:
+    - dict: A dictionary containing the dates, the money and the cursor of the newest trade.
+    """
+    try:
+        start, end, since = parse_time(request.args.get('from')), parse_time(request.args.get('to')), parse_time(request.args.get('since'))
+    except ValueError as e:
+        return json.dumps({'error': str(e)}), 400
+    if request.args.get('format', 'json') not in FORMATS:
+        return json.dumps({'error': f'Unknown format {request.args.get("format")}, choose one of {", ".join(FORMATS)}'}), 400
+    query_result: list = postgres_db.get_trades_for_plotting(user, bot_id, start, columns=['"timestamp"', 'money'], return_type='list', max_date=end, after=since)
+    query_result.reverse()
+
+    if request.args.get('format') == ENCODING:
+        result: dict = encode_series(np.array([data[0] for data in query_result], dtype='datetime64[ns]'),
+                                     {'money': np.array([data[1] for data in query_result], dtype=np.float64)})
+    else:
+        result: dict = {
+            'dates': [data[0].strftime('%d.%m.%Y %H:%M:%S') for data in query_result],
+            'money': [data[1] for data in query_result],
+        }
+    result['cursor'] = format_cursor(query_result[-1][0]) if query_result else format_cursor(since)
 
     return json.dumps(result)
     
 @login_required
 @api.route('/api/last_price')
+@response_cache.cached(lambda: [(PRICES_READY_CHANNEL, request.args.get('symbol', '').lower())])
 def get_last_price() -> dict:
     """
     Retrieves the last price for a given symbol from a PostgreSQL database.
@@ -124,6 +432,9 @@ def get_last_price() -> dict:
     The JSON string contains the following keys: 'symbol', 'timestamp', and 'price'.
     """
     symbol: str = request.args.get('symbol')
+    tick: tuple | None = snapshots.read_tick(symbol)
+    if tick is not None:
+        return pd.Series({'symbol': symbol, 'timestamp': pd.Timestamp(tick[0]), **dict(zip(TICK_COLUMNS, tick[1].tolist()))}).to_json()
     query_result: pd.DataFrame = postgres_db.execute_read_query(f"SELECT * FROM prices WHERE symbol='{symbol}' ORDER BY timestamp DESC LIMIT 1", return_type="pd.DataFrame")
     query_result = query_result.loc[0]
     return query_result.to_json()
@@ -140,10 +451,11 @@ def get_bot_training_status(user: int, bot_id: int) -> dict:
 
     Returns:
     - dict: A JSON string representing the training status of the bot.
-    The JSON string contains a single key-value pair: 'training', which holds the training status (True or False).
+    The JSON string contains the keys 'training', which holds the training status (True or False), and 'progress',
+    which holds the progress of an external memory training (stage, rows or boosting rounds) or None.
     """
-    query_result: pd.DataFrame = postgres_db.execute_read_query(f'SELECT training FROM bots WHERE "user"={user} AND id={bot_id}', return_type='pd.DataFrame')
-    result = json.dumps({"training": str(query_result['training'].iloc[0])})
+    query_result: pd.DataFrame = postgres_db.execute_read_query(f'SELECT training, training_progress FROM bots WHERE "user"={user} AND id={bot_id}', return_type='pd.DataFrame')
+    result = json.dumps({"training": str(query_result['training'].iloc[0]), "progress": query_result['training_progress'].iloc[0]}, default=str)
     return result
 
 @login_required
@@ -163,6 +475,23 @@ def get_bot_training_error_metrics(user: int, bot_id: int) -> dict:
     result = json.dumps(query_result)
     return result
 
+@login_required
+@api.route('/api/model_versions/<int:user>/<int:bot_id>')
+def get_model_versions(user: int, bot_id: int) -> str:
+    """
+    Retrieves all registered model versions of a specific bot for a given user.
+
+    Parameters:
+    - user (int): The unique identifier of the user.
+    - bot_id (int): The unique identifier of the bot.
+
+    Returns:
+    - str: A JSON string containing a list with one entry per version, newest first. Each entry contains the version,
+    the creation date, the error metrics, the training range, the file size and whether the version is live.
+    """
+    versions: pd.DataFrame = model_registry.list_versions(user, bot_id)
+    return versions.to_json(orient='records', date_format='iso')
+
 @login_required
 @api.route('api/bot_is_running/<int:user>/<int:bot_id>')
 def bot_is_running(user: int, bot_id: int) -> str:
@@ -185,84 +514,25 @@ def bot_is_running(user: int, bot_id: int) -> str:
 
 @login_required
 @api.route('/api/data_for_trades_histogram/<int:user>/<int:bot_id>/<int:number_of_bins>')
+@response_cache.cached(lambda user, bot_id, number_of_bins: [(TRADE_INSERTED_CHANNEL, f'{user}:{bot_id}')])
 def get_data_for_trades_histogram(user: int, bot_id: int, number_of_bins: int) -> dict:
     """
-    Retrieves all trades for a specific bot for a given user from a PostgreSQL database.
+    Retrieves the distribution of the returns of all trades of a specific bot, counted in the database (see
+    Database.get_trade_return_histogram). The response is cached until the next trade of the bot.
 
     Parameters:
     - user (int): The unique identifier of the user. This parameter is used to identify the user in the database.
     - bot_id (int): The unique identifier of the bot. This parameter is used to identify the bot in the database.
+    - number_of_bins (int): The number of bins which span the range of the returns.
 
     Returns:
-    - dict: A JSON string representing all trades for the bot.
+    - dict: A JSON string with the keys 'edges', the bin edges in percent with 0 as an edge, and 'counts', the number
+      of trades per bin.
     """
-    query: str = f'SELECT profit_rel FROM trades WHERE "user"={user} AND "bot_id"={bot_id}'
-    query_result: pd.DataFrame = postgres_db.execute_read_query(query, return_type='pd.DataFrame')
-    query_result['profit_rel'] = query_result['profit_rel'] * 100 # convert to percentage
-
-    min_return: float = float(query_result['profit_rel'].min())
-    max_return: float = float(query_result['profit_rel'].max())
-    bin_width: float = (max_return - min_return) / (number_of_bins - 1)
-
-    bins = []
-
-    # If negative values exist
-    if min_return < 0:
-        # Find the largest multiple of bin_width less than or equal to min_return
-        neg_start = -(-min_return // bin_width) * bin_width  # Equivalent to math.floor for negatives
-        bins.extend([neg_start + bin_width * i for i in range(int(abs(neg_start) // bin_width) + 1)])
-
-    # Add zero as a boundary if the range spans negative to positive
-    if min_return < 0 < max_return:
-        bins.append(0)
-
-    # If positive values exist
-    if max_return > 0:
-        pos_start = 0 if min_return < 0 else min_return  # Start from 0 if range includes negatives
-        bins.extend([pos_start + bin_width * i for i in range(1, int(max_return // bin_width) + 2)])
-
-    # Ensure bins are unique and sorted
-    bins = sorted(set(bins))
-
-    binned_returns: pd.Series = query_result.groupby(pd.cut(query_result['profit_rel'], bins)).size()
+    edges, counts = postgres_db.get_trade_return_histogram(user, bot_id, number_of_bins)
     result: dict = {
-        'bins': format_bin_return(binned_returns),
-        'counts': binned_returns.values.tolist()
+        'edges': edges.tolist(),
+        'counts': counts.tolist()
     }
 
     return json.dumps(result)
-
-def format_bin_return(binned_returns, decimal_places: int = 3):
-    binned_returns_formatted = []
-    for i in range(len(binned_returns)):
-        binned_return = str(binned_returns.keys()[i]).split(',')
-        binned_return = str(binned_return[0]) + '% ' + str(binned_return[1]) + '%'
-        binned_return = binned_return.replace('(','').replace(']','').replace(' ', '')
-        binned_return = binned_return.split('%')
-
-        if binned_return[0].find('e') != -1:
-            binned_return[0] = '0.'
-            for i in range(decimal_places):
-                binned_return[0] += '0'
-        if binned_return[1].find('e') != -1:
-            binned_return[1] = '0.'
-            for i in range(decimal_places):
-                binned_return[1] += '0'
-
-        decimal_splitted = binned_return[0].split('.')
-        if len(decimal_splitted[1]) < decimal_places:
-            for i in range(decimal_places - len(decimal_splitted[1])):
-                decimal_splitted[1] += '0'
-        binned_return[0] = decimal_splitted[0] + '.' + decimal_splitted[1][0:decimal_places]
-        
-
-        decimal_splitted = binned_return[1].split('.')
-        binned_return[1] = decimal_splitted[0] + '.' + decimal_splitted[1][0:decimal_places]
-        if len(decimal_splitted[1]) < decimal_places:
-            for i in range(decimal_places - len(decimal_splitted[1])):
-                decimal_splitted[1] += '0'
-        binned_return[1] = decimal_splitted[0] + '.' + decimal_splitted[1][0:decimal_places]
-
-        binned_return = binned_return[0] +'% - '+ binned_return[1] + '%'
-        binned_returns_formatted.append(binned_return)
-    return binned_returns_formatted
\ No newline at end of file
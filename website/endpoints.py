@@ -6,19 +6,21 @@ from flask import Blueprint, render_template, redirect, flash, request, url_for,
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import re
 import json
-import threading
 import datetime
 import pandas as pd
 
 from website.user import User
 from website.app import db
 from infrastructure.database import Database
-from models.xgboost_model import XGBoostModel
+from infrastructure.indicator_engine import parse_indicator, format_indicator, is_stored
+from models.model_registry import ModelRegistry
 
 endpoint = Blueprint('endpoints', __name__)
 
 postgres_db = Database()
+model_registry = ModelRegistry(postgres_db)
 
 # TODO Include a check if the user who send the request is allowed to execute the method for the requested bot
 # TODO This whole file needs error handling
@@ -70,7 +72,7 @@ def bot_train(bot_id: int):
 
     Returns:
     - render_template: If the request method is 'GET', this function renders the 'bot_train.html' template with the bot's details and technical indicators.
-    - redirect: If the request method is 'POST', this function redirects the user to the bot's detail page after starting the training process in a separate thread.
+    - redirect: If the request method is 'POST', this function redirects the user to the bot's detail page after queuing the training for the training role.
     """
     bot = postgres_db.get_bot_by_id(bot_id)
     if request.method == 'GET':
@@ -86,76 +88,51 @@ def bot_train(bot_id: int):
             data_percentage = float(params['dataPercentage']) / 100
 
         # TODO get model specific data such us batch size and epochs from the request
-        bot_train_thread_args = (
-            current_user.get_id(),
-            bot,
-            start_time,
-            end_time,
-            data_percentage
-        )
-        bot_train_thread = threading.Thread(target=bot_train_execute, args=bot_train_thread_args)    
-        bot_train_thread.start()
+        # The training is run by the training role (see models/retrain_scheduler.py), not by the web worker
+        parameters: dict = {'start_time': start_time.isoformat(), 'end_time': end_time.isoformat(), 'data_percentage': data_percentage}
+        if not postgres_db.enqueue_training_job(current_user.get_id(), bot[0], 'full', parameters):
+            flash('The bot is already being trained.', category='error')
 
         return redirect(f'/bot/{bot[0]}')
 
-
-def bot_train_execute(user: int, bot: list, start_time: datetime.datetime, end_time: datetime.datetime, data_percentage: float) -> None:
+@login_required
+@endpoint.route('/train_incremental/<int:bot_id>', methods=['POST'])
+def bot_train_incremental(bot_id: int):
     """
-    This function is responsible for executing the training process for a specific bot and is called by a separate thread.
-    It checks the bot's model type and performs the necessary actions based on the model.
+    Continues the training of the live model of a bot on the bars which arrived since its last training and
+    stores the retrain interval of the bot. The training is queued for the training role.
 
     Parameters:
-    - user (int): The ID of the user who owns the bot.
-    - bot (list): A list containing information about the bot, including its ID, model type, etc.
-    - start_time (datetime.datetime): The start time for training data.
-    - end_time (datetime.datetime): The end time for training data.
-    - data_percentage (float): The percentage of data to be used for training.
+    - bot_id (int): The unique identifier of the bot to be trained.
 
     Returns:
-    - None: This function does not return any value.
+    - redirect: Redirects the user to the bot's detail page after starting the training process.
     """
-    postgres_db.update_table(
-        table_name='bots',
-        column='training',
-        value=True,
-        where_condition=f'WHERE "user"={user} AND "id"={bot[0]}'
-    )
+    user: int = current_user.get_id()
+    params: dict = request.form.to_dict()
+    retrain_interval: int = int(params['retrainInterval']) if params.get('retrainInterval') else 0
+    postgres_db.update_table('bots', 'retrain_interval', retrain_interval, f"""WHERE "user"={user} AND "id"={bot_id}""")
 
-    postgres_db.update_table(
-        table_name='bots',
-        column='training_set_percentage',
-        value=data_percentage,
-        where_condition=f'WHERE "user"={user} AND "id"={bot[0]}'
-    )
+    if not postgres_db.enqueue_training_job(user, bot_id, 'incremental'):
+        flash('The bot is already being trained.', category='error')
+    return redirect(f'/bot/{bot_id}')
 
-    if bot[7].lower() == 'xgboost':
-        xgbmodel = XGBoostModel()
-        # TODO get hyper parameters from database
-        model = xgbmodel.create_model()
-        model = xgbmodel.train(
-            user=user,
-            model_id=bot[0],
-            model=model,
-            start_date=start_time,
-            end_date=end_time,
-            train_size=data_percentage
-            )
-
-    # Add other model types here
+@login_required
+@endpoint.route('/set_retrain_interval/<int:user>/<int:bot_id>/<int:retrain_interval>', methods=['POST'])
+def set_retrain_interval(user: int, bot_id: int, retrain_interval: int) -> dict:
+    """
+    Updates the interval in which a bot is incrementally retrained.
 
-    postgres_db.update_table(
-        table_name='bots',
-        column='last_trained',
-        value=datetime.datetime.now(),
-        where_condition=f'WHERE "user"={user} AND "id"={bot[0]}'
-    )
+    Parameters:
+    - user (int): The ID of the user who owns the bot.
+    - bot_id (int): The ID of the bot.
+    - retrain_interval (int): The interval in minutes. 0 disables the scheduled retraining.
 
-    postgres_db.update_table(
-        table_name='bots',
-        column='training',
-        value=False,
-        where_condition=f'WHERE "user"={user} AND "id"={bot[0]}'
-    )
+    Returns:
+    - dict: A dictionary containing a single key-value pair, where the key is 'success' and the value is True.
+    """
+    postgres_db.update_table('bots', 'retrain_interval', retrain_interval, f"""WHERE "user"={user} AND "id"={bot_id}""")
+    return {'success': True}
 
 @login_required
 @endpoint.route('/set_stop_loss/<int:user>/<int:bot_id>/<float:stop_loss>', methods=['POST'])
@@ -286,6 +263,46 @@ def get_take_profit(user: int, bot_id: int) -> dict:
     take_profit = query_response.loc[0];
     return take_profit.to_json()
 
+@endpoint.route('/promote_model/<int:user>/<int:bot_id>/<int:version>', methods=['POST'])
+@login_required
+def promote_model(user: int, bot_id: int, version: int) -> dict:
+    """
+    Makes a registered model version the live version of a bot. The prediction loop uses the new version
+    with its next prediction. Only the bots of the logged in user can be changed.
+
+    Parameters:
+    - user (int): The ID of the user who owns the bot, it must be the logged in user.
+    - bot_id (int): The ID of the bot.
+    - version (int): The version which should become live.
+
+    Returns:
+    - dict: A dictionary containing a single key-value pair, where the key is 'success' and the value indicates if the version was promoted,
+      or status code 403 if the bot belongs to another user.
+    """
+    if user != int(current_user.get_id()):
+        return {'success': False, 'error': 'Forbidden'}, 403
+    return {'success': model_registry.promote(int(current_user.get_id()), bot_id, version)}
+
+@endpoint.route('/rollback_model/<int:user>/<int:bot_id>', methods=['POST'])
+@login_required
+def rollback_model(user: int, bot_id: int) -> dict:
+    """
+    Rolls the live model of a bot back to the previously registered version. Only the bots of the logged in user can
+    be changed.
+
+    Parameters:
+    - user (int): The ID of the user who owns the bot, it must be the logged in user.
+    - bot_id (int): The ID of the bot.
+
+    Returns:
+    - dict: A dictionary with the keys 'success' and 'version', where 'version' is the version which is live after the rollback,
+      or status code 403 if the bot belongs to another user.
+    """
+    if user != int(current_user.get_id()):
+        return {'success': False, 'error': 'Forbidden'}, 403
+    version: int | None = model_registry.rollback(int(current_user.get_id()), bot_id)
+    return {'success': version is not None, 'version': version}
+
 @login_required
 @endpoint.route('/bot/<int:bot_id>')
 def bot(bot_id: int) -> render_template:
@@ -308,7 +325,8 @@ def bot(bot_id: int) -> render_template:
     
     bot = postgres_db.get_bot_by_id(bot_id)
     trades = postgres_db.get_trades(current_user.get_id(), bot_id, 50)
-    return render_template('bot.html', user=current_user, bot=bot, trades=trades)
+    stats: pd.DataFrame = postgres_db.get_bot_stats(current_user.get_id(), bot_id)
+    return render_template('bot.html', user=current_user, bot=bot, trades=trades, stats=stats.iloc[0].to_dict() if not stats.empty else None)
 
 
 @login_required
@@ -329,6 +347,7 @@ def bot_delete(bot_id: int) -> redirect:
     - Before deleting the bot, a TODO comment suggests checking if the bot is currently running. This functionality is not implemented in the provided code.
     """
     user: int = current_user.get_id()
+    model_registry.delete_all_versions(user, bot_id)
     postgres_db.delete_bot_by_id(user, bot_id)
     return redirect('/bot_overview')
 
@@ -348,8 +367,8 @@ def bot_overview():
     - render_template: A Flask function that renders a template with the provided arguments.
         - 'bot_overview.html': The name of the template file to render.
         - user: The current user object.
-        - bots: A list of dictionaries, where each dictionary represents a bot owned by the current user.
-            Each bot dictionary contains information such as 'id', 'name', 'symbol', 'timeframe', 'model_type', etc.
+        - bots: A list of dictionaries, where each dictionary represents a bot owned by the current user, newest first.
+            Each bot dictionary contains the state and the performance aggregates of the bot (see Database.get_bots_state).
 
     Note:
     - This function is decorated with @login_required, which ensures that only authenticated users can access this route.
@@ -357,12 +376,12 @@ def bot_overview():
       and renders the 'bot_overview.html' template with the bot details.
     """
     if request.method == 'GET':
-        bots = postgres_db.get_all_bots_by_user(current_user.get_id())
+        # The bots and their performance aggregates are read with the query of /api/bots_state
+        bots: list[dict] = postgres_db.get_bots_state(int(current_user.get_id()), limit=None).iloc[::-1].to_dict('records')
         no_bots_created: bool = False
         if not bots:
             no_bots_created: bool = True
-            bots: list[list[str]] = [['' for _ in range(8)]]
-            bots[0][3] = 'You have not created a bot yet.'
+            bots: list[dict] = [{'id': '', 'name': '', 'symbol': '', 'model_type': '', 'created': 'You have not created a bot yet.', 'trades': None}]
         return render_template('bot_overview.html', user=current_user, bots=bots, no_bots_created=no_bots_created)
 
 
@@ -390,9 +409,25 @@ def bot_creation():
     if request.method == 'POST':
         params: dict = request.form.to_dict()
 
-        technical_indicators: list[str] = [params.get(key) for key in params.keys() if 'technical_indicator' in key]
+        # Every indicator may have parameters, e.g. '7' for the RSI or '20, 2' for the Bollinger Bands. They are
+        # stored as 'rsi:7', indicators with the configured parameters are stored by their name only
+        technical_indicators: list[str] = []
+        for key in params.keys():
+            if not key.startswith('technical_indicator_') or not params.get(key):
+                continue
+            parameters: list[str] = [value for value in re.split(r'[\s,;:]+', params.get(key.replace('technical_indicator_', 'indicator_parameters_'), '')) if value]
+            try:
+                name, parameters = parse_indicator(':'.join([params.get(key)] + parameters), postgres_db.config)
+            except ValueError as e:
+                return render_template('bot_creation.html', user=current_user, error=str(e))
+            technical_indicators.append(name if is_stored(name, parameters, postgres_db.config) else format_indicator(name, parameters))
         technical_indicators: str = ','.join(technical_indicators)
 
+        # Only the 1-minute bars and the aggregated timeframes are stored (see infrastructure/timeframe_aggregator.py)
+        timeframe: int = int(params.get('time_frame'))
+        if timeframe != 1 and timeframe not in postgres_db.config.timeframes.aggregated:
+            return render_template('bot_creation.html', user=current_user, error=f'The time frame {timeframe} is not available')
+
         if params.get('hyperparamCheckbox') != 'on':
             hyper_parameters: dict = {
                 "num_trees" : params.get('num_trees') if params.get('num_trees') else None,
@@ -412,7 +447,7 @@ def bot_creation():
             user=current_user.get_id(),
             name=request.form.get('name'),
             symbol=request.form.get('crypto_currency'),
-            timeframe=int(request.form.get('time_frame')),
+            timeframe=timeframe,
             model_type=request.form.get('ml_model'),
             technical_indicators=technical_indicators,
             hyper_parameters=hyper_parameters,
@@ -0,0 +1,291 @@
+"""
+This python module contains the event bus of a web worker.
+
+The ingestion, the prediction workers and the trainings publish events with Database.notify (PostgreSQL NOTIFY),
+see the channels in infrastructure/database.py. Every web worker process receives them with one listener thread on
+its own connection and dispatches every event in-process:
+- to the callbacks, e.g. the invalidation of the response cache (see website/response_cache.py),
+- to the subscribers, e.g. the Server-Sent Events streams of the browsers (see /api/events in website/api.py).
+An event is prepared once per worker (e.g. the new price is read from the shared memory snapshot) and then put into
+the bounded queue of every subscriber which is interested in it, so an idle stream costs nothing but a blocked thread.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import json
+import time
+import queue
+import select
+import threading
+import pandas as pd
+
+from config.config import load_config
+from infrastructure.database import Database, BARS_READY_CHANNEL, PRICES_READY_CHANNEL, TRADE_INSERTED_CHANNEL, PREDICTION_MADE_CHANNEL, TRAINING_PROGRESS_CHANNEL
+from infrastructure.feature_snapshot import FeatureSnapshotReader, TICK_COLUMNS
+from infrastructure.logger import create_logger
+
+CHANNELS: list[str] = [BARS_READY_CHANNEL, PRICES_READY_CHANNEL, TRADE_INSERTED_CHANNEL, PREDICTION_MADE_CHANNEL, TRAINING_PROGRESS_CHANNEL]
+
+class Subscription:
+    def __init__(self, user: int, symbols: set[str], maxsize: int) -> None:
+        """
+        Initialize the Subscription class, the events of a single stream.
+
+        Parameters:
+        - user (int): The user whose bot events are received.
+        - symbols (set[str]): The lower case symbols whose price and bar events are received.
+        - maxsize (int): The number of events which are queued, the oldest event is dropped if a slow client falls behind.
+
+        Returns:
+        - None
+        """
+        self.user: int = user
+        self.symbols: set[str] = symbols
+        self.events: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.dropped: int = 0
+
+    def matches(self, event: dict) -> bool:
+        """
+        Returns whether an event is delivered to this subscription.
+
+        Parameters:
+        - event (dict): The event as prepared by EventBus.prepare.
+
+        Returns:
+        - bool: True if the event belongs to the user or to one of the symbols.
+        """
+        if event.get('user') is not None:
+            return event['user'] == self.user
+        return event.get('symbol') in self.symbols
+
+    def put(self, event: dict) -> None:
+        """
+        Queues an event, the oldest queued event is dropped if the queue is full.
+
+        Parameters:
+        - event (dict): The event.
+
+        Returns:
+        - None
+        """
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class EventBus:
+    def __init__(self) -> None:
+        """
+        Initialize the EventBus class. The listener thread is started with the first use, so every web worker process
+        listens with its own connection.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.logger = create_logger('event_bus.log')
+        self.snapshots: FeatureSnapshotReader = FeatureSnapshotReader()
+        self.callbacks: list = []
+        self.subscriptions: set[Subscription] = set()
+        self.lock: threading.Lock = threading.Lock()
+        self.listener: threading.Thread | None = None
+        self.connected: bool = False
+
+    def start(self) -> None:
+        """
+        Starts the listener thread if it is not running.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        with self.lock:
+            if self.listener is not None and self.listener.is_alive():
+                return
+            self.listener = threading.Thread(target=self.listen_loop, name='event_bus_listener', daemon=True)
+            self.listener.start()
+
+    def add_callback(self, callback) -> None:
+        """
+        Registers a function which is called with the channel and the payload of every event and with (None, None)
+        if the connection was lost, because events may have been missed.
+
+        Parameters:
+        - callback (callable): The function.
+
+        Returns:
+        - None
+        """
+        self.callbacks.append(callback)
+
+    def listen_loop(self) -> None:
+        """
+        Listens on the event channels and dispatches every event. If the connection is lost the listener reconnects
+        after event_bus.reconnect_seconds.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        while True:
+            try:
+                connection = Database().create_connection()
+                if connection is None:
+                    raise ConnectionError('Could not connect to the database')
+                connection.autocommit = True
+                cursor = connection.cursor()
+                for channel in CHANNELS:
+                    cursor.execute(f'LISTEN {channel}')
+                self.connected = True
+                self.logger.info(f'listen_loop: Listening on {", ".join(CHANNELS)}')
+                while True:
+                    if select.select([connection], [], [], 5.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.dispatch(notification.channel, notification.payload)
+            except Exception as e:
+                self.logger.error(f'listen_loop: Lost the connection: {str(e)}')
+            self.connected = False
+            for callback in self.callbacks:
+                callback(None, None)
+            time.sleep(self.config.event_bus.reconnect_seconds)
+
+    def dispatch(self, channel: str, payload: str) -> None:
+        """
+        Passes an event to all callbacks and to the queues of all matching subscriptions.
+
+        Parameters:
+        - channel (str): The channel of the event.
+        - payload (str): The payload of the event.
+
+        Returns:
+        - None
+        """
+        for callback in self.callbacks:
+            callback(channel, payload)
+        with self.lock:
+            subscriptions: list[Subscription] = list(self.subscriptions)
+        if not subscriptions:
+            return
+        try:
+            event: dict = self.prepare(channel, payload)
+        except Exception as e:
+            self.logger.error(f'dispatch: Could not prepare the event {channel} {payload}: {str(e)}')
+            return
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                subscription.put(event)
+
+    def prepare(self, channel: str, payload: str) -> dict:
+        """
+        Converts the payload of an event into the data which is sent to the browsers.
+
+        Parameters:
+        - channel (str): The channel of the event.
+        - payload (str): The payload of the event.
+
+        Returns:
+        - dict: The event with the keys 'channel', 'user' (None for the events of a symbol), 'symbol' and 'data'.
+        """
+        if channel in (BARS_READY_CHANNEL, PRICES_READY_CHANNEL):
+            data: dict = {'symbol': payload}
+            if channel == PRICES_READY_CHANNEL:
+                tick: tuple | None = self.snapshots.read_tick(payload)
+                if tick is not None:
+                    data.update({'timestamp': pd.Timestamp(tick[0]).isoformat(), **dict(zip(TICK_COLUMNS, tick[1].tolist()))})
+            else:
+                bars: tuple | None = self.snapshots.read(payload, 1, ['close'])
+                if bars is not None and len(bars[0]):
+                    data.update({'timestamp': pd.Timestamp(bars[0][-1]).isoformat(), 'close': float(bars[1][-1, 0])})
+            return {'channel': channel, 'user': None, 'symbol': payload, 'data': data}
+        if channel == TRADE_INSERTED_CHANNEL:
+            user, bot_id = payload.split(':')
+            data = {'user': int(user), 'bot_id': int(bot_id)}
+        else:
+            data = json.loads(payload)
+        return {'channel': channel, 'user': int(data['user']), 'symbol': None, 'data': data}
+
+    def subscribe(self, user: int, symbols: set[str]) -> Subscription | None:
+        """
+        Creates a subscription to the events of a user and of symbols. At most event_bus.max_streams subscriptions
+        are open per web worker process, because every stream blocks one thread of the worker until the client
+        disconnects and the other requests need free threads.
+
+        Parameters:
+        - user (int): The user.
+        - symbols (set[str]): The symbols.
+
+        Returns:
+        - Subscription | None: The subscription, which must be removed with unsubscribe, or None if the maximum number
+          of streams is open.
+        """
+        self.start()
+        subscription: Subscription = Subscription(user, {symbol.lower() for symbol in symbols}, self.config.event_bus.queue_size)
+        with self.lock:
+            if len(self.subscriptions) >= self.config.event_bus.max_streams:
+                self.logger.warning(f'subscribe: Rejected a stream of user {user}, {len(self.subscriptions)} streams are open')
+                return None
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes a subscription.
+
+        Parameters:
+        - subscription (Subscription): The subscription.
+
+        Returns:
+        - None
+        """
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def stream(self, subscription: Subscription):
+        """
+        Yields the events of a subscription in the Server-Sent Events format until the client disconnects. A comment
+        is sent every event_bus.keepalive_seconds, so proxies keep the connection open.
+
+        Parameters:
+        - subscription (Subscription): The subscription.
+
+        Returns:
+        - generator: The lines of the stream.
+        """
+        try:
+            yield f'retry: {int(self.config.event_bus.retry_milliseconds)}\n\n'
+            while True:
+                try:
+                    event: dict = subscription.events.get(timeout=self.config.event_bus.keepalive_seconds)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'event: {event["channel"]}\ndata: {json.dumps(event["data"])}\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+event_bus = EventBus()
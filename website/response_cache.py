@@ -0,0 +1,212 @@
+"""
+This python module contains the response cache of the read APIs of the web application.
+
+The data behind the charts changes at most once per bar, per price update or per trade, so the response of a route
+is cached per path and query parameters until an event invalidates it. The events are published by the ingestion
+and the prediction workers with Database.notify (PostgreSQL NOTIFY) and received by the event bus of every web worker
+(see website/event_bus.py):
+- 'bars_ready' with the symbol, after new bars and their higher timeframes were inserted,
+- 'prices_ready' with the symbol, after a new ticker price was inserted,
+- 'trade_inserted' with '<user>:<bot_id>', after a trade of a bot was inserted.
+Every cached response is tagged with the events which change it. While the event bus is not connected nothing is
+cached, because no invalidation could be received.
+
+Every response carries an ETag, a request whose If-None-Match matches the cached response is answered with 304.
+Large responses are gzip compressed for clients which accept it.
+"""
+import os
+basedir = os.path.abspath(os.path.dirname(__file__)) + os.sep
+basedir_split = basedir.split(os.sep)
+path_to_config = ''
+for part in basedir_split:
+    path_to_config += part + os.sep
+    if part == "ML_Trader":
+        path_to_config += f'{os.sep}config'
+        break
+
+import gzip
+import hashlib
+import functools
+import threading
+import collections
+from flask import request, make_response
+
+from config.config import load_config
+from infrastructure.database import BARS_READY_CHANNEL, PRICES_READY_CHANNEL, TRADE_INSERTED_CHANNEL
+from infrastructure.logger import create_logger
+from website.event_bus import event_bus
+
+CHANNELS: list[str] = [BARS_READY_CHANNEL, PRICES_READY_CHANNEL, TRADE_INSERTED_CHANNEL]
+
+class ResponseCache:
+    def __init__(self) -> None:
+        """
+        Initialize the ResponseCache class. The cache receives the events of the event bus of the web worker.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.config = load_config(f'{path_to_config}{os.sep}config.yaml')
+        self.logger = create_logger('response_cache.log')
+        # {key: {'body', 'status', 'etag', 'tags', 'route'}}, the least recently used entry is the first one
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        # Number of received events per tag, a response is only stored if no event of its tags arrived meanwhile
+        self.generations: collections.Counter = collections.Counter()
+        self.lock: threading.Lock = threading.Lock()
+        self.stats: dict = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0, 'uncached': 0}
+        self.route_stats: collections.defaultdict = collections.defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def on_event(self, channel: str | None, payload: str | None) -> None:
+        """
+        Invalidates the tagged responses of an event of the event bus. If the event bus lost its connection the
+        cache is cleared, because events may have been missed.
+
+        Parameters:
+        - channel (str | None): The channel of the event, None if the connection was lost.
+        - payload (str | None): The payload of the event.
+
+        Returns:
+        - None
+        """
+        if channel is None:
+            self.clear()
+        elif channel in CHANNELS:
+            self.invalidate((channel, payload))
+
+    def invalidate(self, tag: tuple[str, str]) -> int:
+        """
+        Removes all responses which are tagged with an event.
+
+        Parameters:
+        - tag (tuple[str, str]): The channel and the payload of the event.
+
+        Returns:
+        - int: The number of removed responses.
+        """
+        with self.lock:
+            self.generations[tag] += 1
+            keys: list = [key for key, entry in self.entries.items() if tag in entry['tags']]
+            for key in keys:
+                del self.entries[key]
+            self.stats['invalidations'] += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Removes all responses.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Returns the counters of the cache.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dict: The hits, misses, 304 responses, invalidated and uncached responses, the number of entries, whether
+          the event bus is connected and the hits and misses per route.
+        """
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'connected': event_bus.connected,
+                    'routes': {route: dict(counters) for route, counters in self.route_stats.items()}}
+
+    def respond(self, entry: dict):
+        """
+        Creates the response of a cached body, or a 304 response if the client already has it. Bodies of at least
+        response_cache.gzip_min_bytes are gzip compressed if the client accepts it, the compressed body is stored in
+        the entry, so a cached response is only compressed once.
+
+        Parameters:
+        - entry (dict): The body, the status code and the ETag of the body.
+
+        Returns:
+        - flask.Response: The response.
+        """
+        body = entry['body']
+        etag: str = entry['etag']
+        compress: bool = entry['status'] == 200 and len(body) >= self.config.response_cache.gzip_min_bytes and request.accept_encodings['gzip'] > 0
+        if compress:
+            # The compressed body is another representation of the resource and needs its own ETag
+            etag = f'{etag}-gzip'
+        if etag in request.if_none_match:
+            with self.lock:
+                self.stats['not_modified'] += 1
+            response = make_response('', 304)
+        elif compress:
+            if 'gzip' not in entry:
+                entry['gzip'] = gzip.compress(body.encode() if isinstance(body, str) else body, compresslevel=self.config.response_cache.gzip_level)
+            response = make_response(entry['gzip'], entry['status'])
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = make_response(body, entry['status'])
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def cached(self, tags):
+        """
+        Decorates a route whose response is cached until one of its events arrives.
+
+        Parameters:
+        - tags (callable): Returns the events (channel, payload) which change the response, called with the
+          arguments of the route while the request is handled.
+
+        Returns:
+        - callable: The decorator.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.config.response_cache.enabled:
+                    result = function(*args, **kwargs)
+                    body, status = result if isinstance(result, tuple) else (result, 200)
+                    return self.respond({'body': body, 'status': status, 'etag': hashlib.sha1(body.encode() if isinstance(body, str) else body).hexdigest()})
+                event_bus.start()
+                route: str = function.__name__
+                key: tuple = (request.path, tuple(sorted(request.args.items(multi=True))))
+                with self.lock:
+                    entry: dict | None = self.entries.get(key)
+                    if entry is not None:
+                        self.entries.move_to_end(key)
+                        self.stats['hits'] += 1
+                        self.route_stats[route]['hits'] += 1
+                    else:
+                        self.stats['misses'] += 1
+                        self.route_stats[route]['misses'] += 1
+                if entry is not None:
+                    return self.respond(entry)
+
+                entry_tags: set = set(tags(*args, **kwargs))
+                with self.lock:
+                    generations: dict = {tag: self.generations[tag] for tag in entry_tags}
+                result = function(*args, **kwargs)
+                body, status = result if isinstance(result, tuple) else (result, 200)
+                etag: str = hashlib.sha1(body.encode() if isinstance(body, str) else body).hexdigest()
+                entry = {'body': body, 'status': status, 'etag': etag, 'tags': entry_tags}
+                with self.lock:
+                    # The response is only stored if no event changed its data while it was created
+                    if status == 200 and event_bus.connected and all(self.generations[tag] == generation for tag, generation in generations.items()):
+                        self.entries[key] = entry
+                        while len(self.entries) > self.config.response_cache.max_entries:
+                            self.entries.popitem(last=False)
+                    else:
+                        self.stats['uncached'] += 1
+                return self.respond(entry)
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
+event_bus.add_callback(response_cache.on_event)
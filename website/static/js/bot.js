@@ -10,10 +10,41 @@ function scrollToTop() {
     window.scrollTo({ top: 0, behavior: 'smooth' });
 }
 
-function checkTrainingStatus(user, bot_id) {
+function formatTrainingProgress(progress) {
+    // Progress is only reported by queued trainings and by trainings which use external memory
+    if (!progress || !progress['stage'] || progress['stage'] === 'finished') {
+        return '';
+    }
+    if (progress['stage'] === 'queued') {
+        return ' (queued)';
+    }
+    if (progress['stage'] === 'training') {
+        return ' (training: round ' + progress['round'] + ' / ' + progress['total_rounds'] + ')';
+    }
+    if (progress['total_rows']) {
+        return ' (' + progress['stage'] + ': ' + progress['rows'] + ' / ' + progress['total_rows'] + ' rows)';
+    }
+    return ' (' + progress['stage'] + ': ' + progress['rows'] + ' rows)';
+}
+
+function checkTrainingStatus(user, bot_id, events = null) {
     const url = '/api/bot_training_status/' + user + '/' + bot_id;
     const trainingStatusValue = document.getElementById('training-status-value');
     const loadingAnimation = document.getElementById('loading-animation');
+    let intervalId = null;
+
+    // Function to show the training status, returns true if the training is finished
+    function showStatus(training, progress) {
+        if (training) {
+            trainingStatusValue.textContent = 'True' + formatTrainingProgress(progress);
+            loadingAnimation.style.visibility = 'visible';
+            return false;
+        }
+        trainingStatusValue.textContent = 'False';
+        loadingAnimation.style.visibility = 'hidden';
+        checkLastTrained(user, bot_id)
+        return true;
+    }
 
     // Function to check the training status
     function fetchStatus() {
@@ -22,14 +53,7 @@ function checkTrainingStatus(user, bot_id) {
             method: 'GET',
             success: function(data) {
                 data = $.parseJSON(data);
-                console.log(data); // For debugging purposes
-                if (data['training'] === "True") {
-                    trainingStatusValue.textContent = 'True';
-                    loadingAnimation.style.visibility = 'visible';
-                } else {
-                    trainingStatusValue.textContent = 'False';
-                    loadingAnimation.style.visibility = 'hidden';
-                    checkLastTrained(user, bot_id)
+                if (showStatus(data['training'] === "True", data['progress']) && intervalId !== null) {
                     clearInterval(intervalId); // Stop the interval
                 }
             },
@@ -39,8 +63,23 @@ function checkTrainingStatus(user, bot_id) {
         });
     }
 
-    // Set the interval to call fetchStatus every second
-    const intervalId = setInterval(fetchStatus, 1000);
+    fetchStatus();
+    if (events) {
+        // The status is pushed by the server whenever the training of the bot starts, progresses or finishes
+        events.addEventListener('training_progress', function(event) {
+            const data = JSON.parse(event.data);
+            if (String(data['bot_id']) === String(bot_id)) {
+                showStatus(data['training'], data['progress']);
+            }
+        });
+        // The status is polled if the server rejected the stream
+        on_event_stream_closed(events, function() {
+            intervalId = setInterval(fetchStatus, 1000);
+        });
+    } else {
+        // Set the interval to call fetchStatus every second if the browser does not support Server-Sent Events
+        intervalId = setInterval(fetchStatus, 1000);
+    }
 }
 
 function checkLastTrained(user, bot_id){
@@ -95,33 +134,60 @@ function getErrorMetrics(user, bot_id) {
     });
 }
 
-function checkBotRunning(user, bot_id){
+function showBotRunning(running) {
     const button = document.getElementById('startStopBot');
-    var bot_running;
-    const url = '/api/bot_is_running/' + user + '/' + bot_id;
+    if (running) {
+        button.textContent = 'Stop Bot';
+        button.style.backgroundColor = '#DC3545';
+    } else {
+        button.textContent = 'Start Bot';
+        button.style.backgroundColor = '#4BC0C0';
+    }
+}
+
+function showRiskPrices(prefix, currentPrice) {
+    // Shows the prices at which the stop loss ('stopLoss') or take profit ('takeProfit') of the input triggers
+    const input = document.getElementById(prefix + 'Input').value;
+    const priceElementShort = document.getElementById(prefix + 'PriceShort');
+    const priceElementLong = document.getElementById(prefix + 'PriceLong');
+    if (!input || isNaN(currentPrice)) {
+        priceElementShort.textContent = 'Price short trades: --';
+        priceElementLong.textContent = 'Price long trades: --';
+        return;
+    }
+    const percentage = parseFloat(input);
+    priceElementShort.textContent = `Price short trades: ${(currentPrice + (currentPrice * percentage / 100)).toFixed(2)}`;
+    priceElementLong.textContent = `Price long trades: ${(currentPrice - (currentPrice * percentage / 100)).toFixed(2)}`;
+}
+
+function initializeBotState(user, bot_id, symbol) {
+    // Reads the status, the risk settings and the latest price of the bot with one request instead of one per setting
     $.ajax({
-        url: url,
+        url: '/api/bots_state',
         type: 'GET',
         data: {
-            user: user,
-            bot_id: bot_id
+            bot_id: bot_id,
+            limit: 1
         },
         success: function(response) {
             response = $.parseJSON(response);
-            bot_running = response['running'];
-
-            if (bot_running === 'True') {
-                button.textContent = 'Stop Bot';
-                button.style.backgroundColor = '#DC3545';
-            } else {
-                button.textContent = 'Start Bot';
-                button.style.backgroundColor = '#4BC0C0';
+            const bot = response['bots'][0];
+            if (!bot) {
+                return;
             }
+            const price = response['prices'][symbol.toUpperCase()];
+            const currentPrice = price ? parseFloat(price['last_price']) : NaN;
+            showBotRunning(bot['running'] === true);
+            document.getElementById('trailingStopLoss').checked = bot['stop_loss_trailing'] === true;
+            document.getElementById('stopLossInput').value = parseFloat(bot['stop_loss'] * 100);
+            document.getElementById('takeProfitInput').value = parseFloat(bot['take_profit'] * 100);
+            showRiskPrices('stopLoss', currentPrice);
+            showRiskPrices('takeProfit', currentPrice);
         },
         error: function(xhr, status, error) {
-            console.error('Error checking if bot is running:', error);
+            console.error('Error getting the state of the bot:', error);
         }
-    })
+    });
 }
 
 function toggleBot(user, bot_id) {
@@ -156,30 +222,6 @@ function toggleBot(user, bot_id) {
     })
 }
 
-function initialilzeTrailingStopLoss(user, bot_id){
-    var trailingStopLossElement = document.getElementById('trailingStopLoss');
-
-    $.ajax({
-        url: '/get_trailing/' + user + '/' +bot_id,
-        type: 'GET',
-        data: {
-            user: user,
-            bot_id: bot_id
-        } ,
-        success: function(response) {
-            response = $.parseJSON(response);
-            if(response['stop_loss_trailing'] == true){
-                trailingStopLossElement.checked = true;
-            }else{
-                trailingStopLossElement.checked = false;
-            }
-        },
-        error: function(xhr, status, error) {
-            console.error('Error getting the status for the stop loss trailing checkbox: ', error);
-        }
-    });
-}
-
 function updateTrailingStopLoss(user, bot_id){
     var trailingStopLossElement = document.getElementById('trailingStopLoss');
 
@@ -207,12 +249,7 @@ function updateTrailingStopLoss(user, bot_id){
     });
 }
 
-function updateStopLossPrice(user, bot_id, symbol, first) {
-    var stopLossInput; // = document.getElementById('stopLossInput').value;
-    var stopLossPriceElementShort = document.getElementById('stopLossPriceShort');
-    var stopLossPriceElementLong = document.getElementById('stopLossPriceLong');
-    var currentPrice;
-
+function updateStopLossPrice(user, bot_id, symbol) {
     const url = '/api/last_price';
     $.ajax({
         url: url,
@@ -222,40 +259,11 @@ function updateStopLossPrice(user, bot_id, symbol, first) {
         },
         success: function(response) {
             response = $.parseJSON(response);
-            currentPrice = parseFloat(response['last_price']);
-            if(first){
-                $.ajax({
-                    url: '/get_stop_loss/' + user + '/' + bot_id,
-                    type: 'GET',
-                    data: {
-                        user: user,
-                        bot_id: bot_id
-                    },
-                    success: function(response) {
-                        response = $.parseJSON(response);
-                        document.getElementById('stopLossInput').value = parseFloat(response['stop_loss'] * 100);
-                        stopLossInput = document.getElementById('stopLossInput').value;
-                        const stopLossPercentage = parseFloat(stopLossInput);
-                        const stopLossPriceShort = currentPrice + (currentPrice * stopLossPercentage / 100);
-                        const stopLossPriceLong = currentPrice - (currentPrice * stopLossPercentage / 100);
-                        stopLossPriceElementShort.textContent = `Price short trades: ${stopLossPriceShort.toFixed(2)}`;
-                        stopLossPriceElementLong.textContent = `Price long trades: ${stopLossPriceLong.toFixed(2)}`;
-                        console.log('On load stop loss: ' + parseFloat(response['stop_loss'] * 100));
-                    },
-                    error: function(xhr, status, error) {
-                        console.error('Error looking up stop loss value:', error);
-                    }
-                });
-                return;
-            }
+            showRiskPrices('stopLoss', parseFloat(response['last_price']));
 
-            stopLossInput = document.getElementById('stopLossInput').value;
+            const stopLossInput = document.getElementById('stopLossInput').value;
             if (stopLossInput) {
                 const stopLossPercentage = parseFloat(stopLossInput);
-                const stopLossPriceShort = currentPrice + (currentPrice * stopLossPercentage / 100);
-                const stopLossPriceLong = currentPrice - (currentPrice * stopLossPercentage / 100);
-                stopLossPriceElementShort.textContent = `Price short trades: ${stopLossPriceShort.toFixed(2)}`;
-                stopLossPriceElementLong.textContent = `Price long trades: ${stopLossPriceLong.toFixed(2)}`;
 
                 // Update the stop loss value within the database
                 const update_stop_loss_url = '/set_stop_loss/' + user + '/' + bot_id + '/' + stopLossPercentage / 100;
@@ -275,9 +283,6 @@ function updateStopLossPrice(user, bot_id, symbol, first) {
                         console.error(update_stop_loss_url);
                     }
                 })
-            } else {
-                stopLossPriceElementShort.textContent = 'Price short trades: --';
-                stopLossPriceElementLong.textContent = 'Price long trades: --';
             }
         },
         error: function(xhr, status, error) {
@@ -286,12 +291,7 @@ function updateStopLossPrice(user, bot_id, symbol, first) {
     })
 }
 
-function updateTakeProfitPrice(user, bot_id, symbol, first) {
-    var takeProfitInput; // = document.getElementById('takeProfitInput').value;
-    var takeProfitPriceElementShort = document.getElementById('takeProfitPriceShort');
-    var takeProfitPriceElementLong = document.getElementById('takeProfitPriceLong');
-    var currentPrice;
-
+function updateTakeProfitPrice(user, bot_id, symbol) {
     const url = '/api/last_price';
     $.ajax({
         url: url,
@@ -301,42 +301,13 @@ function updateTakeProfitPrice(user, bot_id, symbol, first) {
         },
         success: function(response) {
             response = $.parseJSON(response);
-            currentPrice = parseFloat(response['last_price']);
-            if(first){
-                $.ajax({
-                    url: '/get_take_profit/' + user + '/' + bot_id,
-                    type: 'GET',
-                    data: {
-                        user: user,
-                        bot_id: bot_id
-                    },
-                    success: function(response) {
-                        response = $.parseJSON(response);
-                        document.getElementById('takeProfitInput').value = parseFloat(response['take_profit'] * 100);
-                        takeProfitInput = document.getElementById('takeProfitInput').value;
-                        const takeProfitPercentage = parseFloat(takeProfitInput);
-                        const takeProfitPriceShort = currentPrice + (currentPrice * takeProfitPercentage / 100);
-                        const takeProfitPriceLong = currentPrice - (currentPrice * takeProfitPercentage / 100);
-                        takeProfitPriceElementShort.textContent = `Price short trades: ${takeProfitPriceShort.toFixed(2)}`;
-                        takeProfitPriceElementLong.textContent = `Price long trades: ${takeProfitPriceLong.toFixed(2)}`;
-                        console.log('On load stop loss: ' + parseFloat(response['take_profit'] * 100));
-                    },
-                    error: function(xhr, status, error) {
-                        console.error('Error looking up stop loss value:', error);
-                    }
-                });
-                return;
-            }
+            showRiskPrices('takeProfit', parseFloat(response['last_price']));
 
-            takeProfitInput = document.getElementById('takeProfitInput').value;
+            const takeProfitInput = document.getElementById('takeProfitInput').value;
             if (takeProfitInput) {
                 const takeProfitPercentage = parseFloat(takeProfitInput);
-                const takeProfitPriceShort = currentPrice + (currentPrice * takeProfitPercentage / 100);
-                const takeProfitPriceLong = currentPrice - (currentPrice * takeProfitPercentage / 100);
-                takeProfitPriceElementShort.textContent = `Price short trades: ${takeProfitPriceShort.toFixed(2)}`;
-                takeProfitPriceElementLong.textContent = `Price long trades: ${takeProfitPriceLong.toFixed(2)}`;
 
-                // Update the stop loss value within the database
+                // Update the take profit value within the database
                 const update_take_profit_url = '/set_take_profit/' + user + '/' + bot_id + '/' + takeProfitPercentage / 100;
                 $.ajax({
                     url: update_take_profit_url,
@@ -347,16 +318,13 @@ function updateTakeProfitPrice(user, bot_id, symbol, first) {
                         take_profit: takeProfitPercentage / 100
                     },
                     success: function(response) {
-                        console.log('Stop loss value updated successfully:', response);
+                        console.log('Take profit value updated successfully:', response);
                     },
                     error: function(xhr, status, error) {
-                        console.error('Error updating stop loss value:', error);
+                        console.error('Error updating take profit value:', error);
                         console.error(update_take_profit_url);
                     }
                 })
-            } else {
-                takeProfitPriceElementShort.textContent = 'Price short trades: --';
-                takeProfitPriceElementLong.textContent = 'Price long trades: --';
             }
         },
         error: function(xhr, status, error) {
@@ -8,7 +8,18 @@ document.addEventListener('DOMContentLoaded', function () {
         xgboost: ['num_trees', 'max_depth', 'learning_rate', 'gamma', 'colsample_bytree'],
     };
 
-    const options = ['Moving Average', 'Exponential Moving Average', 'Moving Standard Deviation', 'MACD', 'RSI', 'Momentum', 'Periodic Lows', 'Periodic Highs', 'Bollinger Bands'];
+    const options = ['moving_average', 'exponential_moving_average', 'moving_std', 'macd', 'rsi', 'momentum', 'periodic_lows', 'periodic_highs', 'bollinger_bands'];
+    const optionLabels = {
+        moving_average: 'Moving Average',
+        exponential_moving_average: 'Exponential Moving Average',
+        moving_std: 'Moving Standard Deviation',
+        macd: 'MACD',
+        rsi: 'RSI',
+        momentum: 'Momentum',
+        periodic_lows: 'Periodic Lows',
+        periodic_highs: 'Periodic Highs',
+        bollinger_bands: 'Bollinger Bands',
+    };
     let dropdownCount = 0;
 
     hyperparamCheckbox.addEventListener('change', function () {
@@ -52,10 +63,16 @@ document.addEventListener('DOMContentLoaded', function () {
             availableOptions.forEach(option => {
                 const newOption = document.createElement('option');
                 newOption.value = option;
-                newOption.textContent = option;
+                newOption.textContent = optionLabels[option];
                 select.appendChild(newOption);
             });
 
+            const parametersInput = document.createElement('input');
+            parametersInput.type = 'text';
+            parametersInput.className = 'form-control';
+            parametersInput.name = `indicator_parameters_${dropdownCount}`;
+            parametersInput.placeholder = 'Parameters (optional)';
+
             const deleteButton = document.createElement('button');
             deleteButton.type = 'button';
             deleteButton.className = 'delete_btn';
@@ -67,6 +84,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
             formGroup.appendChild(label);
             formGroup.appendChild(select);
+            formGroup.appendChild(parametersInput);
             formGroup.appendChild(deleteButton);
             document.getElementById('technicalIndicatorsSection').insertBefore(formGroup, button);
         }
@@ -90,7 +108,7 @@ document.addEventListener('DOMContentLoaded', function () {
             availableOptions.forEach(option => {
                 const newOption = document.createElement('option');
                 newOption.value = option;
-                newOption.textContent = option;
+                newOption.textContent = optionLabels[option];
                 newOption.selected = option === currentValue;
                 select.appendChild(newOption);
             });
@@ -1,4 +1,93 @@
-function fetch_chart_data(symbol, entries, return_trades, user, bot_id, ctx) {
+// Typed arrays of the dtypes of infrastructure/columnar_encoding.py
+const COLUMNAR_DTYPES = {'float64': Float64Array, 'float32': Float32Array, 'int32': Int32Array, 'uint32': Uint32Array};
+
+function decode_array(encoded) {
+    // Reads the base64 encoded little-endian bytes of an array into a typed array
+    const binary = atob(encoded['data']);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new COLUMNAR_DTYPES[encoded['dtype']](bytes.buffer);
+}
+
+function format_date(seconds) {
+    // Formats epoch seconds like the server formats the dates of the 'json' format ('%d.%m.%Y %H:%M:%S')
+    const date = new Date(seconds * 1000);
+    const pad = (value) => String(value).padStart(2, '0');
+    return pad(date.getUTCDate()) + '.' + pad(date.getUTCMonth() + 1) + '.' + date.getUTCFullYear() + ' ' +
+        pad(date.getUTCHours()) + ':' + pad(date.getUTCMinutes()) + ':' + pad(date.getUTCSeconds());
+}
+
+function decode_columnar(response) {
+    // Decodes a response of the 'columnar' format into the keys of the 'json' format: 'dates', every column and
+    // every other encoded array as plain arrays which Chart.js can use as labels and data
+    if (response['encoding'] !== 'columnar') {
+        return response;
+    }
+    const time = response['time'];
+    const deltas = time['deltas'] ? decode_array(time['deltas']) : null;
+    const dates = new Array(time['count']);
+    let seconds = time['start'];
+    for (let i = 0; i < time['count']; i++) {
+        seconds = deltas ? seconds + deltas[i] : time['start'] + i * time['step'];
+        dates[i] = format_date(seconds);
+    }
+    const decoded = {'dates': dates};
+    for (const [key, value] of Object.entries(response)) {
+        if (key === 'columns') {
+            for (const [name, column] of Object.entries(value)) {
+                decoded[name] = Array.from(decode_array(column));
+            }
+        } else if (value !== null && typeof value === 'object' && 'dtype' in value) {
+            decoded[key] = Array.from(decode_array(value));
+        } else if (key !== 'time' && key !== 'encoding') {
+            decoded[key] = value;
+        }
+    }
+    return decoded;
+}
+
+// Draws the trade markers of a chart at their fractional position between the bars and at their entry price, the
+// positions are computed by position_trades in website/api.py
+const tradeMarkersPlugin = {
+    id: 'tradeMarkers',
+    afterDatasetsDraw(chart) {
+        if (!chart.trade_markers) {
+            return;
+        }
+        const {ctx, chartArea, scales: {x, y}} = chart;
+        ctx.save();
+        chart.trade_markers.forEach((marker) => {
+            const px = x.getPixelForValue(marker.position);
+            const py = y.getPixelForValue(marker.price);
+            if (px < chartArea.left || px > chartArea.right || py < chartArea.top || py > chartArea.bottom) {
+                return;
+            }
+            ctx.beginPath();
+            ctx.arc(px, py, 5, 0, 2 * Math.PI);
+            ctx.fillStyle = marker.color;
+            ctx.fill();
+        });
+        ctx.restore();
+    }
+};
+
+function build_trade_markers(response, offset = 0) {
+    // Returns the trade markers of a response, the positions are shifted by the number of bars before the response
+    const markers = [];
+    response['long_trades_positions'].forEach((position, i) => {
+        markers.push({position: offset + position, price: response['long_trade_entry_prices'][i], time: response['long_trade_times'][i],
+                      side: 'Long Position', color: '#00FF00'});
+    });
+    response['short_trades_positions'].forEach((position, i) => {
+        markers.push({position: offset + position, price: response['short_trade_entry_prices'][i], time: response['short_trade_times'][i],
+                      side: 'Short Position', color: '#FF0000'});
+    });
+    return markers;
+}
+
+function fetch_chart_data(symbol, entries, return_trades, user, bot_id, ctx, timeframe = 1, points = '') {
     $.ajax({
         url: '/api/chart_data',
         type: 'GET',
@@ -7,20 +96,20 @@ function fetch_chart_data(symbol, entries, return_trades, user, bot_id, ctx) {
             entries: entries,
             return_trades: return_trades,
             user: user,
-            bot_id: bot_id
+            bot_id: bot_id,
+            timeframe: timeframe,
+            points: points,
+            format: 'columnar'
         },
         success: function(response) {
-            response = $.parseJSON(response)
+            response = decode_columnar($.parseJSON(response))
             if (return_trades == 'True'){
                 lineGraph = createLineGraphWithTrades(
                     ctx,
                     response['dates'], // Labels
                     response['price_data'], // Data
                     response['symbol'], // Label 
-                    response['short_trades_indexes'],
-                    response['long_trades_indexes'],
-                    response['short_trade_entry_prices'],
-                    response['long_trade_entry_prices'],
+                    build_trade_markers(response),
                     'rgba(75, 192, 192, 1)', // Line color
                     'rgba(75, 192, 192, 0.2)', // Fill color
                     'Time', // X-axis title
@@ -38,6 +127,9 @@ function fetch_chart_data(symbol, entries, return_trades, user, bot_id, ctx) {
                     'Price in USD' // Y-axis title
                 );
             }
+            // The cursors are passed with the next update, so only new bars and trades are fetched
+            lineGraph.cursor = response['cursor'];
+            lineGraph.trade_cursor = response['trade_cursor'];
 
             return lineGraph;
         },
@@ -47,16 +139,109 @@ function fetch_chart_data(symbol, entries, return_trades, user, bot_id, ctx) {
     })
 }
 
+function append_chart_data(chart, symbol, return_trades, user, bot_id, timeframe = 1) {
+    // Appends the bars and trades after the cursors of the chart and removes as many of the oldest bars. The bar of
+    // the cursor is returned again by the server and replaces the bar with the same timestamp. Only one request per
+    // chart is in flight, events which arrive meanwhile fetch once more after it with the updated cursors
+    if (!chart || !chart.cursor) {
+        return;
+    }
+    if (chart.appending) {
+        chart.append_pending = true;
+        return;
+    }
+    chart.appending = true;
+    $.ajax({
+        url: '/api/chart_data',
+        type: 'GET',
+        data: {
+            symbol: symbol,
+            entries: chart.data.labels.length,
+            return_trades: return_trades,
+            user: user,
+            bot_id: bot_id,
+            timeframe: timeframe,
+            since: chart.cursor,
+            trades_since: chart.trade_cursor || chart.cursor,
+            format: 'columnar'
+        },
+        success: function(response) {
+            response = decode_columnar($.parseJSON(response))
+            const dataset = chart.data.datasets[0];
+            let removed = 0;
+            response['dates'].forEach((date, index) => {
+                const existing = chart.data.labels.lastIndexOf(date);
+                if (existing !== -1) {
+                    dataset.data[existing] = response['price_data'][index];
+                    return;
+                }
+                chart.data.labels.push(date);
+                dataset.data.push(response['price_data'][index]);
+                removed++;
+            });
+            if (chart.trade_markers && return_trades == 'True') {
+                // The positions of the trades are relative to the first bar of the response, trades which are shown
+                // already are skipped by their time and side
+                const offset = response['dates'].length ? chart.data.labels.lastIndexOf(response['dates'][0]) : chart.data.labels.length - 1;
+                const shown = new Set(chart.trade_markers.map((marker) => marker.side + marker.time));
+                chart.trade_markers.push(...build_trade_markers(response, offset).filter((marker) => !shown.has(marker.side + marker.time)));
+            }
+            chart.data.labels.splice(0, removed);
+            dataset.data.splice(0, removed);
+            if (chart.trade_markers) {
+                chart.trade_markers = chart.trade_markers
+                    .map((marker) => ({...marker, position: marker.position - removed}))
+                    .filter((marker) => marker.position >= 0);
+            }
+            chart.cursor = response['cursor'] || chart.cursor;
+            chart.trade_cursor = response['trade_cursor'] || chart.trade_cursor;
+            chart.update();
+        },
+        error: function(xhr, status, error) {
+            console.error('Error appending chart data:', error);
+        },
+        complete: function() {
+            chart.appending = false;
+            if (chart.append_pending) {
+                chart.append_pending = false;
+                append_chart_data(chart, symbol, return_trades, user, bot_id, timeframe);
+            }
+        }
+    })
+}
+
+function open_event_stream(symbols) {
+    // Opens the Server-Sent Events stream of the logged in user, which pushes the prices and bars of the symbols and
+    // the predictions, trades and training progress of the bots. Returns null if the browser does not support it.
+    if (typeof EventSource === 'undefined') {
+        return null;
+    }
+    return new EventSource('/api/events?symbols=' + encodeURIComponent(symbols.join(',')));
+}
+
+function on_event_stream_closed(events, callback) {
+    // Calls the callback once if the browser gives up the stream, e.g. if the server rejected it with 503 because the
+    // maximum number of streams is open, so the page can poll instead
+    let closed = false;
+    events.addEventListener('error', function() {
+        if (!closed && events.readyState === EventSource.CLOSED) {
+            closed = true;
+            callback();
+        }
+    });
+}
+
 function fetch_money_development_chart_data(user, bot_id, ctx){
     $.ajax({
         url: '/api/get_money_development_data/' + user + '/' + bot_id,
         type: 'GET',
         data: {
             user: user,
-            bot_id: bot_id
+            bot_id: bot_id,
+            format: 'columnar'
         },
         success: function(response) {
-            response = $.parseJSON(response);
+            response = decode_columnar($.parseJSON(response));
             console.log(response);
             console.log('RESPONSE DATES: ' + response['dates']);
             console.log('RESPONSE MONEY: ' + response['money']);
@@ -80,22 +265,8 @@ function fetch_money_development_chart_data(user, bot_id, ctx){
 
 }
 
-function createLineGraphWithTrades(ctx, labels, data, label, shortPositions, longPositions, shortPrices, longPrices, borderColor, backgroundColor, xAxisTitle, yAxisTitle) {
-    const positionInfo = new Array(data.length).fill('');
-    const priceInfo = new Array(data.length).fill('');
-    
-    // Populate positionInfo and priceInfo arrays
-    longPositions.forEach((index, i) => {
-        positionInfo[index] = 'Long Position';
-        priceInfo[index] = longPrices[i]; // Match the price for the long position
-    });
-    
-    shortPositions.forEach((index, i) => {
-        positionInfo[index] = 'Short Position';
-        priceInfo[index] = shortPrices[i]; // Match the price for the short position
-    });
-    
-    return new Chart(ctx, {
+function createLineGraphWithTrades(ctx, labels, data, label, tradeMarkers, borderColor, backgroundColor, xAxisTitle, yAxisTitle) {
+    const chart = new Chart(ctx, {
         type: 'line',
         data: {
             labels: labels,
@@ -105,20 +276,7 @@ function createLineGraphWithTrades(ctx, labels, data, label, shortPositions, lon
                 borderColor: borderColor,
                 backgroundColor: backgroundColor,
                 fill: true,
-                pointRadius: data.map((_, index) => {
-                    if (longPositions.includes(index) || shortPositions.includes(index)) {
-                        return 5;
-                    }
-                    return 0;
-                }),
-                pointBackgroundColor: data.map((_, index) => {
-                    if (longPositions.includes(index)) {
-                        return '#00FF00';
-                    } else if (shortPositions.includes(index)) {
-                        return '#FF0000';
-                    }
-                    return 'transparent';
-                }),
+                pointRadius: 0,
                 pointStyle: 'circle',
             }]
         },
@@ -152,10 +310,13 @@ function createLineGraphWithTrades(ctx, labels, data, label, shortPositions, lon
                 tooltip: {
                     callbacks: {
                         label: function(context) {
+                            // The trades whose nearest bar is the hovered bar are listed with their entry price
                             const label = context.dataset.label || '';
-                            const value = priceInfo[context.dataIndex];
-                            const position = positionInfo[context.dataIndex];
-                            return `${label}: $${value} (${position})`;
+                            const trades = (context.chart.trade_markers || []).filter((marker) => Math.round(marker.position) === context.dataIndex);
+                            if (!trades.length) {
+                                return `${label}: $${context.parsed.y}`;
+                            }
+                            return trades.map((marker) => `${label}: $${marker.price} (${marker.side})`);
                         }
                     }
                 },
@@ -167,8 +328,12 @@ function createLineGraphWithTrades(ctx, labels, data, label, shortPositions, lon
                     }
                 }
             }
-        }
+        },
+        plugins: [tradeMarkersPlugin]
     });
+    chart.trade_markers = tradeMarkers;
+    chart.update('none');
+    return chart;
 }
 
 function createLineGraph(ctx, labels, data, label, borderColor, backgroundColor, xAxisTitle, yAxisTitle) {
@@ -272,7 +437,9 @@ function createHistogramChart(user, bot_id){
         },
         success: function(response) {
             data = $.parseJSON(response);
-            let bins = data['bins'];
+            // The labels are formatted from the numeric bin edges, e.g. '-0.500% - 0.000%'
+            let edges = data['edges'];
+            let bins = data['counts'].map((count, i) => edges[i].toFixed(3) + '% - ' + edges[i + 1].toFixed(3) + '%');
             let counts = data['counts'];
 
             chart = new Chart(ctx, {
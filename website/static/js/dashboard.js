@@ -6,3 +6,45 @@ function toggleSidebar() {
     sidebarDots.classList.toggle('rotate-90');
 }
 
+
+// Keyset of the next page of /api/bots_state, null before the first page is loaded
+var bots_next_after = null;
+
+function format_percentage(value, decimals) {
+    return value === null || value === undefined ? '' : (value * 100).toFixed(decimals) + '%';
+}
+
+function load_bots_state() {
+    // Appends the next page of the bots of the user with their latest prices and performance to the bots table
+    $.ajax({
+        url: '/api/bots_state',
+        type: 'GET',
+        data: bots_next_after === null ? {} : {after: bots_next_after},
+        success: function(response) {
+            response = $.parseJSON(response);
+            const table = document.getElementById('bots_table');
+            response['bots'].forEach((bot) => {
+                const price = response['prices'][String(bot['symbol']).toUpperCase()];
+                const row = table.insertRow();
+                const link = document.createElement('a');
+                link.href = '/bot/' + bot['id'];
+                link.textContent = bot['name'];
+                row.insertCell().appendChild(link);
+                [
+                    bot['symbol'],
+                    bot['running'] ? 'True' : 'False',
+                    bot['position'] || '',
+                    price ? price['last_price'] : '',
+                    bot['trades'] === null ? 0 : bot['trades'],
+                    format_percentage(bot['win_rate'], 1),
+                    format_percentage(bot['cumulative_return'], 2)
+                ].forEach((value) => { row.insertCell().textContent = value; });
+            });
+            bots_next_after = response['next_after'];
+            document.getElementById('load_more_bots').style.display = bots_next_after === null ? 'none' : 'inline-block';
+        },
+        error: function(xhr, status, error) {
+            console.error('Error fetching the state of the bots:', error);
+        }
+    });
+}
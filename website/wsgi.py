@@ -0,0 +1,7 @@
+"""
+WSGI entry point of the web application, e.g. for gunicorn:
+    gunicorn --workers 4 --bind 127.0.0.1:5000 website.wsgi:app
+"""
+from website.app import create_app
+
+app = create_app()